@@ -0,0 +1,158 @@
+import shlex
+import time
+import uuid
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from ntu_daq_gui.executor import STDOUT, STDERR
+
+
+class CommandResult(NamedTuple):
+    command: str
+    # None if the command was not run because an earlier one failed
+    exit_status: Optional[int]
+    duration: Optional[float]
+    stdout: str
+    stderr: str
+
+
+# busybox date does not know %N, parse_time falls back to whole seconds then
+REMOTE_TIME = '$(date +%s.%N)'
+
+
+def build_script(commands: List[str], token: str,
+                 stop_on_failure: bool) -> str:
+    """
+    Build a shell script that runs every command in a subshell between
+    marker lines on stdout and stderr. The end marker carries the exit
+    status and the start and end time of the command.
+    """
+    lines = []
+    for i, command in enumerate(commands):
+        lines.append(f"printf '%s BEGIN {i}\\n' {token}")
+        lines.append(f"printf '%s BEGIN {i}\\n' {token} >&2")
+        lines.append(f"__start={REMOTE_TIME}")
+        lines.append("(")
+        lines.append(command)
+        lines.append(")")
+        lines.append("__rc=$?")
+        lines.append(f"printf '\\n%s END {i} %s %s %s\\n' {token} "
+                     f"$__rc $__start {REMOTE_TIME}")
+        if stop_on_failure:
+            lines.append('[ "$__rc" -eq 0 ] || exit "$__rc"')
+    return "\n".join(lines) + "\n"
+
+
+def parse_time(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return float(value.split('.')[0])
+    except ValueError:
+        return None
+
+
+def parse_output(commands: List[str], token: str,
+                 output: List[Tuple[str, str]]) -> List[CommandResult]:
+    """
+    Split the output of a batch script into the sections of the commands
+    """
+    sections: Dict[str, Dict[int, List[str]]] = {STDOUT: {}, STDERR: {}}
+    current = {STDOUT: None, STDERR: None}
+    ends = {}
+    for stream, line in output:
+        marker = line.find(token)
+        if marker < 0:
+            if current[stream] is not None:
+                sections[stream][current[stream]].append(line)
+            continue
+        # output without a trailing newline ends up in front of the marker
+        if marker > 0 and current[stream] is not None:
+            sections[stream][current[stream]].append(line[:marker])
+        fields = line[marker + len(token):].split()
+        if fields[0] == "BEGIN":
+            current[stream] = int(fields[1])
+            sections[stream][current[stream]] = []
+        elif fields[0] == "END":
+            idx = int(fields[1])
+            ends[idx] = (int(fields[2]), parse_time(fields[3]),
+                         parse_time(fields[4]))
+            current[stream] = None
+    results = []
+    for i, command in enumerate(commands):
+        stdout = "".join(sections[STDOUT].get(i, []))
+        stderr = "".join(sections[STDERR].get(i, []))
+        if i in ends:
+            exit_status, start, end = ends[i]
+            duration = end - start if start is not None and end is not None \
+                else None
+            # the end marker starts with a newline of its own
+            if stdout.endswith('\n'):
+                stdout = stdout[:-1]
+            results.append(CommandResult(command, exit_status, duration,
+                                         stdout, stderr))
+        else:
+            results.append(CommandResult(command, None, None, stdout, stderr))
+    return results
+
+
+class MarkerFilter:
+    """
+    Passes the output of a batch script on to a RunLogWriter without the
+    marker lines, so the log only has the output of the commands
+    """
+
+    def __init__(self, log_writer, token: str):
+        self.log_writer = log_writer
+        self.token = token
+        # a blank line on stdout may be the start of an end marker, it is
+        # only passed on once the next line shows that it is not
+        self.blank: Optional[float] = None
+
+    def write(self, stream: str, text: str, timestamp: Optional[float] = None):
+        marker = text.find(self.token)
+        if stream == STDOUT:
+            blank, self.blank = self.blank, None
+            is_end = marker >= 0 and \
+                text[marker + len(self.token):].split()[:1] == ["END"]
+            if blank is not None and not (is_end and marker == 0):
+                self.log_writer.write(stream, "\n", blank)
+            if text == "\n":
+                self.blank = timestamp if timestamp is not None \
+                    else time.time()
+                return
+        if marker < 0:
+            self.log_writer.write(stream, text, timestamp)
+        elif marker > 0:
+            # output without a trailing newline ends up in front of it
+            self.log_writer.write(stream, text[:marker], timestamp)
+
+    def flush(self):
+        if self.blank is not None:
+            self.log_writer.write(STDOUT, "\n", self.blank)
+            self.blank = None
+
+
+def run_batch(hexactrl, commands: List[str], stop_on_failure: bool = False,
+              timeout: Optional[float] = None,
+              log_writer=None) -> List[CommandResult]:
+    """
+    Run all commands on the Hexacontroller as one script in a single channel
+    and return the exit status, duration and output of every command
+    """
+    if len(commands) == 0:
+        return []
+    token = f"__hexactrl_batch_{uuid.uuid4().hex}__"
+    script = build_script(commands, token, stop_on_failure)
+    marker_filter = None
+    if log_writer is not None:
+        marker_filter = MarkerFilter(log_writer, token)
+    reader = hexactrl.ssh_execute_command(
+        f"sh -c {shlex.quote(script)}", log_writer=marker_filter)
+    output = reader.wait(timeout)
+    if not reader.is_done():
+        reader.close()
+    if marker_filter is not None:
+        marker_filter.flush()
+    return parse_output(commands, token, output)
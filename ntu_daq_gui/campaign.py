@@ -0,0 +1,229 @@
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+
+from ntu_daq_gui import config
+from ntu_daq_gui import headless
+from ntu_daq_gui import hexacontroller as hx
+from ntu_daq_gui import procedure as prc
+from ntu_daq_gui import scheduler as sched
+
+SKIPPED = "skipped"
+
+
+def file_hash(path: str) -> Optional[str]:
+    """
+    sha256 of the file or None if it can not be read
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def step_inputs(procedure: prc.Procedure,
+                hexactrl: hx.Hexacontroller) -> Dict:
+    """
+    Everything that decides what a step does, if any of it changes the
+    step has to be run again
+    """
+    return {
+        "command": procedure.gen_run_command(hexactrl.hostname,
+                                             hexactrl.port),
+        "executed_file": file_hash(procedure.executed_file),
+        "initial_dut_config": file_hash(procedure.initial_dut_config),
+    }
+
+
+class Journal:
+    """
+    Append only record of the steps of the campaigns of a module
+
+    Every record is a line of JSON that is flushed to disk before the next
+    step starts, so after a crash at most the step that was running is
+    missing. A line that was cut off by the crash is ignored. A step is
+    recorded when it starts and when it is done.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def append(self, record: Dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def load(self) -> List[Dict]:
+        records = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        except FileNotFoundError:
+            pass
+        return records
+
+    def latest_steps(self) -> Dict[int, Dict]:
+        """
+        The latest record of every step since the campaign was last started
+        from the beginning. Once a step is started again, the records of
+        the steps after it no longer hold, as they built on the state the
+        step left behind before, so they are dropped, even if it never
+        finished.
+        """
+        steps: Dict[int, Dict] = {}
+        for record in self.load():
+            if record.get("event") == "start" and not record.get("resume"):
+                steps = {}
+            elif record.get("event") == "step_started":
+                steps = {step: r for step, r in steps.items()
+                         if step < record["step"]}
+            elif record.get("event") == "step":
+                steps[record["step"]] = record
+        return steps
+
+
+class Campaign:
+    """
+    The QA of a module: a sequence of procedures run one after the other on
+    a single Hexacontroller
+
+    The outcome of every step is recorded in the journal. When a campaign
+    is resumed, the leading steps that succeeded with the same inputs
+    (command line and the contents of the executed file and the initial
+    DUT configuration) are skipped and the campaign continues from the
+    first step that has to be run. The steps after it are always run
+    again, as they build on the state it leaves behind.
+    """
+
+    def __init__(self, module_id: str, procedures: List[prc.Procedure],
+                 hexactrl: hx.Hexacontroller, scheduler: sched.RunScheduler,
+                 journal: Journal):
+        self.module_id = module_id
+        self.procedures = procedures
+        self.hexactrl = hexactrl
+        self.scheduler = scheduler
+        self.journal = journal
+
+    @staticmethod
+    def journal_path(run_directory: str, module_id: str) -> str:
+        name = re.sub(r'[^A-Za-z0-9.-]+', '-', module_id)
+        return os.path.join(run_directory, "campaigns", f"{name}.jsonl")
+
+    def plan(self, resume: bool) -> List[Optional[Dict]]:
+        """
+        Return for every step the journal record it can be skipped with,
+        None if it has to be run
+        """
+        previous = self.journal.latest_steps() if resume else {}
+        plan: List[Optional[Dict]] = []
+        skipping = True
+        for step, procedure in enumerate(self.procedures):
+            record = previous.get(step)
+            skipping = (skipping and record is not None
+                        and record["procedure"] == procedure.name
+                        and record["state"] == sched.Job.SUCCEEDED
+                        and record["inputs"] == step_inputs(procedure,
+                                                            self.hexactrl))
+            plan.append(record if skipping else None)
+        return plan
+
+    def run(self, resume: bool = False, echo: bool = True) -> List[Dict]:
+        """
+        Run the campaign until a step fails and return the outcome of every
+        step
+        """
+        plan = self.plan(resume)
+        self.journal.append({
+            "event": "start", "time": time.time(), "resume": resume,
+            "module_id": self.module_id, "hexacontroller": self.hexactrl.name,
+            "procedures": [p.name for p in self.procedures]})
+        outcome = []
+        failed = False
+        for step, (procedure, done) in enumerate(zip(self.procedures, plan)):
+            if failed:
+                outcome.append({"step": step, "procedure": procedure.name,
+                                "state": sched.Job.CANCELLED})
+                continue
+            if done is not None:
+                print(f"## step {step} {procedure.name} skipped, it "
+                      f"succeeded in {done['run_dir']}", file=sys.stderr)
+                outcome.append(dict(done, state=SKIPPED,
+                                    previous_state=done["state"]))
+                continue
+            inputs = step_inputs(procedure, self.hexactrl)
+            self.journal.append({
+                "event": "step_started", "time": time.time(), "step": step,
+                "procedure": procedure.name, "inputs": inputs})
+            job = self.scheduler.submit(procedure, self.hexactrl,
+                                         self.module_id)
+            headless.run_jobs(self.scheduler, echo)
+            record = {
+                "event": "step", "time": time.time(), "step": step,
+                "procedure": procedure.name, "inputs": inputs,
+                "state": job.state, "returncode": job.returncode,
+                "error": job.error, "run_dir": job.run_dir,
+                "log_path": job.log_path,
+            }
+            self.journal.append(record)
+            outcome.append(record)
+            failed = job.state != sched.Job.SUCCEEDED
+        return outcome
+
+
+def run_campaign(config_params: Dict, module_id: str,
+                 procedure_names: List[str], hexactrl_names: List[str],
+                 resume: bool = False, summary_path: Optional[str] = None,
+                 echo: bool = True) -> int:
+    """
+    Run the procedures as the campaign of a module and return the exit code
+    like `headless.run_headless`
+    """
+    procedures = [prc.Procedure.load_from_config(p)
+                  for p in config_params.get("procedures", [])]
+    hexactrls = [hx.Hexacontroller.load_from_config(h)
+                 for h in config_params.get("hexacontrollers", [])]
+    try:
+        procedures = headless.select_by_name(procedures, procedure_names,
+                                             "procedures")
+        hexactrls = headless.select_by_name(hexactrls, hexactrl_names,
+                                            "hexacontrollers")
+    except headless.SelectionError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if len(hexactrls) != 1:
+        print("A campaign runs on exactly one Hexacontroller, select it "
+              "with --hexacontroller", file=sys.stderr)
+        return 2
+
+    run_directory = config.get_run_directory(config_params)
+    scheduler = sched.RunScheduler.load_from_config(
+        config_params.get("scheduler", {}), run_directory)
+    journal = Journal(Campaign.journal_path(run_directory, module_id))
+    campaign = Campaign(module_id, procedures, hexactrls[0], scheduler,
+                        journal)
+    steps = campaign.run(resume, echo)
+    scheduler.close()
+
+    ok = all(s["state"] in (sched.Job.SUCCEEDED, SKIPPED) for s in steps)
+    summary = dict(headless.summarize(scheduler), ok=ok,
+                   module_id=module_id, journal=journal.path, steps=steps)
+    if summary_path is None or summary_path == "-":
+        print(json.dumps(summary, indent=2))
+    else:
+        with open(summary_path, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0 if ok else 1
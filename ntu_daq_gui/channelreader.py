@@ -0,0 +1,152 @@
+import codecs
+import queue
+import select
+import threading
+import time
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+from ntu_daq_gui import runlog
+from ntu_daq_gui.executor import STDOUT, STDERR
+
+if TYPE_CHECKING:
+    import paramiko
+
+# marker in the output queue that is followed by the exit status
+EXIT = "exit"
+
+
+class ChannelReader:
+    """
+    Reads the output of a command running in an SSH channel in the background
+
+    A thread waits on the channel with select, reads stdout and stderr in
+    large chunks and decodes them with incremental decoders, so multibyte
+    characters that are split across chunks are decoded correctly. The
+    output is split into lines and handed out the same way as the output of
+    an Executor, followed by the exit status of the command.
+    """
+
+    def __init__(self, channel: "paramiko.Channel", chunk_size: int = 65536,
+                 max_queued_lines: int = 10000,
+                 log_writer: Optional[runlog.RunLogWriter] = None):
+        self.channel = channel
+        self.chunk_size = chunk_size
+        self.log_writer = log_writer
+        self.output_queue = queue.Queue(maxsize=max_queued_lines)
+        self.exit_status: Optional[int] = None
+        self.done = False
+        self.decoders = {
+            STDOUT: codecs.getincrementaldecoder('utf-8')(errors='replace'),
+            STDERR: codecs.getincrementaldecoder('utf-8')(errors='replace'),
+        }
+        self.partial_lines = {STDOUT: "", STDERR: ""}
+        self.reader = threading.Thread(target=self._read_loop, daemon=True)
+        self.reader.start()
+
+    def _feed(self, stream: str, data: bytes, final: bool = False):
+        text = self.partial_lines[stream] + \
+            self.decoders[stream].decode(data, final)
+        lines = text.split('\n')
+        # the last element is the start of a line that is not complete yet
+        self.partial_lines[stream] = lines.pop()
+        if final and self.partial_lines[stream]:
+            lines.append(self.partial_lines[stream])
+            self.partial_lines[stream] = ""
+        for line in lines:
+            line += '\n'
+            if self.log_writer is not None:
+                self.log_writer.write(stream, line)
+            self.output_queue.put((stream, line))
+
+    def _drain(self) -> bool:
+        """
+        Read everything that is available right now, return if anything was
+        """
+        received = False
+        while self.channel.recv_ready():
+            self._feed(STDOUT, self.channel.recv(self.chunk_size))
+            received = True
+        while self.channel.recv_stderr_ready():
+            self._feed(STDERR, self.channel.recv_stderr(self.chunk_size))
+            received = True
+        return received
+
+    def _read_loop(self):
+        # there is a channel, so paramiko has been imported already
+        import paramiko
+        exit_status = -1
+        try:
+            while True:
+                # the channel becomes readable when there is data on either
+                # stream or the remote side closed the channel
+                select.select([self.channel], [], [], 1.0)
+                if self._drain():
+                    continue
+                if self.channel.exit_status_ready() and \
+                        (self.channel.eof_received or self.channel.closed):
+                    self._drain()
+                    exit_status = self.channel.recv_exit_status()
+                    break
+                if self.channel.closed:
+                    break
+        except (paramiko.SSHException, OSError) as e:
+            self.output_queue.put((STDERR, f"Connection lost: {e}\n"))
+        finally:
+            self._feed(STDOUT, b"", final=True)
+            self._feed(STDERR, b"", final=True)
+            self.output_queue.put((EXIT, exit_status))
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.exit_status
+
+    def is_done(self) -> bool:
+        """
+        The command is done once it exited and all of its output has been
+        taken out of the queue
+        """
+        return self.done
+
+    def get_output(self, max_lines: int = 1000) -> List[Tuple[str, str]]:
+        """
+        Return up to `max_lines` (stream, line) tuples without blocking
+        """
+        lines = []
+        while len(lines) < max_lines:
+            try:
+                stream, line = self.output_queue.get_nowait()
+            except queue.Empty:
+                break
+            if stream == EXIT:
+                self.exit_status = line
+                self.done = True
+            else:
+                lines.append((stream, line))
+        return lines
+
+    def wait(self, timeout: Optional[float] = None) -> List[Tuple[str, str]]:
+        """
+        Block until the command is done, or at most `timeout` seconds, and
+        return the output that was collected in the meantime
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        lines = []
+        while not self.done:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+            try:
+                stream, line = self.output_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if stream == EXIT:
+                self.exit_status = line
+                self.done = True
+            else:
+                lines.append((stream, line))
+        return lines
+
+    def close(self):
+        self.channel.close()
@@ -1,7 +1,8 @@
-import json
 import os
 import shutil
 
+from ntu_daq_gui.configstore import ConfigError, ConfigStore
+
 config_file = ""
 
 def get_config_path():
@@ -11,11 +12,26 @@ def get_config_path():
     else:
         config_dir = os.path.join(os.path.expanduser('~'), '.config')
     if not os.path.exists(config_dir):
-        print("Directory \"~/.config\" not found. Unable to retrieve config")
-        exit(-1)
+        raise ConfigError(f"Directory \"{config_dir}\" not found. Unable to "
+                          "retrieve config")
     return os.path.join(config_dir, 'mac-daq-config.json')
 
 
+def get_run_directory(config):
+    """
+    Return the directory the output of the runs is stored in, which may be
+    set with the 'run_directory' entry of the configuration
+    """
+    run_dir = config.get('run_directory')
+    if not run_dir:
+        xdg_data_home = os.environ.get('XDG_DATA_HOME')
+        if not xdg_data_home:
+            xdg_data_home = os.path.join(
+                os.path.expanduser('~'), '.local', 'share')
+        run_dir = os.path.join(xdg_data_home, 'hgcal-mac-module-qa', 'runs')
+    return os.path.expanduser(run_dir)
+
+
 def create_default_config():
     template_path = os.path.join(os.path.dirname(__file__), 'config_template.json')
     config_path = get_config_path()
@@ -24,14 +40,11 @@ def create_default_config():
 
 
 def load_config(path):
-    with open(path, 'r') as cfile:
-        try:
-            config = json.load(cfile)
-            return config
-        except json.JSONDecodeError:
-            print("Unable to decode JSON, there is something wrong with "
-                  "the configuration file format")
-            exit(-1)
+    """
+    Load and validate the configuration, raises a ConfigError if it can not
+    be used
+    """
+    return ConfigStore(path).load()
 
 
 def get_config():
@@ -0,0 +1,271 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ntu_daq_gui import extract
+
+
+class ConfigError(Exception):
+    def __init__(self, message="The configuration is invalid"):
+        super().__init__(message)
+
+
+def check_type(problems: List[str], where: str, value: Any, types,
+               name: str):
+    if not isinstance(value, types) or isinstance(value, bool):
+        problems.append(f"{where}: expected {name}, got {value!r}")
+        return False
+    return True
+
+
+def check_port(problems: List[str], where: str, value: Any):
+    try:
+        port = int(value)
+    except (TypeError, ValueError):
+        port = -1
+    if not 0 < port < 65536:
+        problems.append(f"{where}: {value!r} is not a port number")
+
+
+def check_names(problems: List[str], where: str, entries: List[Dict],
+                default_key: Optional[str] = None):
+    seen = set()
+    for i, entry in enumerate(entries):
+        if not isinstance(entry, dict):
+            continue
+        name = entry.get("name") or entry.get(default_key or "name")
+        if name in seen:
+            problems.append(f"{where}[{i}]: the name {name!r} is used twice")
+        seen.add(name)
+
+
+def check_procedure(problems: List[str], where: str, procedure: Any):
+    if not check_type(problems, where, procedure, dict, "an object"):
+        return
+    if not procedure.get("name"):
+        problems.append(f"{where}: the name is missing")
+    for key in ("name", "executed_file", "initial_dut_config"):
+        if key in procedure:
+            check_type(problems, f"{where}.{key}", procedure[key], str,
+                       "a string")
+    options = procedure.get("options", {})
+    if check_type(problems, f"{where}.options", options, dict, "an object"):
+        for name, option in options.items():
+            if not isinstance(option, (list, tuple)) or len(option) != 2:
+                problems.append(f"{where}.options.{name}: expected "
+                                f"[flag, value], got {option!r}")
+    rules = procedure.get("extract", [])
+    if check_type(problems, f"{where}.extract", rules, list, "a list"):
+        try:
+            extract.Extractor.load_from_config(rules)
+        except (extract.RuleError, TypeError, AttributeError) as e:
+            problems.append(f"{where}.extract: {e}")
+
+
+def check_hexacontroller(problems: List[str], where: str, hexactrl: Any):
+    if not check_type(problems, where, hexactrl, dict, "an object"):
+        return
+    if not hexactrl.get("hostname"):
+        problems.append(f"{where}: the hostname is missing")
+    for key in ("name", "hostname", "username", "password",
+                "daq_server_start_cmd", "sc_server_start_cmd"):
+        if key in hexactrl:
+            check_type(problems, f"{where}.{key}", hexactrl[key], str,
+                       "a string")
+    for key in ("port", "daq_server_port", "sc_server_port"):
+        if key in hexactrl:
+            check_port(problems, f"{where}.{key}", hexactrl[key])
+    for key in ("init_commands", "shutdown_commands"):
+        commands = hexactrl.get(key, [])
+        if check_type(problems, f"{where}.{key}", commands, list, "a list"):
+            for i, command in enumerate(commands):
+                check_type(problems, f"{where}.{key}[{i}]", command, str,
+                           "a string")
+
+
+def validate_config(config: Any):
+    """
+    Check the structure of the whole configuration and raise a ConfigError
+    that lists all problems that were found
+    """
+    problems: List[str] = []
+    if not check_type(problems, "configuration", config, dict, "an object"):
+        raise ConfigError(problems[0])
+    procedures = config.get("procedures", [])
+    if check_type(problems, "procedures", procedures, list, "a list"):
+        for i, procedure in enumerate(procedures):
+            check_procedure(problems, f"procedures[{i}]", procedure)
+        check_names(problems, "procedures", procedures)
+    hexactrls = config.get("hexacontrollers", [])
+    if check_type(problems, "hexacontrollers", hexactrls, list, "a list"):
+        for i, hexactrl in enumerate(hexactrls):
+            check_hexacontroller(problems, f"hexacontrollers[{i}]", hexactrl)
+        check_names(problems, "hexacontrollers", hexactrls, "hostname")
+    for key in ("scheduler", "health", "transfer"):
+        if key in config:
+            check_type(problems, key, config[key], dict, "an object")
+    if "run_directory" in config:
+        check_type(problems, "run_directory", config["run_directory"], str,
+                   "a string")
+    if problems:
+        raise ConfigError("The configuration is invalid:\n  " +
+                          "\n  ".join(problems))
+
+
+def write_atomic(path: str, text: str):
+    """
+    Replace the file by one with the text, readers see either the old or
+    the new file but never a partial one
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".config-",
+                                    suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        # the file holds passwords, it keeps the permissions it had
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class ConfigStore:
+    """
+    The configuration file of the program
+
+    The configuration is validated when it is loaded and before it is
+    written, and it is written atomically, so a crash or an invalid edit
+    never leaves a broken file behind for the other stations that share
+    it. Edits are handed to `save_later`, which writes the latest of them
+    in a background thread once no further edit arrived for
+    `autosave_delay` seconds. `changed_on_disk` tells if somebody else
+    wrote the file since it was last loaded or saved.
+    """
+
+    def __init__(self, path: str, data: Optional[Dict] = None,
+                 autosave_delay: float = 1.0):
+        self.path = path
+        self.autosave_delay = autosave_delay
+        self.data = data if data is not None else {}
+        self.stamp = self.file_stamp() if data is not None else None
+        self.error: Optional[str] = None
+        self.condition = threading.Condition()
+        self.pending: Optional[Dict] = None
+        self.last_edit = 0.0
+        self.writer: Optional[threading.Thread] = None
+        self.closed = False
+
+    def file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self) -> Dict:
+        """
+        Read and validate the configuration, raises a ConfigError if it
+        can not be read or is invalid
+        """
+        stamp = self.file_stamp()
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except OSError as e:
+            raise ConfigError(f"Unable to read the configuration file "
+                              f"{self.path}: {e}") from e
+        except json.JSONDecodeError as e:
+            raise ConfigError(f"Unable to decode the configuration file "
+                              f"{self.path}: {e}") from e
+        validate_config(data)
+        self.data = data
+        self.stamp = stamp
+        return data
+
+    def save(self, data: Dict):
+        """
+        Validate the configuration and write it right away
+        """
+        validate_config(data)
+        write_atomic(self.path, json.dumps(data, indent=2))
+        self.data = data
+        self.stamp = self.file_stamp()
+        self.error = None
+
+    def save_later(self, data: Dict):
+        """
+        Write the configuration in the background once the edits settled
+        """
+        with self.condition:
+            self.pending = data
+            self.last_edit = time.monotonic()
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._write_pending,
+                                               daemon=True)
+                self.writer.start()
+            self.condition.notify()
+
+    @property
+    def dirty(self) -> bool:
+        return self.pending is not None
+
+    def changed_on_disk(self) -> bool:
+        stamp = self.file_stamp()
+        return stamp is not None and stamp != self.stamp
+
+    def _write_pending(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                # wait until no edit arrived for the autosave delay
+                remaining = self.last_edit + self.autosave_delay - \
+                    time.monotonic()
+                if remaining > 0 and not self.closed:
+                    self.condition.wait(remaining)
+                    continue
+                data = self.pending
+            try:
+                self.save(data)
+            except (ConfigError, OSError) as e:
+                self.error = str(e)
+                print(f"The configuration was not saved: {e}")
+            with self.condition:
+                if self.pending is data:
+                    self.pending = None
+                self.condition.notify_all()
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Write a pending edit now and wait until it is written
+        """
+        with self.condition:
+            self.last_edit = 0.0
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: self.pending is None, timeout)
+
+    def close(self):
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
@@ -0,0 +1,142 @@
+import tkinter as tk
+from collections import deque
+from tkinter import ttk
+from typing import Deque, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from ntu_daq_gui import executor as ex
+from ntu_daq_gui import scheduler as sched
+
+if TYPE_CHECKING:
+    from ntu_daq_gui.gui import AppState
+
+
+class BoardPane(ttk.Frame):
+    """
+    Compact view of what happens on one Hexacontroller: the state and
+    phase of its current job, the progress, the number of error lines, the
+    resources the procedure uses and the last lines of output
+    """
+
+    state_colors = {sched.Job.QUEUED: "khaki", sched.Job.RUNNING: "lightblue",
+                    sched.Job.SUCCEEDED: "palegreen",
+                    sched.Job.FAILED: "salmon",
+                    sched.Job.CANCELLED: "lightgray"}
+
+    def __init__(self, parent, name: str, lines: int = 8, *args, **kwargs):
+        super().__init__(parent, borderwidth=2, relief="groove",
+                         *args, **kwargs)
+        self.job: Optional[sched.Job] = None
+        self.lines: Deque[Tuple[str, str]] = deque(maxlen=lines)
+        self.errors = 0
+        self.dirty = False
+
+        ttk.Label(self, text=name, font=("TkDefaultFont", 10, "bold")).grid(
+            row=0, column=0, sticky='w')
+        self.state_label = tk.Label(self, text="idle", width=10)
+        self.state_label.grid(row=0, column=1, sticky='e')
+        self.step_label = ttk.Label(self, text="")
+        self.step_label.grid(row=1, column=0, sticky='w')
+        self.error_label = ttk.Label(self, text="")
+        self.error_label.grid(row=1, column=1, sticky='e')
+        self.resource_label = ttk.Label(self, text="")
+        self.resource_label.grid(row=2, column=0, columnspan=2, sticky='w')
+        self.progress_bar = ttk.Progressbar(self, maximum=100)
+        self.progress_bar.grid(row=3, column=0, columnspan=2, sticky='ew')
+        self.text = tk.Text(self, height=lines, width=60, wrap='none',
+                            font=("TkFixedFont", 8))
+        self.text.tag_configure(ex.STDERR, foreground="red")
+        self.text.grid(row=4, column=0, columnspan=2, sticky='nsew')
+        self.text.configure(state=tk.DISABLED)
+        self.columnconfigure(0, weight=1)
+
+    def add(self, job: sched.Job, kind: str, data):
+        if job is not self.job and kind == sched.STATE and \
+                job.state == sched.Job.RUNNING:
+            # a new job on the board starts with a fresh pane
+            self.job = job
+            self.lines.clear()
+            self.errors = 0
+        elif self.job is None:
+            self.job = job
+        if job is not self.job:
+            return
+        if kind in (ex.STDOUT, ex.STDERR):
+            self.lines.append((data.rstrip("\n"), kind))
+            if kind == ex.STDERR:
+                self.errors += 1
+        self.dirty = True
+
+    def redraw(self):
+        """
+        Show the current state of the job, only called once per tick of
+        the event pump and only if something changed
+        """
+        self.dirty = False
+        job = self.job
+        if job is None:
+            return
+        self.state_label.configure(text=job.state,
+                                   bg=self.state_colors.get(job.state))
+        step = job.procedure.name
+        if job.metrics.current is not None:
+            step += f" ({job.metrics.current})"
+        self.step_label.configure(text=step)
+        errors = self.errors + job.warning_count
+        self.error_label.configure(text=f"{errors} errors" if errors else "")
+        self.progress_bar['value'] = 100 * (job.progress or 0)
+        sample = job.last_sample
+        self.resource_label.configure(
+            text="" if sample is None else
+            f"CPU {100 * sample.cpu:.0f} %, RSS {sample.rss / 1e6:.0f} MB, "
+            f"{sample.processes} processes")
+        self.text.configure(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        for i, (line, stream) in enumerate(self.lines):
+            self.text.insert(tk.END, line if i == 0 else "\n" + line,
+                             (stream,))
+        self.text.configure(state=tk.DISABLED)
+
+
+class DashboardUI(ttk.Frame):
+    """
+    One pane per Hexacontroller to watch many boards run at once
+
+    The panes take their events from the shared event pump of the GUI and
+    are only redrawn once per tick, however many lines arrived.
+    """
+
+    columns = 4
+    lines_per_pane = 8
+
+    def __init__(self, parent: ttk.Widget, state: "AppState", *args,
+                 **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.app_state = state
+        self.panes: Dict[str, BoardPane] = {}
+        for hexactrl in self.app_state.hexactrls:
+            self.pane(hexactrl.hostname, hexactrl.name)
+        # the tab is only built when it is first shown, the jobs that ran
+        # before show their state without their output
+        for job in self.app_state.scheduler.jobs:
+            if job.state != sched.Job.QUEUED:
+                self.pane(job.board, job.hexactrl.name).add(
+                    job, sched.STATE, job.state)
+        for pane in self.panes.values():
+            pane.redraw()
+        self.app_state.pump.subscribe(self.handle_events)
+
+    def pane(self, board: str, name: str) -> BoardPane:
+        pane = self.panes.get(board)
+        if pane is None:
+            pane = self.panes[board] = BoardPane(self, name,
+                                                 self.lines_per_pane)
+            row, column = divmod(len(self.panes) - 1, self.columns)
+            pane.grid(row=row, column=column, padx=3, pady=3, sticky='nsew')
+        return pane
+
+    def handle_events(self, events: List[sched.JobEvent]):
+        for job, kind, data in events:
+            self.pane(job.board, job.hexactrl.name).add(job, kind, data)
+        for pane in self.panes.values():
+            if pane.dirty:
+                pane.redraw()
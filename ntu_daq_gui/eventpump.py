@@ -0,0 +1,67 @@
+import time
+from typing import Callable, List
+
+from ntu_daq_gui import scheduler as sched
+
+
+class EventPump:
+    """
+    Moves the events of the scheduler to the views of the GUI
+
+    There is a single `after()` tick for the whole GUI, however many jobs
+    are running and however many views show them. Every tick drains the
+    scheduler for at most `budget` seconds and hands all events it got to
+    every subscriber at once, so the time the mainloop spends on the output
+    stays bounded when many boards stream at the same time. If the budget
+    ran out, the next tick follows right away, otherwise after `interval`
+    ms. The ticks stop while the scheduler is idle, `wake` restarts them.
+    """
+
+    def __init__(self, widget, scheduler: sched.RunScheduler,
+                 interval: int = 50, budget: float = 0.02,
+                 max_lines: int = 500):
+        self.widget = widget
+        self.scheduler = scheduler
+        self.interval = interval
+        self.budget = budget
+        self.max_lines = max_lines
+        self.subscribers: List[Callable[[List[sched.JobEvent]], None]] = []
+        self.pumping = False
+
+    def subscribe(self, callback: Callable[[List[sched.JobEvent]], None]):
+        self.subscribers.append(callback)
+
+    def wake(self):
+        if not self.pumping:
+            self.pumping = True
+            self.widget.after(self.interval, self.tick)
+
+    def drain(self) -> bool:
+        """
+        Collect the events of the scheduler until there are no more or the
+        budget is used up, returns whether output was left behind
+        """
+        deadline = time.perf_counter() + self.budget
+        events: List[sched.JobEvent] = []
+        exhausted = False
+        while True:
+            batch = self.scheduler.poll(self.max_lines)
+            events.extend(batch)
+            if len(batch) == 0:
+                break
+            if time.perf_counter() > deadline:
+                exhausted = True
+                break
+        if events:
+            for callback in self.subscribers:
+                callback(events)
+        return exhausted
+
+    def tick(self):
+        exhausted = self.drain()
+        if exhausted:
+            self.widget.after(1, self.tick)
+        elif self.scheduler.idle():
+            self.pumping = False
+        else:
+            self.widget.after(self.interval, self.tick)
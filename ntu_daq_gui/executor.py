@@ -1,22 +1,61 @@
+import os
+import queue
+import signal
 import subprocess
 import sys
-from typing import List, Tuple
+import threading
+import time
+from typing import IO, List, Optional, Tuple
+
+from ntu_daq_gui import runlog
+
+STDOUT = "stdout"
+STDERR = "stderr"
 
 
 class Executor:
     """
     Class that represents a running procedure
+
+    The output of the procedure is read line by line by one background
+    thread per stream. The lines are handed to the caller through a bounded
+    queue, so reading the output never blocks the caller. If the caller
+    falls behind, the readers block and the pipe applies backpressure to
+    the procedure instead of growing memory. If a log writer is given, the
+    readers also hand every line to it, so that the output is stored
+    without involving the caller.
+
+    The procedure runs in a session of its own, so `terminate` and `kill`
+    reach the processes it started as well.
     """
 
-    def __init__(self, arguments: List[str]):
+    def __init__(self, arguments: List[str], max_queued_lines: int = 10000,
+                 log_writer: Optional[runlog.RunLogWriter] = None,
+                 launcher: Optional[List[str]] = None):
         self.run_command = arguments
+        self.log_writer = log_writer
         python = self.find_python3_interpreter()
         if python is None:
             raise FileNotFoundError("No python3 interpreter could be found")
         self.run_command.insert(0, python)
+        # python buffers the output in blocks if it is not written to a
+        # terminal, which would delay the output until the buffer is full
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        # e.g. the wrapper that limits the resources, see
+        # supervisor.Supervisor.launcher
+        command = (launcher or []) + self.run_command
         self.process = subprocess.Popen(
-                self.run_command, stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE, text=True)
+                command, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, text=True, errors="replace",
+                env=env, start_new_session=True)
+        # monotonic time of the last line of output, for the idle timeout
+        self.last_output = time.monotonic()
+        self.output_queue = queue.Queue(maxsize=max_queued_lines)
+        self.open_streams = 2
+        self.readers = [
+            self._start_reader(self.process.stdout, STDOUT),
+            self._start_reader(self.process.stderr, STDERR),
+        ]
 
     def find_python3_interpreter(self):
         """
@@ -39,21 +78,90 @@ class Executor:
             print("Python 3 interpreter not found.")
             return None
 
-    def is_done(self) -> bool:
-        if self.process.poll() is not None:
-            return True
-        return False
+    def _start_reader(self, stream: IO[str], name: str) -> threading.Thread:
+        reader = threading.Thread(target=self._read_stream,
+                                  args=(stream, name), daemon=True)
+        reader.start()
+        return reader
 
-    def get_output_line(self) -> Tuple[str, str]:
-        if self.process.poll() is not None:
-            stderr = self.process.stderr.read()
-            if stderr is None:
-                stderr = ""
-            stdout = self.process.stdout.read()
-            if stdout is None:
-                stdout = ""
-            return (stdout, stderr)
-        else:
-            return self.process.communicate()
+    def _read_stream(self, stream: IO[str], name: str):
+        """
+        Push every line of the stream into the output queue, followed by a
+        `None` line once the stream is closed
+        """
+        try:
+            for line in iter(stream.readline, ""):
+                self.last_output = time.monotonic()
+                if self.log_writer is not None:
+                    self.log_writer.write(name, line)
+                self.output_queue.put((name, line))
+        finally:
+            stream.close()
+            self.output_queue.put((name, None))
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
 
+    def send_signal(self, sig: int):
+        """
+        Send the signal to the whole process group of the procedure
+        """
+        try:
+            os.killpg(self.process.pid, sig)
+        except ProcessLookupError:
+            pass
 
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        """
+        Block until the procedure exited, its output may still be queued
+        """
+        try:
+            return self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return None
+
+    @property
+    def returncode(self):
+        return self.process.poll()
+
+    def is_done(self) -> bool:
+        """
+        The procedure is done once it exited and all of its output has been
+        taken out of the queue
+        """
+        return self.process.poll() is not None and self.open_streams == 0
+
+    def get_output(self, max_lines: int = 1000) -> List[Tuple[str, str]]:
+        """
+        Return up to `max_lines` (stream, line) tuples without blocking
+        """
+        lines = []
+        while len(lines) < max_lines:
+            try:
+                stream, line = self.output_queue.get_nowait()
+            except queue.Empty:
+                break
+            if line is None:
+                self.open_streams -= 1
+            else:
+                lines.append((stream, line))
+        return lines
+
+    def get_output_line(self) -> Tuple[str, str]:
+        """
+        Return the stdout and stderr output that is available right now
+        """
+        stdout, stderr = [], []
+        for stream, line in self.get_output():
+            if stream == STDOUT:
+                stdout.append(line)
+            else:
+                stderr.append(line)
+        return ("".join(stdout), "".join(stderr))
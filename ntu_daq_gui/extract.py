@@ -0,0 +1,218 @@
+import re
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# kinds of the rules and of the events they produce
+PROGRESS = "progress"
+VALUE = "value"
+WARNING = "warning"
+
+VALUE_TYPES = {"float": float, "int": int, "str": str}
+
+
+class RuleError(Exception):
+    def __init__(self, message="An extraction rule of the procedure is invalid"):
+        super().__init__(message)
+
+
+class MetricEvent(NamedTuple):
+    rule: str
+    kind: str  # one of PROGRESS, VALUE or WARNING
+    # the fraction done for PROGRESS, the converted value for VALUE and the
+    # message for WARNING
+    value: Any
+    line: str
+    # the x coordinate of a value if the rule has an `x` group
+    x: Optional[float] = None
+
+
+class Rule(NamedTuple):
+    name: str
+    kind: str
+    pattern: str
+    value_type: str = "str"
+
+    @classmethod
+    def load_from_config(cls, config: Dict):
+        """
+        given an entry of the 'extract' list of a procedure create a rule
+        """
+        try:
+            rule = cls(config["name"], config.get("kind", VALUE),
+                       config["pattern"], config.get("type", "str"))
+        except KeyError as e:
+            raise RuleError(f"Extraction rule {config} lacks {e}") from e
+        if rule.kind not in (PROGRESS, VALUE, WARNING):
+            raise RuleError(f"Extraction rule {rule.name} has the unknown "
+                            f"kind {rule.kind}")
+        if rule.value_type not in VALUE_TYPES:
+            raise RuleError(f"Extraction rule {rule.name} has the unknown "
+                            f"type {rule.value_type}")
+        return rule
+
+
+# escapes that match a class of characters or a position, they take no
+# argument and only end the literal text
+CLASS_ESCAPES = set("dDwWsSbBAZ")
+
+QUANTIFIER = re.compile(r"\{\d*(,\d*)?\}")
+
+# a back reference or a condition by group number, the numbers change once
+# the patterns are combined
+NUMBERED_GROUP = re.compile(r"(?<!\\)(?:\\\\)*(?:\\[1-9]|\(\?\(\d)")
+
+
+def required_literal(pattern: str) -> Optional[str]:
+    """
+    The longest text outside of groups and character classes that every
+    match of the pattern has to contain. Empty if there is none and None
+    if it can not be told without fully parsing the pattern.
+    """
+    flags = re.match(r"\(\?([aiLmsux]+)\)", pattern)
+    if flags and set(flags.group(1)) & set("ix"):
+        # the text would not be matched literally
+        return None
+    runs = [[]]
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        literal = None
+        if char == "\\":
+            escaped = pattern[i + 1:i + 2]
+            if escaped.isalnum() and escaped not in CLASS_ESCAPES:
+                # \x41, \u0041, \N{...}, octal escapes, back references and
+                # the like stand for text that is not written out
+                return None
+            if escaped and not escaped.isalnum():
+                literal = escaped
+            i += 2
+        elif char == "[":
+            # skip the class, a ] right at its start is part of it
+            i += 2 if pattern[i + 1:i + 2] == "]" else 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+        elif char == "(":
+            depth += 1
+            i += 1
+        elif char == ")":
+            depth -= 1
+            i += 1
+        elif char == "|" and depth == 0:
+            # any of the alternatives may match
+            return ""
+        elif char == "{":
+            quantifier = QUANTIFIER.match(pattern, i)
+            if quantifier is None:
+                # a { that does not start a quantifier is matched literally
+                literal = char
+                i += 1
+            else:
+                # the numbers of a quantifier are not part of the text
+                i = quantifier.end()
+        else:
+            if char not in ".^$*+?}|":
+                literal = char
+            i += 1
+        quantified = i < len(pattern) and (
+            pattern[i] in "*?+" or QUANTIFIER.match(pattern, i) is not None)
+        if literal is not None and depth == 0 and not quantified:
+            runs[-1].append(literal)
+        elif literal is not None and depth == 0 and pattern[i] == "+":
+            # one repetition is still required
+            runs[-1].append(literal)
+            runs.append([])
+        elif runs[-1]:
+            runs.append([])
+    return max(("".join(run) for run in runs), key=len)
+
+
+class Extractor:
+    """
+    Turns the lines of output of a procedure into metric events
+
+    The patterns of all rules are compiled into a single regular expression,
+    so every line is scanned once, however many rules there are. That
+    finds the rule that matches first in the line; only if it does, the
+    rules before it are tried on their own, as the first rule that matches
+    a line wins. Lines are only looked at once, when they arrive. If every pattern requires some literal text, lines that contain
+    none of these texts are skipped without running the regular expression,
+    which is most of them.
+
+    The named groups a pattern may use depend on the kind of the rule:
+    `progress` rules need `current` and `total` or `percent`, `value` rules
+    take the `value` group (or the whole match) converted to `type` and an
+    optional `x` group as the coordinate to plot the value at, and
+    `warning` rules take the `message` group (or the whole line). Groups
+    are referred to by name, as their numbers change once the patterns are
+    combined.
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self.pattern: Optional[re.Pattern] = None
+        self.patterns: List[re.Pattern] = []
+        self.literals = [required_literal(rule.pattern) for rule in rules]
+        if not all(self.literals):
+            self.literals = []
+        alternatives = []
+        for i, rule in enumerate(rules):
+            try:
+                self.patterns.append(re.compile(rule.pattern))
+            except re.error as e:
+                raise RuleError(f"Extraction rule {rule.name} has an invalid "
+                                f"pattern: {e}") from e
+            if NUMBERED_GROUP.search(rule.pattern):
+                raise RuleError(f"Extraction rule {rule.name} refers to a "
+                                f"group by number, use a named group and "
+                                f"(?P=name) instead")
+            # flags at the start would apply to all rules of the combined
+            # pattern, they only apply to their own rule in a group
+            pattern = re.sub(r'^\(\?([aiLmsux]+)\)(.*)$', r'(?\1:\2)',
+                             rule.pattern, flags=re.DOTALL)
+            # the group names have to be unique in the combined pattern
+            pattern = re.sub(r'\(\?P<(\w+)>', rf'(?P<r{i}_\1>', pattern)
+            pattern = re.sub(r'\(\?P=(\w+)\)', rf'(?P=r{i}_\1)', pattern)
+            alternatives.append(f"(?P<r{i}>{pattern})")
+        if alternatives:
+            self.pattern = re.compile("|".join(alternatives))
+
+    @classmethod
+    def load_from_config(cls, config: List[Dict]):
+        return cls([Rule.load_from_config(rule) for rule in config])
+
+    def feed(self, line: str) -> Optional[MetricEvent]:
+        if self.pattern is None:
+            return None
+        if self.literals and not any(lit in line for lit in self.literals):
+            return None
+        match = self.pattern.search(line)
+        if match is None:
+            return None
+        # the rule that matches leftmost in the line, an earlier rule that
+        # matches further right takes precedence
+        first = next(i for i in range(len(self.rules))
+                     if match.group(f"r{i}") is not None)
+        for rule, pattern in zip(self.rules[:first + 1], self.patterns):
+            match = pattern.search(line)
+            if match is not None:
+                break
+        groups = {name: value for name, value in match.groupdict().items()
+                  if value is not None}
+        x = None
+        try:
+            if "x" in groups:
+                x = float(groups["x"])
+            if rule.kind == PROGRESS:
+                if "percent" in groups:
+                    value = float(groups["percent"]) / 100
+                else:
+                    value = float(groups["current"]) / float(groups["total"])
+            elif rule.kind == VALUE:
+                value = VALUE_TYPES[rule.value_type](
+                    groups.get("value", match.group()))
+            else:
+                value = groups.get("message", line.rstrip("\n"))
+        except (KeyError, ValueError, ZeroDivisionError):
+            return None
+        return MetricEvent(rule.name, rule.kind, value, line, x)
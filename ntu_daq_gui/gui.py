@@ -4,25 +4,23 @@ import json
 from copy import deepcopy
 from functools import partial
 
+from ntu_daq_gui import config
+from ntu_daq_gui import configstore
+from ntu_daq_gui import dashboard
+from ntu_daq_gui import eventpump
+from ntu_daq_gui import historyview
 from ntu_daq_gui import procedure as prc
 from ntu_daq_gui import hexacontroller as hx
 from ntu_daq_gui import runcontrol as rctrl
+from ntu_daq_gui import scheduler as sched
+from ntu_daq_gui import health
+from ntu_daq_gui import reconcile
 
 
 class AppState():
     def __init__(self, config_params, config_file_path):
         self.config_file_path = config_file_path
-        self.procedures = list(
-            map(lambda p: prc.Procedure(
-                p.get("name"),
-                p.get("executed_file", ""),
-                p.get("options", {}),
-                p.get("initial_dut_config", "")),
-                config_params.get("procedures", [])))
-        # self.runcontroller = rctrl.RunController()
-        self.hexactrls = list(
-                map(hx.Hexacontroller.load_from_config,
-                    config_params.get("hexacontrollers", [])))
+        self.load_entries(config_params)
 
         if len(self.procedures) > 0:
             self.running_procedure_config = deepcopy(self.procedures[0])
@@ -31,22 +29,67 @@ class AppState():
         if len(self.hexactrls) > 0:
             self.running_hexactrl_config = deepcopy(self.hexactrls[0])
         else:
-            self.running_procedure_config = None
+            self.running_hexactrl_config = None
+        # all the hexacontrollers the selected procedure is run on
+        self.running_hexactrl_configs = [self.running_hexactrl_config] \
+            if self.running_hexactrl_config is not None else []
+        self.scheduler = sched.RunScheduler.load_from_config(
+                config_params.get("scheduler", {}),
+                config.get_run_directory(config_params))
+        self.health = health.FleetHealthMonitor.load_from_config(
+                config_params.get("health", {}))
+        # set by the GUI, it feeds the events of the scheduler to the views
+        self.pump = None
+
+    def load_entries(self, config_params):
+        """
+        Take the procedures and Hexacontrollers from the configuration, the
+        other settings only take effect on a restart
+        """
+        self.config_params = config_params
+        self.procedures = list(
+            map(prc.Procedure.load_from_config,
+                config_params.get("procedures", [])))
+        # self.runcontroller = rctrl.RunController()
+        self.hexactrls = list(
+                map(hx.Hexacontroller.load_from_config,
+                    config_params.get("hexacontrollers", [])))
+
+    def config_snapshot(self):
+        """
+        The configuration with the current procedures and Hexacontrollers
+        """
+        proc_config = [p.serialize() for p in self.procedures]
+        hexa_config = [h.serialize() for h in self.hexactrls]
+        return dict(self.config_params,
+                    procedures=proc_config, hexacontrollers=hexa_config)
 
     def set_run_hexactrl(self, hexactrl: hx.Hexacontroller):
         self.running_hexactrl_config = deepcopy(hexactrl)
+        self.running_hexactrl_configs = [self.running_hexactrl_config]
 
     def set_run_procedure(self, procedure: prc.Procedure):
         self.running_procedure_config = deepcopy(procedure)
 
 
 class GUI(tk.Tk):
+    # interval in ms in which the configuration file is checked for changes
+    # made outside of the program
+    reload_interval = 2000
+
     def __init__(self, config_params, config_file_path):
         super().__init__()
         # Initialize the data structures
         self.title("MAC Module Tests")
         self.app_state = AppState(config_params, config_file_path)
         self.config_file_path = config_file_path
+        self.config_store = configstore.ConfigStore(
+            config_file_path, config_params,
+            config_params.get("autosave_delay", 1.0))
+
+        # the single update loop of all views of the running jobs
+        self.app_state.pump = eventpump.EventPump(
+            self, self.app_state.scheduler)
 
         # Create a notebook (tabs container)
         self.notebook = ttk.Notebook(self)
@@ -54,19 +97,27 @@ class GUI(tk.Tk):
 
         # Create the two tabs
         self.run_control_tab = rctrl.RunControlUI(self.notebook, self.app_state)
+        self.dashboard_tab = ttk.Frame(self.notebook)
+        self.history_tab = ttk.Frame(self.notebook)
         self.procedure_config_tab = ttk.Frame(self.notebook)
         self.hexactrl_config_tab = ttk.Frame(self.notebook)
         self.notebook.add(self.run_control_tab, text='Run Control')
+        self.notebook.add(self.dashboard_tab, text='Dashboard')
+        self.notebook.add(self.history_tab, text='History')
         self.notebook.add(self.procedure_config_tab,
                           text='Procedure Configuration')
         self.notebook.add(self.hexactrl_config_tab,
                           text='Hexacontroller Configuration')
 
-        # Procedure configuration tab setup
-        self.setup_procedure_widgets(self.procedure_config_tab)
-
-        # Hexacontroller configuration setup
-        self.setup_hexactrl_widgets(self.hexactrl_config_tab)
+        # The configuration tabs are only built the first time they are
+        # selected, which keeps them out of the startup time
+        self.tab_builders = {
+            str(self.dashboard_tab): self.setup_dashboard_widgets,
+            str(self.history_tab): self.setup_history_widgets,
+            str(self.procedure_config_tab): self.setup_procedure_widgets,
+            str(self.hexactrl_config_tab): self.setup_hexactrl_widgets,
+        }
+        self.notebook.bind("<<NotebookTabChanged>>", self.build_selected_tab)
 
         # Configure grid weights
         self.run_control_tab.columnconfigure(1, weight=1)
@@ -76,90 +127,170 @@ class GUI(tk.Tk):
                                   text="Close",
                                   command=self.close_window)
         close_button.grid()
+        self.config_status = ttk.Label(self, text="")
+        self.config_status.grid()
+
+        # every edit in the configuration tabs is saved once the edits
+        # settled and changes of the file by others are picked up
+        self.bind("<<ConfigChanged>>", self.schedule_autosave)
+        self.after(self.reload_interval, self.check_config_file)
+
+    def build_selected_tab(self, event=None):
+        tab = self.notebook.select()
+        builder = self.tab_builders.pop(tab, None)
+        if builder is not None:
+            builder(self.nametowidget(tab))
 
     def setup_run_control_widgets(self, frame):
         ...
 
+    def setup_dashboard_widgets(self, frame):
+        self.dashboard = dashboard.DashboardUI(frame, self.app_state)
+        self.dashboard.pack(fill='both', expand=True)
+
+    def setup_history_widgets(self, frame):
+        self.history = historyview.HistoryUI(frame, self.app_state)
+        self.history.pack(fill='both', expand=True)
+
     def setup_procedure_widgets(self, frame):
-        for child in frame.winfo_children():
-            child.destroy()
-        frame.grid_forget()
-        for i, _ in enumerate(self.app_state.procedures):
-            self.draw_procedure(frame, i)
+        # the procedures are kept in a frame of their own above the buttons,
+        # the rows are keyed by the identity of the procedure object
+        self.procedure_list_frame = ttk.Frame(frame)
+        self.procedure_list_frame.grid(row=0)
+        self.procedure_rows = reconcile.RowReconciler(
+            self.procedure_list_frame, self.draw_procedure)
         add_button = ttk.Button(frame,
                                 text="Add Procedure",
                                 command=lambda: self.add_procedure(frame))
-        add_button.grid()
+        add_button.grid(row=1)
         save_button = ttk.Button(frame,
                                  text="Save",
                                  command=self.save)
-        save_button.grid()
+        save_button.grid(row=2)
+        self.refresh_procedure_widgets()
+
+    def refresh_procedure_widgets(self):
+        self.procedure_rows.reconcile(
+            (id(p), p) for p in self.app_state.procedures)
 
     def setup_hexactrl_widgets(self, frame):
-        for child in frame.winfo_children():
-            child.destroy()
-        frame.grid_forget()
-        for i, hexctrl in enumerate(self.app_state.hexactrls):
-            hxui = hx.HexactrlConfigUI(
-                self.app_state.hexactrls[i], frame, relief="groove")
-            hxui.grid(padx=5, pady=5)
-            rmv_hex_btn = ttk.Button(hxui, text="Remove Hexacontroller",
-                                     command=lambda: self.remove_hexacontroller(hexctrl.name, frame))
-            rmv_hex_btn.grid()
+        self.hexactrl_list_frame = ttk.Frame(frame)
+        self.hexactrl_list_frame.grid(row=0)
+        self.hexactrl_rows = reconcile.RowReconciler(
+            self.hexactrl_list_frame, self.draw_hexactrl)
         add_button = ttk.Button(frame, text="Add Hexacontroller Config",
                                 command=lambda: self.add_hexacontroller(frame))
-        add_button.grid()
+        add_button.grid(row=1)
         save_button = ttk.Button(frame,
                                  text="Save",
                                  command=self.save)
-        save_button.grid()
+        save_button.grid(row=2)
+        self.refresh_hexactrl_widgets()
+
+    def refresh_hexactrl_widgets(self):
+        self.hexactrl_rows.reconcile(
+            (id(h), h) for h in self.app_state.hexactrls)
 
-    def draw_procedure(self, frame, i):
+    def draw_procedure(self, frame, key, procedure, row):
         proc_frame = ttk.Frame(frame, borderwidth=2, relief="groove")
-        proc_frame.grid(padx=5, pady=5)
-        prc.ProcedureConfigUI(proc_frame, self.app_state.procedures[i])
+        proc_frame.grid(row=row, padx=5, pady=5)
+        prc.ProcedureConfigUI(proc_frame, procedure)
         ttk.Button(proc_frame, text="Remove Procedure",
-                   command=lambda: self.remove_procedure(self.app_state.procedures[i].name, proc_frame)
+                   command=lambda: self.remove_procedure(procedure)
                    ).grid(column=2, pady=3, padx=3)
+        return [proc_frame]
+
+    def draw_hexactrl(self, frame, key, hexactrl, row):
+        hxui = hx.HexactrlConfigUI(hexactrl, frame, relief="groove")
+        hxui.grid(row=row, padx=5, pady=5)
+        rmv_hex_btn = ttk.Button(
+            hxui, text="Remove Hexacontroller",
+            command=lambda: self.remove_hexacontroller(hexactrl))
+        rmv_hex_btn.grid()
+        return [hxui]
 
     def add_procedure(self, frame):
         pcui = prc.ProcedureCreationUI(frame)
+        if pcui.result is None:
+            return
         self.app_state.procedures.append(pcui.result)
-        self.setup_procedure_widgets(frame)
-
-    def remove_procedure(self, name, parent):
-        print(name)
-        proc_with_name = list(filter(lambda p: p[1].name == name, enumerate(self.app_state.procedures)))
-        print(proc_with_name)
-        if len(proc_with_name) > 0:
-            self.app_state.procedures.pop(proc_with_name[0][0])
-        self.setup_procedure_widgets(parent)
-
-    def remove_hexacontroller(self, name, parent):
-        hectrl_with_name = list(filter(lambda h: h[1].name == name, enumerate(self.app_state.hexactrls)))
-        if len(hectrl_with_name) > 0:
-            self.app_state.hexactrls.pop(hectrl_with_name[0][0])
-        self.setup_hexactrl_widgets(parent)
+        self.refresh_procedure_widgets()
+        self.schedule_autosave()
+
+    def remove_procedure(self, procedure):
+        if procedure in self.app_state.procedures:
+            self.app_state.procedures.remove(procedure)
+        self.refresh_procedure_widgets()
+        self.schedule_autosave()
+
+    def remove_hexacontroller(self, hexactrl):
+        if hexactrl in self.app_state.hexactrls:
+            self.app_state.hexactrls.remove(hexactrl)
+        self.refresh_hexactrl_widgets()
+        self.schedule_autosave()
 
     def add_hexacontroller(self, frame):
         hxui = hx.HexacontrollerCreationUI(frame)
+        if hxui.result is None:
+            return
         self.app_state.hexactrls.append(hxui.result)
-        self.setup_hexactrl_widgets(frame)
+        self.refresh_hexactrl_widgets()
+        self.schedule_autosave()
 
     def save(self):
         self.run_control_tab.refresh_available_procs_and_hexacontrollers()
-        proc_config = [p.serialize() for p in self.app_state.procedures]
-        hexa_config = [h.serialize() for h in self.app_state.hexactrls]
-        config = {'procedures': proc_config, 'hexacontrollers': hexa_config}
-        with open(self.config_file_path, 'w') as f:
-            json.dump(config, f)
+        try:
+            self.config_store.save(self.app_state.config_snapshot())
+        except (configstore.ConfigError, OSError) as e:
+            self.config_status.configure(text=f"Not saved: {e}")
+            return
+        self.config_status.configure(text="Configuration saved")
+
+    def schedule_autosave(self, event=None):
+        self.run_control_tab.refresh_available_procs_and_hexacontrollers()
+        self.config_store.save_later(self.app_state.config_snapshot())
+        self.config_status.configure(text="Unsaved changes")
+
+    def check_config_file(self):
+        """
+        Report the outcome of the autosave and reload the configuration if
+        it was changed by somebody else, unless there are unsaved edits
+        """
+        store = self.config_store
+        if store.error is not None:
+            self.config_status.configure(text=f"Not saved: {store.error}")
+        elif self.config_status.cget("text") == "Unsaved changes" \
+                and not store.dirty:
+            self.config_status.configure(text="Configuration saved")
+        if store.changed_on_disk() and not store.dirty:
+            try:
+                self.reload_config(store.load())
+            except configstore.ConfigError as e:
+                # the broken file is reported once and not loaded
+                store.stamp = store.file_stamp()
+                self.config_status.configure(text=f"Not reloaded: {e}")
+        self.after(self.reload_interval, self.check_config_file)
+
+    def reload_config(self, config_params):
+        self.app_state.load_entries(config_params)
+        # the configuration tabs that were not built yet need no refresh
+        if str(self.procedure_config_tab) not in self.tab_builders:
+            self.refresh_procedure_widgets()
+        if str(self.hexactrl_config_tab) not in self.tab_builders:
+            self.refresh_hexactrl_widgets()
+        self.run_control_tab.refresh_available_procs_and_hexacontrollers()
+        self.config_status.configure(
+            text="Configuration reloaded, it was changed on disk")
 
     def close_window(self):
+        self.config_store.close()
+        self.app_state.health.stop()
+        self.app_state.scheduler.close()
         self.destroy()
 
 
 if __name__ == '__main__':
     with open('./config_template.json', 'r') as cf:
-        config = json.load(cf)
-    gui = GUI(config, './config_template.json')
+        config_params = json.load(cf)
+    gui = GUI(config_params, './config_template.json')
     gui.mainloop()
@@ -0,0 +1,115 @@
+import json
+import sys
+import time
+from typing import Dict, List, Optional
+
+from ntu_daq_gui import config
+from ntu_daq_gui import executor as ex
+from ntu_daq_gui import hexacontroller as hx
+from ntu_daq_gui import procedure as prc
+from ntu_daq_gui import scheduler as sched
+
+
+class SelectionError(Exception):
+    def __init__(self, message="A selected entry is not in the configuration"):
+        super().__init__(message)
+
+
+def select_by_name(entries: List, names: Optional[List[str]], kind: str):
+    """
+    Return the entries with the given names in the order of the names, all
+    entries if no names are given
+    """
+    if not names:
+        return list(entries)
+    by_name = {entry.name: entry for entry in entries}
+    missing = [name for name in names if name not in by_name]
+    if missing:
+        raise SelectionError(
+            f"Unknown {kind}: {', '.join(missing)}. Configured are: "
+            f"{', '.join(by_name)}")
+    return [by_name[name] for name in names]
+
+
+def run_jobs(scheduler: sched.RunScheduler, echo: bool = True,
+             poll_interval: float = 0.05):
+    """
+    Drive the scheduler until all jobs are done and echo their output. On
+    an interrupt the queued jobs are cancelled and the running ones
+    terminated.
+    """
+    while not scheduler.idle():
+        try:
+            events = scheduler.poll()
+            for job, kind, data in events:
+                if kind == sched.STATE:
+                    text = f"{job.name} {data}"
+                    if job.returncode is not None:
+                        text += f" with exit code {job.returncode}"
+                    if job.error is not None:
+                        text += f": {job.error}"
+                    print(f"## {text}", file=sys.stderr, flush=True)
+                elif kind in (sched.METRIC, sched.RESOURCES):
+                    continue
+                elif echo:
+                    stream = sys.stderr if kind == ex.STDERR else sys.stdout
+                    stream.write(f"[{job.hexactrl.name}] {data}")
+            if not events:
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            print("## Interrupted, stopping all jobs", file=sys.stderr)
+            scheduler.cancel_all()
+
+
+def summarize(scheduler: sched.RunScheduler) -> Dict:
+    jobs = [job.summary() for job in scheduler.jobs]
+    counts = {}
+    for job in scheduler.jobs:
+        counts[job.state] = counts.get(job.state, 0) + 1
+    return {
+        "ok": all(job.state == sched.Job.SUCCEEDED for job in scheduler.jobs),
+        "counts": counts,
+        "run_directory": scheduler.run_directory,
+        "phases": scheduler.metrics.summary(),
+        "jobs": jobs,
+    }
+
+
+def run_headless(config_params: Dict, procedure_names: List[str],
+                 hexactrl_names: Optional[List[str]] = None,
+                 summary_path: Optional[str] = None,
+                 echo: bool = True) -> int:
+    """
+    Run the procedures, in the given order, on every selected Hexacontroller
+    with the same scheduler as the GUI and return the exit code: 0 if all
+    jobs succeeded, 1 if any failed and 2 if the selection is invalid.
+    """
+    procedures = [prc.Procedure.load_from_config(p)
+                  for p in config_params.get("procedures", [])]
+    hexactrls = [hx.Hexacontroller.load_from_config(h)
+                 for h in config_params.get("hexacontrollers", [])]
+    try:
+        procedures = select_by_name(procedures, procedure_names, "procedures")
+        hexactrls = select_by_name(hexactrls, hexactrl_names,
+                                   "hexacontrollers")
+    except SelectionError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    scheduler = sched.RunScheduler.load_from_config(
+        config_params.get("scheduler", {}),
+        config.get_run_directory(config_params))
+    # the scheduler runs the jobs of a board in the order they are queued
+    for procedure in procedures:
+        for hexactrl in hexactrls:
+            scheduler.submit(procedure, hexactrl)
+    run_jobs(scheduler, echo)
+    scheduler.close()
+
+    summary = summarize(scheduler)
+    if summary_path is None or summary_path == "-":
+        print(json.dumps(summary, indent=2))
+    else:
+        with open(summary_path, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0 if summary["ok"] else 1
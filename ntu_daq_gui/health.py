@@ -0,0 +1,144 @@
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from ntu_daq_gui import hexacontroller as hx
+
+
+class BoardStatus(NamedTuple):
+    hostname: str
+    reachable: bool
+    ssh: bool
+    daq_server: bool
+    sc_server: bool
+    checked_at: float
+
+
+def port_open(hostname: str, port: int, timeout: float) -> bool:
+    try:
+        with socket.create_connection((hostname, int(port)), timeout=timeout):
+            return True
+    except (OSError, ValueError):
+        return False
+
+
+class FleetHealthMonitor:
+    """
+    Checks the health of all configured Hexacontrollers concurrently
+
+    A board is reachable if it answers to a ping or, as ICMP is often not
+    permitted for unprivileged users, if its SSH port accepts a connection.
+    The ports of the daq and slow control servers are checked as well. The
+    results are cached for `ttl` seconds and can be refreshed periodically
+    in the background, so that reading the status never blocks.
+    """
+
+    def __init__(self, ttl: float = 10.0, timeout: float = 1.0,
+                 max_workers: int = 16):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_workers = max_workers
+        # created on demand and shut down by `stop`
+        self.pool: Optional[ThreadPoolExecutor] = None
+        self.cache: Dict[str, BoardStatus] = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.refresh_thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def load_from_config(cls, config: Dict):
+        """
+        given the 'health' entry of the configuration create a monitor
+        """
+        return cls(ttl=config.get('ttl', 10.0),
+                   timeout=config.get('timeout', 1.0))
+
+    def probe(self, hexactrl: hx.Hexacontroller) -> BoardStatus:
+        """
+        Check a single board, this blocks for up to a few timeouts
+        """
+        ssh = port_open(hexactrl.hostname, hexactrl.port, self.timeout)
+        reachable = ssh
+        if not reachable:
+            try:
+                reachable = hexactrl.host_up(self.timeout)
+            except OSError:
+                reachable = False
+        daq_server = reachable and port_open(
+            hexactrl.hostname, hexactrl.daq_server_port, self.timeout)
+        sc_server = reachable and port_open(
+            hexactrl.hostname, hexactrl.sc_server_port, self.timeout)
+        status = BoardStatus(hexactrl.hostname, reachable, ssh,
+                             daq_server, sc_server, time.time())
+        with self.lock:
+            self.cache[hexactrl.hostname] = status
+        return status
+
+    def refresh(self, hexactrls: List[hx.Hexacontroller],
+                force: bool = False) -> Dict[str, BoardStatus]:
+        """
+        Probe all boards whose cached status is older than the ttl in
+        parallel and return the status of all of them
+        """
+        stale = [h for h in hexactrls
+                 if force or self.status(h.hostname) is None]
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.max_workers)
+            pool = self.pool
+        for _ in pool.map(self.probe, stale):
+            pass
+        with self.lock:
+            return {h.hostname: self.cache[h.hostname] for h in hexactrls
+                    if h.hostname in self.cache}
+
+    def status(self, hostname: str,
+               allow_stale: bool = False) -> Optional[BoardStatus]:
+        """
+        Return the cached status of the board, `None` if there is no status
+        that is younger than the ttl
+        """
+        with self.lock:
+            status = self.cache.get(hostname)
+        if status is None:
+            return None
+        if not allow_stale and time.time() - status.checked_at > self.ttl:
+            return None
+        return status
+
+    def start(self, get_hexactrls: Callable[[], List[hx.Hexacontroller]]):
+        """
+        Refresh the status of the boards returned by `get_hexactrls` in the
+        background every `ttl` seconds
+        """
+        if self.refresh_thread is not None:
+            return
+        self.stop_event.clear()
+
+        def refresh_loop():
+            while not self.stop_event.is_set():
+                try:
+                    self.refresh(list(get_hexactrls()), force=True)
+                except Exception as e:
+                    if self.stop_event.is_set():
+                        # the pool was shut down under the refresh
+                        break
+                    # one failed round must not end the monitoring
+                    print(f"Unable to check the health of the "
+                          f"Hexacontrollers: {e!r}")
+                self.stop_event.wait(self.ttl)
+
+        self.refresh_thread = threading.Thread(target=refresh_loop,
+                                               daemon=True)
+        self.refresh_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.refresh_thread = None
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            # the probes that run end within their timeouts
+            pool.shutdown(wait=False)
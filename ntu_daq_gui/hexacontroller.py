@@ -1,10 +1,15 @@
 from tkinter import ttk
 import tkinter as tk
+import itertools
 from typing import Dict
-from ping3 import ping
-import paramiko
 from tkinter import simpledialog
 
+from ntu_daq_gui import sshpool
+from ntu_daq_gui import channelreader
+from ntu_daq_gui import batch
+from ntu_daq_gui import reconcile
+from ntu_daq_gui import zmqclient
+
 
 class ConnectionError(Exception):
     def __init__(self, message="An error occured while setting up the SSH connection"):
@@ -17,12 +22,19 @@ class TransmissionError(Exception):
 
 
 class Hexacontroller:
+    # the SSH transports are shared by all Hexacontroller objects (and their
+    # copies) that connect to the same host as the same user
+    pool = sshpool.default_pool
+    # same for the clients of the zmq servers on the boards
+    zmq_pool = zmqclient.default_pool
+
     def __init__(self, username, password, hostname, port=22,
                  startup_commands=[],
                  daq_server_start_cmd="",
                  sc_server_start_cmd="",
                  shutdown_commands=[],
-                 available_images=[], name=None):
+                 available_images=[], name=None,
+                 daq_server_port=6000, sc_server_port=5555):
         if name is not None:
             self.name = name
         else:
@@ -36,56 +48,124 @@ class Hexacontroller:
         self.sc_server_start_cmd = sc_server_start_cmd
         self.shutdown_commands = shutdown_commands
         self.available_images = available_images
+        self.daq_server_port = daq_server_port
+        self.sc_server_port = sc_server_port
         self.command_running = False
         self.connected = False
+        self.channel = None
+        self.readers = []
+
+    def __getstate__(self):
+        # open channels belong to this object and are not copied
+        state = self.__dict__.copy()
+        state['channel'] = None
+        state['readers'] = []
+        return state
 
     def connect(self):
-        self.ssh_client = paramiko.SSHClient()
-        self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        # paramiko and ping3 take a while to import, so they are only
+        # imported when they are needed
+        import paramiko
         try:
-            self.ssh_client.connect(self.hostname, self.port,
+            self.pool.get_transport(self.hostname, self.port,
                                     self.username, self.password)
-            self.ssh_transport = self.ssh_client.get_transport()
             self.connected = True
-        except paramiko.SSHException as e:
+        except (paramiko.SSHException, OSError) as e:
             raise ConnectionError from e
 
-    def disconnect(self):
-        self.ssh_client.close()
+    def disconnect(self, close_transport=False):
+        """
+        Close the channels of this Hexacontroller. The transport stays in
+        the pool for the next connect unless `close_transport` is set
+        """
+        for reader in self.readers:
+            reader.close()
+        self.readers = []
+        self.channel = None
+        if close_transport:
+            self.pool.close(self.hostname, self.port, self.username)
         self.connected = False
 
-    def host_up(self) -> bool:
-        pres = ping(self.hostname)
-        return True if pres is not None else pres
+    def host_up(self, timeout: float = 1.0) -> bool:
+        from ping3 import ping
+        # ping returns None on a timeout and False on an error
+        pres = ping(self.hostname, timeout=timeout)
+        return pres is not None and pres is not False
 
-    def ssh_execute_command(self, command):
+    def sc_client(self) -> zmqclient.BoardClient:
+        """
+        Client of the slow control server of the board
+        """
+        return self.zmq_pool.get(self.hostname, self.sc_server_port)
+
+    def daq_client(self) -> zmqclient.BoardClient:
+        """
+        Client of the DAQ server of the board
+        """
+        return self.zmq_pool.get(self.hostname, self.daq_server_port)
+
+    def ssh_execute_command(self, command, log_writer=None,
+                            get_pty=False) -> channelreader.ChannelReader:
+        """
+        Execute the command in a new channel and return the reader that
+        collects its output in the background. Several commands may run at
+        the same time, `channel` refers to the newest one.
+        """
+        import paramiko
         try:
-            self.channel = self.ssh_transport.open_session()
-            self.channel.exec_command(command)
-            self.command_running = True
-        except paramiko.SSHException as e:
+            channel = self.pool.open_session(self.hostname, self.port,
+                                             self.username, self.password)
+            if get_pty:
+                channel.get_pty()
+            channel.exec_command(command)
+        except (paramiko.SSHException, OSError) as e:
             raise ConnectionError from e
+        reader = channelreader.ChannelReader(channel, log_writer=log_writer)
+        self.readers = [r for r in self.readers if not r.channel.closed]
+        self.readers.append(reader)
+        self.channel = channel
+        self.command_running = True
+        return reader
 
     def get_command_output(self):
+        """
+        Return the output of the newest command that arrived since the last
+        call, stdout and stderr are interleaved
+        """
         if self.channel is None:
             return None
-        try:
-            if self.channel.recv_ready():
-                return self.channel.recv(4096).decode('utf-8')
-            return ""
-        except paramiko.SSHException as e:
-            raise TransmissionError from e
+        return "".join(line for _, line in self.readers[-1].get_output())
 
     def command_completed(self):
-        try:
-            if self.channel.exit_status_ready() is True:
-                return self.channel.exit_status
-        except paramiko.SSHException as e:
-            raise TransmissionError from e
+        """
+        Return the exit status of the newest command or False if it is still
+        running
+        """
+        reader = self.readers[-1]
+        if reader.is_done():
+            self.command_running = False
+            return reader.returncode
         return False
 
+    def run_startup_commands(self, stop_on_failure=True, timeout=None,
+                             log_writer=None):
+        """
+        Run all startup commands in one channel, see `batch.run_batch`
+        """
+        return batch.run_batch(self, self.startup_commands, stop_on_failure,
+                               timeout, log_writer)
+
+    def run_shutdown_commands(self, stop_on_failure=False, timeout=None,
+                              log_writer=None):
+        """
+        Run all shutdown commands in one channel, see `batch.run_batch`
+        """
+        return batch.run_batch(self, self.shutdown_commands, stop_on_failure,
+                               timeout, log_writer)
+
     def serialize(self):
-        return {"hostname": self.hostname,
+        return {"name": self.name,
+                "hostname": self.hostname,
                 "port": self.port,
                 "username": self.username,
                 "password": self.password,
@@ -93,6 +173,8 @@ class Hexacontroller:
                 "shutdown_commands": self.shutdown_commands,
                 "daq_server_start_cmd": self.daq_server_start_cmd,
                 "sc_server_start_cmd": self.sc_server_start_cmd,
+                "daq_server_port": self.daq_server_port,
+                "sc_server_port": self.sc_server_port,
                 }
 
     @classmethod
@@ -109,6 +191,9 @@ class Hexacontroller:
             shutdown_commands=config.get('shutdown_commands', []),
             daq_server_start_cmd=config.get('daq_server_start_cmd', ""),
             sc_server_start_cmd=config.get('sc_server_start_cmd', ""),
+            daq_server_port=config.get('daq_server_port', 6000),
+            sc_server_port=config.get('sc_server_port', 5555),
+            name=config.get('name'),
         )
 
 
@@ -153,6 +238,11 @@ class HexactrlConfigUI(ttk.Frame):
         self.hexactrl = hexactrl
         self.init_command_entries = []
         self.shutdown_command_entries = []
+        self.cmd_key_counter = itertools.count()
+        self.init_cmd_keys = []
+        self.init_cmd_vars = {}
+        self.shutdown_cmd_keys = []
+        self.shutdown_cmd_vars = {}
         self.grid(pady=5, padx=5)
 
         self.populate()
@@ -210,6 +300,9 @@ class HexactrlConfigUI(ttk.Frame):
         self.add_init_cmd_button.grid(row=5, column=2)
         self.init_cmd_frame = ttk.Frame(self, relief="groove", padding=5)
         self.init_cmd_frame.grid(row=6, columnspan=3)
+        self.init_cmd_rows = reconcile.RowReconciler(
+            self.init_cmd_frame, self.create_init_cmd_row,
+            self.update_cmd_row)
 
         # The shutdown commands are built using entries that
         # automatically update the state of the variables stored in
@@ -221,6 +314,9 @@ class HexactrlConfigUI(ttk.Frame):
         self.add_shutdown_cmd_button.grid(row=7, column=2, pady=5)
         self.shutdown_cmd_frame = ttk.Frame(self, relief="groove", padding=5)
         self.shutdown_cmd_frame.grid(row=8, columnspan=3)
+        self.shutdown_cmd_rows = reconcile.RowReconciler(
+            self.shutdown_cmd_frame, self.create_shutdown_cmd_row,
+            self.update_cmd_row)
 
         # Variable for storing the start command for the daq server
         self.daq_start_var = tk.StringVar()
@@ -230,7 +326,6 @@ class HexactrlConfigUI(ttk.Frame):
         daq_server_cmd_label.grid(row=9, column=0)
         daq_server_cmd_entry = ttk.Entry(self, textvariable=self.daq_start_var)
         daq_server_cmd_entry.grid(row=9, column=1, columnspan=2)
-        daq_server_cmd_entry.insert(tk.END, self.hexactrl.daq_server_start_cmd)
 
         # Variable for storing the start command for the slow control server
         self.sc_start_var = tk.StringVar()
@@ -241,98 +336,174 @@ class HexactrlConfigUI(ttk.Frame):
         sc_server_cmd_label.grid(row=10, column=0)
         sc_server_cmd_entry = ttk.Entry(self, textvariable=self.sc_start_var)
         sc_server_cmd_entry.grid(row=10, column=1, columnspan=2)
-        sc_server_cmd_entry.insert(tk.END, self.hexactrl.daq_server_start_cmd)
+
+        # The ports the servers listen on, used to check if they are up
+        ttk.Label(self, text="DAQ Server Port:").grid(
+            row=11, column=0, padx=2, pady=2)
+        self.daq_port_var = tk.IntVar()
+        self.daq_port_var.set(self.hexactrl.daq_server_port)
+        self.daq_port_var.trace_add("write", self.update_daq_port)
+        ttk.Entry(self, textvariable=self.daq_port_var).grid(row=11, column=2)
+
+        ttk.Label(self, text="Slow control Port:").grid(
+            row=12, column=0, padx=2, pady=2)
+        self.sc_port_var = tk.IntVar()
+        self.sc_port_var.set(self.hexactrl.sc_server_port)
+        self.sc_port_var.trace_add("write", self.update_sc_port)
+        ttk.Entry(self, textvariable=self.sc_port_var).grid(row=12, column=2)
 
         self.refresh_init_cmds()
         self.refresh_shutdown_cmds()
 
     # These functions allow for the addition and removal of commands to the
-    # startup procedure of the hexacontroller
+    # startup procedure of the hexacontroller. Every command has a key that
+    # does not change when other commands are added or removed, so the rows
+    # of the remaining commands can be kept as they are
     def add_startup_cmd(self):
         self.hexactrl.startup_commands.append("")
+        self.init_cmd_keys.append(next(self.cmd_key_counter))
         self.refresh_init_cmds()
+        self.notify_changed()
 
     def remove_startup_cmd(self, idx):
         del self.hexactrl.startup_commands[idx]
+        del self.init_cmd_keys[idx]
         self.refresh_init_cmds()
+        self.notify_changed()
 
     def update_init_cmds(self, idx):
         print("updating startup commands")
         self.hexactrl.startup_commands[idx] = \
             self.init_command_entries[idx].get()
+        self.notify_changed()
+
+    def create_init_cmd_row(self, parent, key, cmd, row):
+        entry_var = tk.StringVar()
+        entry_var.set(cmd)
+        entry_var.trace_add(
+            "write",
+            lambda *args: self.update_init_cmds(self.init_cmd_keys.index(key)))
+        self.init_cmd_vars[key] = entry_var
+        entry = ttk.Entry(parent, textvariable=entry_var)
+        entry.grid(row=row, column=0)
+        rm_btn = ttk.Button(
+            parent, text="Remove",
+            command=lambda: self.remove_startup_cmd(
+                self.init_cmd_keys.index(key)))
+        rm_btn.grid(row=row, column=1)
+        return [entry, rm_btn]
+
+    @staticmethod
+    def update_cmd_row(widgets, cmd):
+        # the entry normally already shows the command as it was typed there
+        entry = widgets[0]
+        if entry.get() != cmd:
+            entry.delete(0, tk.END)
+            entry.insert(0, cmd)
 
     def refresh_init_cmds(self):
-        for child in self.init_cmd_frame.winfo_children():
-            child.destroy()
-        self.init_command_entries = []
-        for i, cmd in enumerate(self.hexactrl.startup_commands):
-            entry_var = tk.StringVar()
-            entry_var.set(cmd)
-            entry_var.trace_add(
-                "write",
-                lambda *args, idx=i: self.update_init_cmds(idx))
-            self.init_command_entries.append(entry_var)
-            entry = ttk.Entry(
-                self.init_cmd_frame,
-                textvariable=entry_var)
-            entry.grid(row=i, column=0)
-            rm_btn = ttk.Button(self.init_cmd_frame,
-                                text="Remove",
-                                command=lambda: self.remove_startup_cmd(i))
-            rm_btn.grid(row=i, column=1)
+        # the keys only get out of step if the list was changed elsewhere
+        if len(self.init_cmd_keys) != len(self.hexactrl.startup_commands):
+            self.init_cmd_keys = [next(self.cmd_key_counter)
+                                  for _ in self.hexactrl.startup_commands]
+        self.init_cmd_rows.reconcile(
+            zip(self.init_cmd_keys, self.hexactrl.startup_commands))
+        self.init_cmd_vars = {key: self.init_cmd_vars[key]
+                              for key in self.init_cmd_keys}
+        self.init_command_entries = list(self.init_cmd_vars.values())
 
     # These functions allow for the addition and removal of commands to the
-    # startup procedure of the hexacontroller
+    # shutdown procedure of the hexacontroller
     def update_shutdown_cmds(self, idx):
         print("updating shutdown commands")
         self.hexactrl.shutdown_commands[idx] = \
             self.shutdown_command_entries[idx].get()
+        self.notify_changed()
 
     def remove_shutdown_cmd(self, idx):
         del self.hexactrl.shutdown_commands[idx]
+        del self.shutdown_cmd_keys[idx]
         self.refresh_shutdown_cmds()
+        self.notify_changed()
 
     def add_shutdown_cmd(self):
         self.hexactrl.shutdown_commands.append("")
+        self.shutdown_cmd_keys.append(next(self.cmd_key_counter))
         self.refresh_shutdown_cmds()
+        self.notify_changed()
+
+    def create_shutdown_cmd_row(self, parent, key, cmd, row):
+        entry_var = tk.StringVar()
+        entry_var.set(cmd)
+        entry_var.trace_add(
+            "write",
+            lambda *args: self.update_shutdown_cmds(
+                self.shutdown_cmd_keys.index(key)))
+        self.shutdown_cmd_vars[key] = entry_var
+        entry = ttk.Entry(parent, textvariable=entry_var)
+        entry.grid(row=row, column=0)
+        rm_btn = ttk.Button(
+            parent, text="Remove",
+            command=lambda: self.remove_shutdown_cmd(
+                self.shutdown_cmd_keys.index(key)))
+        rm_btn.grid(row=row, column=1)
+        return [entry, rm_btn]
 
     def refresh_shutdown_cmds(self):
-        for child in self.shutdown_cmd_frame.winfo_children():
-            child.destroy()
-        self.shutdown_command_entries = []
-        for i, cmd in enumerate(self.hexactrl.shutdown_commands):
-            entry_var = tk.StringVar()
-            entry_var.set(cmd)
-            entry_var.trace_add(
-                "write",
-                lambda *args, idx=i: self.update_shutdown_cmds(idx))
-            self.shutdown_command_entries.append(entry_var)
-            entry = ttk.Entry(
-                self.shutdown_cmd_frame,
-                textvariable=entry_var)
-            entry.grid(row=i, column=0)
-            rm_btn = ttk.Button(self.shutdown_cmd_frame,
-                                text="Remove",
-                                command=lambda: self.remove_shutdown_cmd(i))
-            rm_btn.grid(row=i, column=1)
+        if len(self.shutdown_cmd_keys) != len(self.hexactrl.shutdown_commands):
+            self.shutdown_cmd_keys = [next(self.cmd_key_counter)
+                                      for _ in self.hexactrl.shutdown_commands]
+        self.shutdown_cmd_rows.reconcile(
+            zip(self.shutdown_cmd_keys, self.hexactrl.shutdown_commands))
+        self.shutdown_cmd_vars = {key: self.shutdown_cmd_vars[key]
+                                  for key in self.shutdown_cmd_keys}
+        self.shutdown_command_entries = list(self.shutdown_cmd_vars.values())
+
+    def notify_changed(self):
+        # the window autosaves the configuration on this event
+        self.event_generate("<<ConfigChanged>>")
 
     def update_daq_start_command(self, *args):
         self.hexactrl.daq_server_start_cmd = self.daq_start_var.get()
+        self.notify_changed()
 
     def update_sc_start_command(self, *args):
         self.hexactrl.sc_server_start_cmd = self.sc_start_var.get()
+        self.notify_changed()
 
     def update_hostname(self, *args):
         self.hexactrl.hostname = self.host_var.get()
+        self.notify_changed()
 
     def update_port(self, *args):
-        self.hexactrl.port = self.port_var.get()
+        try:
+            self.hexactrl.port = self.port_var.get()
+        except tk.TclError:
+            return
+        self.notify_changed()
+
+    def update_daq_port(self, *args):
+        try:
+            self.hexactrl.daq_server_port = self.daq_port_var.get()
+        except tk.TclError:
+            return
+        self.notify_changed()
+
+    def update_sc_port(self, *args):
+        try:
+            self.hexactrl.sc_server_port = self.sc_port_var.get()
+        except tk.TclError:
+            return
+        self.notify_changed()
 
     def update_username(self, *args):
         self.hexactrl.username = self.user_var.get()
+        self.notify_changed()
 
     def update_password(self, *args):
         self.hexactrl.password = self.pswd_var.get()
+        self.notify_changed()
 
     def update_name(self, *args):
         self.hexactrl.name = self.name_var.get()
+        self.notify_changed()
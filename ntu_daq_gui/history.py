@@ -0,0 +1,331 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_key TEXT UNIQUE NOT NULL,
+    procedure TEXT NOT NULL,
+    options TEXT,
+    hexacontroller TEXT NOT NULL,
+    hostname TEXT,
+    module_id TEXT,
+    state TEXT NOT NULL,
+    returncode INTEGER,
+    error TEXT,
+    submit_time REAL,
+    start_time REAL,
+    end_time REAL,
+    duration REAL,
+    run_dir TEXT,
+    log_path TEXT,
+    lines INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS runs_procedure ON runs (procedure, start_time);
+CREATE INDEX IF NOT EXISTS runs_hexacontroller
+    ON runs (hexacontroller, start_time);
+CREATE INDEX IF NOT EXISTS runs_module ON runs (module_id, start_time);
+CREATE INDEX IF NOT EXISTS runs_start ON runs (start_time);
+CREATE TABLE IF NOT EXISTS lines (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL,
+    line_no INTEGER NOT NULL,
+    stream TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lines_run ON lines (run_id, line_no);
+-- the full text index of the lines, it refers to the lines table instead
+-- of holding a copy of the text
+CREATE VIRTUAL TABLE IF NOT EXISTS lines_fts USING fts5(
+    text, content='lines', content_rowid='id'
+);
+"""
+
+RUN_COLUMNS = ("id", "procedure", "options", "hexacontroller", "hostname",
+               "module_id", "state", "returncode", "error", "submit_time",
+               "start_time", "end_time", "duration", "run_dir", "log_path",
+               "lines")
+
+
+def connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    # readers are not blocked by the writer and the writer does not wait
+    # for the disk on every transaction
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def phrase(text: str) -> str:
+    """
+    FTS5 query that matches the text as a phrase, without any of the query
+    syntax
+    """
+    return '"' + text.replace('"', '""') + '"'
+
+
+class HistoryWriter:
+    """
+    Records the runs and their output in the history database
+
+    The calls only queue what is to be recorded and return right away, a
+    thread of its own writes it in transactions of up to `batch_size`
+    lines or every `flush_interval` seconds, whichever comes first. If the
+    database falls more than `max_queued` batches behind, the output is
+    dropped (and counted) rather than blocking the caller. The start and
+    the end of the runs are always queued, there are few of them.
+    """
+
+    def __init__(self, path: str, batch_size: int = 20000,
+                 flush_interval: float = 0.5, max_queued: int = 1000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queued = max_queued
+        # not bounded, so that no call blocks, add_lines checks the size
+        self.queue = queue.Queue()
+        self.dropped_lines = 0
+        self.error: Optional[str] = None
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def load_from_config(cls, config, run_directory: Optional[str]):
+        """
+        given the 'history' entry of the scheduler configuration create the
+        writer, None if the history is disabled with `false` or there is
+        nowhere to put it
+        """
+        if config is False:
+            return None
+        if not isinstance(config, dict):
+            config = {}
+        path = config.get('path')
+        if path is None:
+            if run_directory is None:
+                return None
+            os.makedirs(run_directory, exist_ok=True)
+            path = os.path.join(run_directory, "history.sqlite3")
+        return cls(os.path.expanduser(path),
+                   batch_size=config.get('batch_size', 20000),
+                   flush_interval=config.get('flush_interval', 0.5),
+                   max_queued=config.get('max_queued', 1000))
+
+    def run_started(self, run_key: str, row: Dict):
+        self.queue.put(("start", (run_key, row)))
+
+    def run_finished(self, run_key: str, row: Dict):
+        self.queue.put(("finish", (run_key, row)))
+
+    def add_lines(self, run_key: str, lines: List[Tuple[str, str]]):
+        if self.queue.qsize() >= self.max_queued:
+            self.dropped_lines += len(lines)
+        else:
+            self.queue.put(("lines", (run_key, lines)))
+
+    def close(self):
+        self.queue.put(("close", None))
+        self.thread.join()
+
+    def _write_loop(self):
+        try:
+            connection = connect(self.path)
+        except sqlite3.Error as e:
+            self.error = str(e)
+            print(f"The run history {self.path} can not be opened: {e}")
+            # keep taking what is queued, so it does not pile up
+            while self.queue.get()[0] != "close":
+                pass
+            return
+        # database id and number of lines written of the runs
+        runs: Dict[str, List[int]] = {}
+        closing = False
+        while not closing:
+            items = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            pending_lines = len(items[0][1][1]) if items[0][0] == "lines" \
+                else 0
+            while pending_lines < self.batch_size and items[-1][0] != "close":
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                items.append(item)
+                if item[0] == "lines":
+                    pending_lines += len(item[1][1])
+            # the changes to the runs only count once the transaction is
+            # committed, a rolled back row id must not be written to
+            staged = {key: list(run) for key, run in runs.items()}
+            try:
+                with connection:
+                    for kind, data in items:
+                        if kind == "close":
+                            closing = True
+                        else:
+                            self._write(connection, staged, kind, data)
+                runs = staged
+            except sqlite3.Error as e:
+                self.error = str(e)
+                print(f"Unable to write the run history: {e}")
+        connection.close()
+
+    @staticmethod
+    def _write(connection: sqlite3.Connection, runs: Dict[str, List[int]],
+               kind: str, data):
+        run_key = data[0]
+        if kind == "start":
+            row = dict(data[1], run_key=run_key)
+            cursor = connection.execute(
+                f"INSERT INTO runs ({', '.join(row)}) VALUES "
+                f"({', '.join('?' * len(row))})", list(row.values()))
+            runs[run_key] = [cursor.lastrowid, 0]
+        elif kind == "lines":
+            run = runs.get(run_key)
+            if run is None:
+                return
+            run_id, line_no = run
+            last_id = connection.execute(
+                "SELECT coalesce(max(id), 0) FROM lines").fetchone()[0]
+            connection.executemany(
+                "INSERT INTO lines (run_id, line_no, stream, text) "
+                "VALUES (?, ?, ?, ?)",
+                [(run_id, line_no + i, stream, text.rstrip("\n"))
+                 for i, (stream, text) in enumerate(data[1])])
+            # one statement per batch instead of a trigger per line
+            connection.execute(
+                "INSERT INTO lines_fts (rowid, text) "
+                "SELECT id, text FROM lines WHERE id > ?", (last_id,))
+            run[1] += len(data[1])
+        elif kind == "finish":
+            row = data[1]
+            run = runs.pop(run_key, None)
+            if run is None:
+                return
+            row = dict(row, lines=run[1])
+            connection.execute(
+                f"UPDATE runs SET {', '.join(f'{k} = ?' for k in row)} "
+                f"WHERE id = ?", [*row.values(), run[0]])
+
+
+class HistoryStore:
+    """
+    Answers queries about the past runs
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.connection = connect(path)
+
+    def search(self, procedure: Optional[str] = None,
+               hexacontroller: Optional[str] = None,
+               state: Optional[str] = None,
+               module_id: Optional[str] = None,
+               since: Optional[float] = None, until: Optional[float] = None,
+               text: Optional[str] = None, limit: int = 500) -> List[Dict]:
+        """
+        The runs that match all given criteria, newest first. With `text`
+        only the runs that printed the text are returned, with the number
+        of lines that contain it in `matches`.
+        """
+        conditions, parameters = [], []
+        for column, value in (("procedure", procedure),
+                              ("hexacontroller", hexacontroller),
+                              ("state", state), ("module_id", module_id)):
+            if value:
+                conditions.append(f"runs.{column} = ?")
+                parameters.append(value)
+        if since is not None:
+            conditions.append("runs.start_time >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("runs.start_time < ?")
+            parameters.append(until)
+        columns = ", ".join(f"runs.{c}" for c in RUN_COLUMNS)
+        if text:
+            query = (f"SELECT {columns}, hits.matches FROM runs JOIN "
+                     "(SELECT lines.run_id, count(*) AS matches "
+                     "FROM lines_fts JOIN lines ON lines.id = lines_fts.rowid "
+                     "WHERE lines_fts MATCH ? GROUP BY lines.run_id) AS hits "
+                     "ON hits.run_id = runs.id")
+            parameters.insert(0, phrase(text))
+        else:
+            query = f"SELECT {columns}, NULL FROM runs"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY runs.start_time DESC LIMIT ?"
+        parameters.append(limit)
+        rows = self.connection.execute(query, parameters).fetchall()
+        return [dict(zip(RUN_COLUMNS + ("matches",), row)) for row in rows]
+
+    def lines(self, run_id: int, text: Optional[str] = None,
+              limit: int = 1000) -> List[Tuple[int, str, str]]:
+        """
+        (line number, stream, text) of the output of the run, only the
+        lines that contain `text` if it is given
+        """
+        if text:
+            # the lines of a run have ids in between those of its first and
+            # its last line, only that range of the full text index is read
+            first, last = self.connection.execute(
+                "SELECT min(id), max(id) FROM lines WHERE run_id = ?",
+                (run_id,)).fetchone()
+            if first is None:
+                return []
+            rows = self.connection.execute(
+                "SELECT lines.line_no, lines.stream, lines.text FROM lines_fts "
+                "CROSS JOIN lines ON lines.id = lines_fts.rowid "
+                "WHERE lines_fts MATCH ? AND lines_fts.rowid BETWEEN ? AND ? "
+                "AND lines.run_id = ? ORDER BY lines.line_no LIMIT ?",
+                (phrase(text), first, last, run_id, limit))
+        else:
+            rows = self.connection.execute(
+                "SELECT line_no, stream, text FROM lines WHERE run_id = ? "
+                "ORDER BY line_no LIMIT ?", (run_id, limit))
+        return rows.fetchall()
+
+    def distinct(self, column: str) -> List[str]:
+        """
+        The values of a column of the runs, for the choices of the filters
+        """
+        if column not in RUN_COLUMNS:
+            raise ValueError(f"Unknown column {column}")
+        return [row[0] for row in self.connection.execute(
+            f"SELECT DISTINCT {column} FROM runs WHERE {column} IS NOT NULL "
+            f"ORDER BY {column}")]
+
+    def close(self):
+        self.connection.close()
+
+
+def run_row(job) -> Dict:
+    """
+    The columns of the runs table for a scheduler.Job
+    """
+    duration = None
+    if job.start_time is not None and job.end_time is not None:
+        duration = job.end_time - job.start_time
+    return {
+        "procedure": job.procedure.name,
+        "options": json.dumps(job.procedure.options),
+        "hexacontroller": job.hexactrl.name,
+        "hostname": job.hexactrl.hostname,
+        "module_id": job.module_id,
+        "state": job.state,
+        "returncode": job.returncode,
+        "error": job.error,
+        "submit_time": job.submit_time,
+        "start_time": job.start_time,
+        "end_time": job.end_time,
+        "duration": duration,
+        "run_dir": job.run_dir,
+        "log_path": job.log_path,
+    }
@@ -0,0 +1,218 @@
+import datetime
+import threading
+import time
+import tkinter as tk
+from tkinter import ttk
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+from ntu_daq_gui import executor as ex
+from ntu_daq_gui import history as hist
+from ntu_daq_gui import scheduler as sched
+
+if TYPE_CHECKING:
+    from ntu_daq_gui.gui import AppState
+
+
+class HistoryUI(ttk.Frame):
+    """
+    Search the history of the runs by procedure, Hexacontroller, state,
+    module, time and the text they printed
+
+    The queries run in a thread of their own, so a search over many runs
+    does not freeze the GUI.
+    """
+
+    columns = ("Start", "Procedure", "Hexacontroller", "Module", "State",
+               "Exit", "Duration", "Lines", "Matches")
+    poll_interval = 50
+    max_lines = 1000
+
+    def __init__(self, parent: ttk.Widget, state: "AppState", *args,
+                 **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.app_state = state
+        self.store: Optional[hist.HistoryStore] = None
+        self.runs: Dict[str, Dict] = {}
+        self.searching = False
+        self.lines_request = 0
+        writer = state.scheduler.history
+        if writer is None:
+            ttk.Label(self, text="The history is disabled or there is no "
+                                 "run directory").grid()
+            return
+        self.store = hist.HistoryStore(writer.path)
+        self.create_widgets()
+        self.search()
+
+    def create_widgets(self):
+        filters = ttk.Frame(self)
+        filters.grid(row=0, column=0, sticky='ew', pady=5)
+        self.filter_vars = {}
+        self.choice_boxes = {}
+        for i, (key, label) in enumerate((
+                ("procedure", "Procedure"), ("hexacontroller", "Hexacontroller"),
+                ("state", "State"), ("module_id", "Module"))):
+            ttk.Label(filters, text=label).grid(row=0, column=2 * i)
+            var = self.filter_vars[key] = tk.StringVar()
+            if key == "module_id":
+                widget = ttk.Entry(filters, textvariable=var, width=12)
+            else:
+                widget = self.choice_boxes[key] = ttk.Combobox(
+                    filters, textvariable=var, width=15,
+                    postcommand=lambda k=key: self.choices(k))
+            widget.grid(row=0, column=2 * i + 1, padx=3)
+        ttk.Label(filters, text="Last days").grid(row=1, column=0)
+        self.days_var = tk.StringVar(value="0")
+        ttk.Spinbox(filters, from_=0, to=3650, textvariable=self.days_var,
+                    width=6).grid(row=1, column=1, sticky='w', padx=3)
+        ttk.Label(filters, text="Output contains").grid(row=1, column=2)
+        self.text_var = tk.StringVar()
+        text_entry = ttk.Entry(filters, textvariable=self.text_var, width=30)
+        text_entry.grid(row=1, column=3, columnspan=3, sticky='ew', padx=3)
+        text_entry.bind("<Return>", lambda e: self.search())
+        self.search_button = ttk.Button(filters, text="Search",
+                                        command=self.search)
+        self.search_button.grid(row=1, column=6)
+        self.status = ttk.Label(filters, text="")
+        self.status.grid(row=1, column=7, padx=5)
+
+        self.run_tree = ttk.Treeview(self, columns=self.columns,
+                                     show="headings", height=15)
+        for column in self.columns:
+            self.run_tree.heading(column, text=column)
+            self.run_tree.column(column, width=130 if column == "Start"
+                                 else 90)
+        self.run_tree.grid(row=1, column=0, sticky='nsew')
+        self.run_tree.bind("<<TreeviewSelect>>", lambda e: self.show_lines())
+
+        self.line_text = tk.Text(self, height=15, wrap='none')
+        self.line_text.tag_configure(ex.STDERR, foreground="red")
+        self.line_text.grid(row=2, column=0, sticky='nsew', pady=5)
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(2, weight=1)
+
+    def choices(self, key: str):
+        if key == "state":
+            values = [sched.Job.SUCCEEDED, sched.Job.FAILED,
+                      sched.Job.CANCELLED, sched.Job.RUNNING]
+        else:
+            values = self.store.distinct(key)
+        self.choice_boxes[key].configure(values=[""] + values)
+
+    def criteria(self) -> Dict:
+        criteria = {key: var.get().strip() or None
+                    for key, var in self.filter_vars.items()}
+        try:
+            days = float(self.days_var.get())
+        except ValueError:
+            days = 0
+        if days > 0:
+            criteria["since"] = time.time() - days * 86400
+        criteria["text"] = self.text_var.get().strip() or None
+        return criteria
+
+    def search(self):
+        if self.searching:
+            return
+        self.searching = True
+        self.search_button['state'] = tk.DISABLED
+        self.status.configure(text="Searching...")
+        criteria = self.criteria()
+        result = {}
+
+        def search_worker():
+            start = time.perf_counter()
+            try:
+                result["runs"] = self.store.search(**criteria)
+            except hist.sqlite3.Error as e:
+                result["error"] = e
+            result["time"] = time.perf_counter() - start
+
+        worker = threading.Thread(target=search_worker, daemon=True)
+        worker.start()
+        self.after(self.poll_interval, self.await_search, worker, result)
+
+    def await_search(self, worker: threading.Thread, result: Dict):
+        if worker.is_alive():
+            self.after(self.poll_interval, self.await_search, worker, result)
+            return
+        self.searching = False
+        self.search_button['state'] = tk.NORMAL
+        if "error" in result:
+            self.status.configure(text=f"Search failed: {result['error']}")
+            return
+        self.show_runs(result["runs"])
+        self.status.configure(text=f"{len(result['runs'])} runs in "
+                                   f"{1000 * result['time']:.0f} ms")
+
+    def show_runs(self, runs: List[Dict]):
+        self.run_tree.delete(*self.run_tree.get_children())
+        self.runs = {}
+        for run in runs:
+            iid = str(run["id"])
+            self.runs[iid] = run
+            start = datetime.datetime.fromtimestamp(run["start_time"]) \
+                .strftime("%Y-%m-%d %H:%M:%S") if run["start_time"] else ""
+            duration = f"{run['duration']:.1f} s" \
+                if run["duration"] is not None else ""
+            self.run_tree.insert("", "end", iid=iid, values=(
+                start, run["procedure"], run["hexacontroller"],
+                run["module_id"] or "", run["state"],
+                "" if run["returncode"] is None else run["returncode"],
+                duration, run["lines"], run["matches"] or ""))
+
+    def show_lines(self):
+        """
+        Show the output of the selected run, only the lines with the text
+        that was searched for if there is one
+        """
+        selection = self.run_tree.selection()
+        if not selection:
+            return
+        run = self.runs[selection[0]]
+        text = self.text_var.get().strip() or None
+        # a later selection replaces the lines of an earlier one that are
+        # still being read
+        self.lines_request += 1
+        request = self.lines_request
+        result = {}
+
+        def lines_worker():
+            try:
+                result["lines"] = self.store.lines(run["id"], text,
+                                                   self.max_lines)
+            except hist.sqlite3.Error as e:
+                result["error"] = e
+
+        self.line_text.delete("1.0", tk.END)
+        self.line_text.insert(tk.END, "Loading...")
+        worker = threading.Thread(target=lines_worker, daemon=True)
+        worker.start()
+        self.after(self.poll_interval, self.await_lines, worker, result, run,
+                   request)
+
+    def await_lines(self, worker: threading.Thread, result: Dict, run: Dict,
+                    request: int):
+        if request != self.lines_request:
+            return
+        if worker.is_alive():
+            self.after(self.poll_interval, self.await_lines, worker, result,
+                       run, request)
+            return
+        self.line_text.delete("1.0", tk.END)
+        if "error" in result:
+            self.line_text.insert(tk.END, f"Unable to read the output: "
+                                          f"{result['error']}")
+            return
+        header = f"{run['run_dir'] or ''}"
+        if run["error"]:
+            header += f"\n{run['error']}"
+        self.line_text.insert(tk.END, header + "\n\n")
+        for line_no, stream, line in result["lines"]:
+            self.line_text.insert(tk.END, f"{line_no + 1:>8} {line}\n",
+                                  (stream,))
+
+    def destroy(self):
+        if self.store is not None:
+            self.store.close()
+        super().destroy()
@@ -0,0 +1,37 @@
+"""
+Starts a procedure with a lower priority and a limit on its address space,
+see `supervisor.Supervisor.launcher`
+
+Called as `limitexec.py <nice> <memory limit> command...`, where `-` stands
+for no limit. The limits are applied to this process, which then replaces
+itself with the command, so the procedure and everything it starts run
+with them from the first instruction on. Setting them in the GUI process
+between fork and exec is not safe while other threads run. This file must
+not import anything from ntu_daq_gui, so that it starts quickly.
+"""
+import os
+import resource
+import sys
+
+
+def main():
+    nice, memory_limit, *command = sys.argv[1:]
+    try:
+        if nice != "-":
+            os.setpriority(os.PRIO_PROCESS, 0, int(nice))
+        if memory_limit != "-":
+            resource.setrlimit(resource.RLIMIT_AS,
+                               (int(memory_limit), int(memory_limit)))
+    except (OSError, ValueError) as e:
+        # stderr is the output of the job
+        print(f"Unable to limit the resources of the procedure: {e}",
+              file=sys.stderr, flush=True)
+    try:
+        os.execvp(command[0], command)
+    except OSError as e:
+        print(f"Unable to start {command[0]}: {e}", file=sys.stderr)
+        sys.exit(127)
+
+
+if __name__ == "__main__":
+    main()
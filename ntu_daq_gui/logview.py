@@ -0,0 +1,654 @@
+import os
+import re
+import struct
+import tempfile
+import threading
+import tkinter as tk
+from collections import deque
+from itertools import islice
+from tkinter import ttk
+from typing import Deque, List, Optional, Tuple
+
+from ntu_daq_gui.executor import STDERR, STDOUT
+
+INFO = 0
+WARNING = 1
+ERROR = 2
+SEVERITIES = {"all": INFO, "warning": WARNING, "error": ERROR}
+
+# byte offset of a line in the spill file
+OFFSET = struct.Struct('<Q')
+
+
+def line_info(text: str, tag: Optional[str]) -> int:
+    """
+    The stream and severity of a line as one small number: the severity
+    the line reports, shifted by one, and whether it went to stderr
+    """
+    # plain substring tests, a regular expression takes ten times as long
+    # and this runs for every line that is logged
+    lower = text.lower()
+    if "error" in lower or "fail" in lower or "fatal" in lower or \
+            "critical" in lower or "exception" in lower or \
+            "traceback" in lower:
+        severity = ERROR
+    elif "warn" in lower:
+        severity = WARNING
+    else:
+        severity = INFO
+    return severity << 1 | (tag == STDERR)
+
+
+def parse_record(record: str) -> Tuple[int, Optional[str], str]:
+    """
+    The stream and severity (see `line_info`), the tag and the text of a
+    record of the spill file, the stream and severity are a single digit
+    """
+    tag, text = record[1:].split('\t', 1)
+    return int(record[0]), tag or None, text
+
+
+class LineSpill:
+    """
+    Append-only file that keeps every line of the log on disk
+
+    Every line is stored with its stream and severity (see `line_info`)
+    and its tag. The byte offset of every `stride`-th line goes to a second
+    file, so that a range of lines can be read back without scanning the
+    log and the memory used does not grow with the length of the log.
+    """
+
+    def __init__(self, stride: int = 256):
+        self.stride = stride
+        self.file = tempfile.TemporaryFile()
+        # the offsets are read back with positional reads, so they are
+        # written unbuffered
+        self.offsets = tempfile.TemporaryFile(buffering=0)
+        self.line_count = 0
+        self.size = 0
+
+    def append(self, text: str, tag: Optional[str], info: int = 0):
+        if self.line_count % self.stride == 0:
+            self.offsets.write(OFFSET.pack(self.size))
+        record = f"{info}{tag or ''}\t{text}\n".encode('utf-8', 'replace')
+        self.file.write(record)
+        self.size += len(record)
+        self.line_count += 1
+
+    def read(self, start: int, stop: int) -> List[Tuple[str, Optional[str]]]:
+        """
+        Read the lines [start, stop) back from disk
+        """
+        stop = min(stop, self.line_count)
+        if start >= stop:
+            return []
+        self.file.flush()
+        offset, = OFFSET.unpack(os.pread(
+            self.offsets.fileno(), OFFSET.size,
+            start // self.stride * OFFSET.size))
+        self.file.seek(offset)
+        for _ in range(start % self.stride):
+            self.file.readline()
+        lines = []
+        for _ in range(stop - start):
+            _, tag, text = parse_record(self.file.readline().decode('utf-8'))
+            lines.append((text[:-1], tag))
+        self.file.seek(0, 2)
+        return lines
+
+    def clear(self):
+        self.file.seek(0)
+        self.file.truncate()
+        self.offsets.seek(0)
+        self.offsets.truncate()
+        self.line_count = 0
+        self.size = 0
+
+    def close(self):
+        self.file.close()
+        self.offsets.close()
+
+
+class LineFilter:
+    """
+    Which lines of the log to show: the ones that contain `pattern` (a
+    regular expression if `regex` is set, plain text otherwise), that went
+    to `stream` and that report at least `severity`
+    """
+
+    def __init__(self, pattern: str = "", regex: bool = False,
+                 stream: Optional[str] = None, severity: int = INFO):
+        self.text = pattern
+        self.literal = not regex
+        # raises re.error for an invalid expression
+        self.pattern = re.compile(pattern if regex else re.escape(pattern),
+                                  re.IGNORECASE) if pattern else None
+        self.stream = stream
+        self.severity = severity
+
+    def accepts(self, info: int) -> bool:
+        """
+        Whether the stream and severity of the line pass
+        """
+        if self.stream == STDERR and not info & 1:
+            return False
+        if self.stream == STDOUT and info & 1:
+            return False
+        return info >> 1 >= self.severity
+
+    def matches(self, text: str, info: int) -> bool:
+        return self.accepts(info) and (
+            self.pattern is None or self.pattern.search(text) is not None)
+
+
+class LogSearch:
+    """
+    The lines of a LogView that pass a filter
+
+    The lines that were logged before the search started are scanned once,
+    from the spill file, by a thread of its own; the stream and severity
+    of every line are stored with it, so only the text of the lines that
+    pass them is matched. Lines logged later are checked as they are
+    appended. `take` returns the matches in the order of the log, the scan
+    results first, as they are found.
+
+    At most about `max_pending` matches wait to be taken: the scan pauses
+    until they are, and matches of appended lines beyond that are only
+    counted in `dropped`, as the lines can not wait.
+    """
+
+    def __init__(self, line_filter: LineFilter, spill: LineSpill,
+                 stop: int, block_size: int = 1 << 20,
+                 max_pending: int = 100000):
+        self.filter = line_filter
+        self.spill = spill
+        # the lines [0, stop) are scanned, the later ones checked on append
+        self.stop = stop
+        self.size = spill.size
+        self.block_size = block_size
+        self.scanned = 0
+        # counted apart, the scan and the checks run in different threads
+        self.scan_matches = 0
+        self.live_matches = 0
+        self.max_pending = max_pending
+        self.found: Deque[Tuple[int, str, Optional[str]]] = deque()
+        self.live: Deque[Tuple[int, str, Optional[str]]] = deque()
+        self.dropped = 0
+        # notified when matches were taken
+        self.taken = threading.Condition()
+        self.error: Optional[str] = None
+        self.cancelled = threading.Event()
+        self.scan_done = threading.Event()
+        # the spill file is read with positional reads, which do not move
+        # the offset the LogView writes at
+        spill.file.flush()
+        self.thread = threading.Thread(target=self.scan, daemon=True)
+        self.thread.start()
+
+    def scan(self):
+        try:
+            fd = self.spill.file.fileno()
+            offset, line_no, rest = 0, 0, b""
+            while offset < self.size and not self.cancelled.is_set():
+                block = os.pread(fd, min(self.block_size,
+                                         self.size - offset), offset)
+                if not block:
+                    break
+                offset += len(block)
+                end = block.rfind(b"\n") + 1
+                data, rest = rest + block[:end], block[end:]
+                if not data:
+                    continue
+                chunk = data.decode('utf-8')
+                if self.filter.literal and self.filter.pattern is not None:
+                    found = self.find_text(chunk, line_no)
+                    line_no += chunk.count("\n")
+                else:
+                    found = []
+                    for record in chunk.split("\n")[:-1]:
+                        if self.filter.accepts(int(record[0])):
+                            _, tag, text = parse_record(record)
+                            if self.filter.pattern is None or \
+                                    self.filter.pattern.search(text):
+                                found.append((line_no, text, tag))
+                        line_no += 1
+                with self.taken:
+                    while len(self.found) >= self.max_pending and \
+                            not self.cancelled.is_set():
+                        self.taken.wait(0.1)
+                self.found.extend(found)
+                self.scan_matches += len(found)
+                self.scanned = line_no
+        except (OSError, ValueError) as e:
+            self.error = str(e)
+        finally:
+            self.scan_done.set()
+
+    def find_text(self, chunk: str, line_no: int) \
+            -> List[Tuple[int, str, Optional[str]]]:
+        """
+        The matches of a plain text filter in a chunk of the spill file that
+        starts with the line `line_no`, only the lines where the text
+        occurs are looked at
+        """
+        found = []
+        position = 0
+        for start in self.text_lines(chunk):
+            line_no += chunk.count("\n", position, start)
+            position = start
+            info, tag, text = parse_record(
+                chunk[start:chunk.index("\n", start)])
+            if self.filter.matches(text, info):
+                found.append((line_no, text, tag))
+        return found
+
+    def text_lines(self, chunk: str):
+        """
+        The offsets of the lines of the chunk that contain the text
+        """
+        if chunk.isascii():
+            # lower case keeps the offsets of ASCII text and a plain find is
+            # many times faster than a case insensitive regular expression
+            haystack = chunk.lower()
+            needle = self.filter.text.lower()
+            index = haystack.find(needle)
+            while index >= 0:
+                start = haystack.rfind("\n", 0, index) + 1
+                yield start
+                index = haystack.find(needle, haystack.index("\n", index))
+        else:
+            checked = -1
+            for match in self.filter.pattern.finditer(chunk):
+                start = chunk.rfind("\n", 0, match.start()) + 1
+                if start != checked:
+                    checked = start
+                    yield start
+
+    def check(self, line_no: int, text: str, tag: Optional[str], info: int):
+        """
+        Check a line that was appended to the log after the search started
+        """
+        if self.filter.matches(text, info):
+            if len(self.live) < self.max_pending:
+                self.live.append((line_no, text, tag))
+            else:
+                self.dropped += 1
+            self.live_matches += 1
+
+    def take(self, max_lines: int = 1000) \
+            -> List[Tuple[int, str, Optional[str]]]:
+        """
+        The next matches in the order of the log
+        """
+        # whatever the scan finds is in `found` before it is done
+        done = self.scan_done.is_set()
+        lines = []
+        while self.found and len(lines) < max_lines:
+            lines.append(self.found.popleft())
+        if lines:
+            with self.taken:
+                self.taken.notify()
+        if done:
+            while self.live and len(lines) < max_lines:
+                lines.append(self.live.popleft())
+        return lines
+
+    @property
+    def match_count(self) -> int:
+        return self.scan_matches + self.live_matches
+
+    @property
+    def progress(self) -> float:
+        return self.scanned / self.stop if self.stop else 1.0
+
+    def cancel(self):
+        self.cancelled.set()
+        with self.taken:
+            self.taken.notify()
+        self.thread.join()
+
+
+class LogView(ttk.Frame):
+    """
+    Text widget for logs of unbounded length with bounded memory use
+
+    At most `capacity` lines are held in the text widget and in the ring
+    buffer of the most recent lines, everything else lives in a spill file
+    on disk. Appended lines are inserted in batches, at most once every
+    `frame_interval` ms. When the user scrolls to the top of the widget
+    older lines are paged back in from disk, when scrolling back down the
+    view returns to the live end of the log. The stream and severity of
+    every line are stored with it in the spill file, which lets
+    `start_search` filter the log without reading it back into memory.
+    """
+
+    def __init__(self, parent, capacity: int = 5000, page_size: int = 500,
+                 frame_interval: int = 30, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.capacity = capacity
+        self.page_size = page_size
+        self.frame_interval = frame_interval
+        self.tail: Deque[Tuple[str, Optional[str]]] = deque(maxlen=capacity)
+        self.spill = LineSpill()
+        self.search: Optional[LogSearch] = None
+        self.total_lines = 0
+        # lines that were appended but are not yet in the widget
+        self.pending = 0
+        # the widget shows the absolute lines [shown_first, shown_stop)
+        self.shown_first = 0
+        self.shown_stop = 0
+        # if the widget shows the most recent lines, new lines are inserted
+        self.live = True
+        self.flush_scheduled = False
+        self.paging = False
+
+        self.text = tk.Text(self, wrap='none')
+        self.scrollbar = ttk.Scrollbar(self, orient='vertical',
+                                       command=self.text.yview)
+        self.text.configure(yscrollcommand=self.on_scroll)
+        self.text.grid(row=0, column=0, sticky='nsew')
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.text.tag_configure('found', background='yellow')
+        self.bind('<Destroy>', lambda e: self.close()
+                  if e.widget is self else None)
+
+    def tag_configure(self, tag: str, **options):
+        self.text.tag_configure(tag, **options)
+
+    def append(self, text: str, tag: Optional[str] = None):
+        """
+        Append text to the log, a trailing newline is implied
+        """
+        if text.endswith('\n'):
+            text = text[:-1]
+        line_no = self.total_lines
+        for line in text.split('\n'):
+            info = line_info(line, tag)
+            self.tail.append((line, tag))
+            self.spill.append(line, tag, info)
+            if self.search is not None:
+                self.search.check(line_no, line, tag, info)
+            line_no += 1
+        added = text.count('\n') + 1
+        self.total_lines += added
+        if self.live:
+            self.pending = min(self.pending + added, self.capacity)
+            if not self.flush_scheduled:
+                self.flush_scheduled = True
+                self.after(self.frame_interval, self.flush)
+
+    def clear(self):
+        self.text.delete('1.0', 'end')
+        self.tail.clear()
+        if self.search is not None:
+            self.search.cancel()
+        self.spill.clear()
+        self.total_lines = self.pending = 0
+        self.shown_first = self.shown_stop = 0
+        self.live = True
+        if self.search is not None:
+            self.start_search(self.search.filter)
+
+    def close(self):
+        self.stop_search()
+        self.spill.close()
+
+    def start_search(self, line_filter: LineFilter) -> LogSearch:
+        """
+        Find the lines that pass the filter, the ones logged so far and the
+        ones that are appended from now on
+        """
+        self.stop_search()
+        self.search = LogSearch(line_filter, self.spill, self.total_lines)
+        return self.search
+
+    def stop_search(self):
+        if self.search is not None:
+            self.search.cancel()
+            self.search = None
+
+    def goto(self, line: int):
+        """
+        Show the page of the log around a line and highlight it
+        """
+        if not 0 <= line < self.total_lines:
+            return
+        self.paging = True
+        start = max(0, line - self.page_size // 2)
+        stop = min(self.total_lines, start + self.page_size)
+        self.text.delete('1.0', 'end')
+        self.insert_lines('end', self.spill.read(start, stop))
+        self.shown_first, self.shown_stop = start, stop
+        self.pending = 0
+        self.live = stop == self.total_lines
+        index = f'{line - start + 1}.0'
+        self.text.tag_add('found', index, f'{index} lineend')
+        self.text.see(index)
+        self.after_idle(self.end_paging)
+
+    def end_paging(self):
+        self.paging = False
+
+    def flush(self):
+        """
+        Insert the pending lines into the widget and trim the oldest ones
+        """
+        self.flush_scheduled = False
+        if not self.live or self.pending == 0:
+            return
+        at_end = self.text.yview()[1] >= 1.0
+        count = self.pending
+        self.pending = 0
+        new_lines = islice(self.tail, len(self.tail) - count, None)
+        shown = self.shown_stop - self.shown_first
+        excess = shown + count - self.capacity
+        if excess > 0:
+            self.delete_lines_from_top(excess)
+            shown -= excess
+        self.insert_lines('end', new_lines)
+        # more lines than fit into the widget may have been appended since
+        # the last flush, so the shown range is derived from the end
+        self.shown_stop = self.total_lines
+        self.shown_first = self.total_lines - shown - count
+        if at_end:
+            self.text.see('end')
+
+    def insert_lines(self, index: str, lines):
+        """
+        Insert the lines with one insert per run of lines with the same tag
+        """
+        args = []
+        chunk, chunk_tag = [], None
+        for text, tag in lines:
+            if tag != chunk_tag and chunk:
+                args.extend(("".join(chunk), chunk_tag or ()))
+                chunk = []
+            chunk_tag = tag
+            chunk.append(text + '\n')
+        if chunk:
+            args.extend(("".join(chunk), chunk_tag or ()))
+        if args:
+            # the text widget always ends in a newline, so lines inserted at
+            # the end go before it
+            self.text.insert('end - 1 chars' if index == 'end' else index,
+                             *args)
+
+    def delete_lines_from_top(self, count: int):
+        count = min(count, self.shown_stop - self.shown_first)
+        self.text.delete('1.0', f'{count + 1}.0')
+        self.shown_first += count
+
+    def delete_lines_from_bottom(self, count: int):
+        count = min(count, self.shown_stop - self.shown_first)
+        shown = self.shown_stop - self.shown_first
+        self.text.delete(f'{shown - count + 1}.0', 'end - 1 chars')
+        self.shown_stop -= count
+
+    def on_scroll(self, first: str, last: str):
+        self.scrollbar.set(first, last)
+        if self.paging:
+            return
+        if float(first) <= 0.0 and self.shown_first > 0:
+            self.paging = True
+            self.after_idle(self.page_up)
+        elif float(last) >= 1.0 and not self.live:
+            self.paging = True
+            self.after_idle(self.page_down)
+
+    def page_up(self):
+        """
+        Insert the page of lines before the first shown line from disk
+        """
+        start = max(0, self.shown_first - self.page_size)
+        lines = self.spill.read(start, self.shown_first)
+        self.live = False
+        self.pending = 0
+        self.insert_lines('1.0', lines)
+        self.shown_first = start
+        excess = self.shown_stop - self.shown_first - self.capacity
+        if excess > 0:
+            self.delete_lines_from_bottom(excess)
+        # keep the line that was at the top before in view
+        self.text.yview(f'{len(lines) + 1}.0')
+        self.paging = False
+
+    def page_down(self):
+        """
+        Append the page of lines after the last shown line from disk and
+        return to live mode once the end of the log is reached
+        """
+        stop = min(self.total_lines, self.shown_stop + self.page_size)
+        lines = self.spill.read(self.shown_stop, stop)
+        top = self.text.index('@0,0')
+        self.insert_lines('end', lines)
+        self.shown_stop = stop
+        excess = self.shown_stop - self.shown_first - self.capacity
+        if excess > 0:
+            self.delete_lines_from_top(excess)
+            line = max(1, int(top.split('.')[0]) - excess)
+            self.text.yview(f'{line}.0')
+        self.live = self.shown_stop == self.total_lines
+        self.paging = False
+
+
+class LogFilterBar(ttk.Frame):
+    """
+    Filter bar of a LogView that lists the matching lines below it
+
+    The filter applies as it is typed, once the typing pauses for `delay`
+    ms. The search of the lines logged so far runs in the background and
+    its results are listed as they are found; new lines that match are
+    added as they arrive. A double click on a result shows the line in the
+    log.
+    """
+    streams = {"all": None, "stdout": STDOUT, "stderr": STDERR}
+    delay = 250
+    poll_interval = 100
+
+    def __init__(self, parent, log_view: LogView, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.log_view = log_view
+        self.search: Optional[LogSearch] = None
+        self.apply_scheduled: Optional[str] = None
+        self.polling = False
+
+        controls = ttk.Frame(self)
+        controls.grid(row=0, column=0, sticky='ew')
+        ttk.Label(controls, text="Filter").pack(side='left')
+        self.pattern_var = tk.StringVar()
+        ttk.Entry(controls, textvariable=self.pattern_var, width=30).pack(
+            side='left', padx=3)
+        self.regex_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls, text="Regex",
+                        variable=self.regex_var).pack(side='left')
+        self.stream_var = tk.StringVar(value="all")
+        ttk.Combobox(controls, textvariable=self.stream_var, width=7,
+                     values=list(self.streams), state='readonly').pack(
+            side='left', padx=3)
+        self.severity_var = tk.StringVar(value="all")
+        ttk.Combobox(controls, textvariable=self.severity_var, width=8,
+                     values=list(SEVERITIES), state='readonly').pack(
+            side='left', padx=3)
+        ttk.Button(controls, text="Clear", command=self.clear).pack(
+            side='left')
+        self.status = ttk.Label(controls, text="")
+        self.status.pack(side='left', padx=5)
+        for var in (self.pattern_var, self.regex_var, self.stream_var,
+                    self.severity_var):
+            var.trace_add('write', self.schedule_apply)
+
+        self.results = LogView(self, capacity=2000)
+        self.results.tag_configure(STDERR, foreground="red")
+        self.results.text.configure(height=10)
+        self.results.text.bind('<Double-1>', self.show_result)
+        self.columnconfigure(0, weight=1)
+
+    def schedule_apply(self, *args):
+        if self.apply_scheduled is not None:
+            self.after_cancel(self.apply_scheduled)
+        self.apply_scheduled = self.after(self.delay, self.apply)
+
+    def clear(self):
+        self.pattern_var.set("")
+        self.regex_var.set(False)
+        self.stream_var.set("all")
+        self.severity_var.set("all")
+
+    def apply(self):
+        self.apply_scheduled = None
+        pattern = self.pattern_var.get()
+        stream = self.streams[self.stream_var.get()]
+        severity = SEVERITIES[self.severity_var.get()]
+        if not pattern and stream is None and severity == INFO:
+            self.log_view.stop_search()
+            self.search = None
+            self.results.grid_remove()
+            self.status.configure(text="")
+            return
+        try:
+            line_filter = LineFilter(pattern, self.regex_var.get(), stream,
+                                     severity)
+        except re.error as e:
+            self.status.configure(text=f"Invalid expression: {e}")
+            return
+        self.search = self.log_view.start_search(line_filter)
+        self.results.clear()
+        self.results.grid(row=1, column=0, sticky='nsew')
+        if not self.polling:
+            self.polling = True
+            self.poll()
+
+    def poll(self):
+        """
+        List the matches that were found since the last poll
+        """
+        if self.search is None:
+            self.polling = False
+            return
+        if self.log_view.search is not self.search:
+            # the log was cleared and the search started over
+            self.search = self.log_view.search
+            self.results.clear()
+            if self.search is None:
+                self.polling = False
+                return
+        for line_no, text, tag in self.search.take(5000):
+            self.results.append(f"{line_no + 1:>8}  {text}", tag)
+        status = f"{self.search.match_count} matching lines"
+        if self.search.dropped:
+            status += f", {self.search.dropped} not listed"
+        if self.search.error is not None:
+            status += f", the search failed: {self.search.error}"
+        elif not self.search.scan_done.is_set():
+            status += f", searching {self.search.progress:.0%}"
+        self.status.configure(text=status)
+        self.after(self.poll_interval, self.poll)
+
+    def show_result(self, event):
+        index = self.results.text.index(f'@{event.x},{event.y}')
+        line = self.results.text.get(f'{index} linestart',
+                                     f'{index} lineend').split(None, 1)
+        if line and line[0].isdigit():
+            self.log_view.goto(int(line[0]) - 1)
@@ -1,9 +1,79 @@
+import argparse
+import sys
+
 from ntu_daq_gui import config
-from ntu_daq_gui import gui
 
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="hgcal-mac-module-qa",
+        description="UI for automating parts of the data acquisition for "
+                    "MAC testing of HGCAL modules. With --headless the "
+                    "procedures are run without the UI.")
+    parser.add_argument("--config", help="configuration file to use instead "
+                        "of the one in the user configuration directory")
+    parser.add_argument("--headless", action="store_true",
+                        help="run the procedures without the UI and exit")
+    parser.add_argument("-p", "--procedure", action="append", default=[],
+                        help="name of a procedure to run, may be given "
+                        "several times, the procedures run in this order")
+    parser.add_argument("-x", "--hexacontroller", action="append", default=[],
+                        help="name of a Hexacontroller to run on, may be "
+                        "given several times (default: all)")
+    parser.add_argument("--summary", help="write the JSON summary to this "
+                        "file instead of stdout")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="do not echo the output of the procedures")
+    parser.add_argument("--campaign", metavar="MODULE_ID",
+                        help="with --headless, run the procedures as the "
+                        "QA campaign of this module, stopping at the first "
+                        "failed step")
+    parser.add_argument("--resume", action="store_true",
+                        help="with --campaign, skip the steps that already "
+                        "succeeded with the same inputs")
+    args = parser.parse_args(argv)
+    # the campaigns only run headless, the UI would ignore them
+    if args.campaign is not None and not args.headless:
+        parser.error("--campaign needs --headless")
+    if args.resume and args.campaign is None:
+        parser.error("--resume needs --campaign")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        if args.config is not None:
+            app_configuration = config.load_config(args.config)
+            config_file_path = args.config
+        else:
+            app_configuration, config_file_path = config.get_config()
+    except config.ConfigError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+
+    if args.headless:
+        from ntu_daq_gui import headless
+        if not args.procedure:
+            print("--headless needs at least one --procedure", file=sys.stderr)
+            sys.exit(2)
+        if args.campaign is not None:
+            from ntu_daq_gui import campaign
+            sys.exit(campaign.run_campaign(
+                app_configuration, args.campaign, args.procedure,
+                args.hexacontroller, args.resume, args.summary,
+                echo=not args.quiet))
+        sys.exit(headless.run_headless(
+            app_configuration, args.procedure, args.hexacontroller,
+            args.summary, echo=not args.quiet))
+
+    # the GUI is only imported when it is used, so the headless mode also
+    # works on machines without a display
+    from ntu_daq_gui import gui
     print("Hello")
-    app_configuration, config_file_path = config.get_config()
     ui = gui.GUI(app_configuration, config_file_path)
     ui.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, NamedTuple, Optional
+
+from ntu_daq_gui.executor import STDOUT, STDERR
+
+# the phases of a run in the order they happen
+PHASES = ("connect", "startup", "servers", "procedure", "shutdown")
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Span(NamedTuple):
+    phase: str
+    start: float
+    end: float
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class RunMetrics:
+    """
+    Timing of the phases of a single run and the amount of output it made
+    """
+
+    def __init__(self, labels: Optional[Dict[str, str]] = None):
+        self.labels = labels if labels is not None else {}
+        self.spans: List[Span] = []
+        self.lines = {STDOUT: 0, STDERR: 0}
+        self.bytes = {STDOUT: 0, STDERR: 0}
+        # the phase the run is in right now
+        self.current: Optional[str] = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Record the time spent in the with block as the phase `name`, also
+        if the block raises
+        """
+        start = time.time()
+        self.current = name
+        try:
+            yield
+        finally:
+            self.current = None
+            with self.lock:
+                self.spans.append(Span(name, start, time.time()))
+
+    def count(self, stream: str, line: str):
+        self.lines[stream] = self.lines.get(stream, 0) + 1
+        self.bytes[stream] = self.bytes.get(stream, 0) + \
+            len(line.encode('utf-8', 'replace'))
+
+    def durations(self) -> Dict[str, float]:
+        """
+        Time spent in every phase, a phase may be entered more than once
+        """
+        durations: Dict[str, float] = {}
+        with self.lock:
+            for span in self.spans:
+                durations[span.phase] = \
+                    durations.get(span.phase, 0.0) + span.duration
+        return durations
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            spans = [{"phase": s.phase, "start": s.start, "end": s.end,
+                      "duration": s.duration} for s in self.spans]
+        return {
+            "labels": self.labels,
+            "spans": spans,
+            "durations": self.durations(),
+            "lines": dict(self.lines),
+            "bytes": dict(self.bytes),
+        }
+
+    def write_json(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class MetricsRegistry:
+    """
+    Aggregates the metrics of the last `window` runs
+
+    The aggregate is available as percentiles per phase and can be written
+    as a Prometheus text file, e.g. for the textfile collector of the node
+    exporter.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.runs: Deque[RunMetrics] = deque(maxlen=window)
+        self.run_states: Dict[str, int] = {}
+        # totals are kept over all runs, as counters must not go down
+        self.lines_total = {STDOUT: 0, STDERR: 0}
+        self.bytes_total = {STDOUT: 0, STDERR: 0}
+
+    def add(self, run: RunMetrics, state: str):
+        self.runs.append(run)
+        self.run_states[state] = self.run_states.get(state, 0) + 1
+        for stream in run.lines:
+            self.lines_total[stream] = \
+                self.lines_total.get(stream, 0) + run.lines[stream]
+            self.bytes_total[stream] = \
+                self.bytes_total.get(stream, 0) + run.bytes[stream]
+
+    def phase_durations(self) -> Dict[str, List[float]]:
+        durations: Dict[str, List[float]] = {}
+        for run in self.runs:
+            for phase, duration in run.durations().items():
+                durations.setdefault(phase, []).append(duration)
+        return durations
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        count, mean, percentiles and maximum of the duration of every phase
+        """
+        summary = {}
+        for phase, durations in self.phase_durations().items():
+            summary[phase] = {
+                "count": len(durations),
+                "mean": sum(durations) / len(durations),
+                "max": max(durations),
+            }
+            for q in QUANTILES:
+                summary[phase][f"p{int(q * 100)}"] = percentile(durations, q)
+        return summary
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP hgcal_qa_phase_duration_seconds Duration of the phases "
+            "of the recent runs",
+            "# TYPE hgcal_qa_phase_duration_seconds summary",
+        ]
+        for phase, durations in sorted(self.phase_durations().items()):
+            for q in QUANTILES:
+                lines.append(
+                    f'hgcal_qa_phase_duration_seconds{{phase="{phase}",'
+                    f'quantile="{q}"}} {percentile(durations, q):.6f}')
+            lines.append(f'hgcal_qa_phase_duration_seconds_sum'
+                         f'{{phase="{phase}"}} {sum(durations):.6f}')
+            lines.append(f'hgcal_qa_phase_duration_seconds_count'
+                         f'{{phase="{phase}"}} {len(durations)}')
+        lines.append("# HELP hgcal_qa_runs_total Finished runs by state")
+        lines.append("# TYPE hgcal_qa_runs_total counter")
+        for state, count in sorted(self.run_states.items()):
+            lines.append(f'hgcal_qa_runs_total{{state="{state}"}} {count}')
+        lines.append("# HELP hgcal_qa_output_lines_total Lines of output")
+        lines.append("# TYPE hgcal_qa_output_lines_total counter")
+        for stream, count in sorted(self.lines_total.items()):
+            lines.append(
+                f'hgcal_qa_output_lines_total{{stream="{stream}"}} {count}')
+        lines.append("# HELP hgcal_qa_output_bytes_total Bytes of output")
+        lines.append("# TYPE hgcal_qa_output_bytes_total counter")
+        for stream, count in sorted(self.bytes_total.items()):
+            lines.append(
+                f'hgcal_qa_output_bytes_total{{stream="{stream}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """
+        Write the metrics atomically, so a scraper never sees a partial file
+        """
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # hidden, and removed if the write fails, so that nothing piles up
+        # in the collector directory
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-",
+                                        suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.to_prometheus())
+            # mkstemp creates the file readable by the owner only, the
+            # exporter may run as another user
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
@@ -0,0 +1,169 @@
+import itertools
+import tkinter as tk
+from tkinter import ttk
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class DecimatedSeries:
+    """
+    A series of (x, y) points in a bounded buffer
+
+    The points are collected in at most `capacity` buckets that each keep
+    the range of x and the minimum and maximum of y of the points in it.
+    Once all buckets are in use, neighbouring buckets are merged in pairs
+    and every bucket takes twice as many points from then on. Adding a
+    point is O(1) amortized and the memory use and the cost of drawing the
+    series do not depend on the number of points, while spikes remain
+    visible. The x values are expected to grow, e.g. time or a channel
+    number that is scanned in order.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        # an even capacity, so that the buckets can always be merged in pairs
+        self.capacity = max(2, capacity - capacity % 2)
+        self.bucket_size = 1
+        # [x_first, x_last, y_min, y_max, count]
+        self.buckets: List[List[float]] = []
+        self.points = 0
+
+    def add(self, x: float, y: float):
+        self.points += 1
+        if self.buckets and self.buckets[-1][4] < self.bucket_size:
+            bucket = self.buckets[-1]
+            bucket[1] = x
+            bucket[2] = min(bucket[2], y)
+            bucket[3] = max(bucket[3], y)
+            bucket[4] += 1
+            return
+        if len(self.buckets) == self.capacity:
+            self.merge()
+        self.buckets.append([x, x, y, y, 1])
+
+    def merge(self):
+        merged = []
+        for first, second in zip(self.buckets[::2], self.buckets[1::2]):
+            merged.append([first[0], second[1], min(first[2], second[2]),
+                           max(first[3], second[3]), first[4] + second[4]])
+        self.buckets = merged
+        self.bucket_size *= 2
+
+    def bounds(self) -> Optional[Tuple[float, float, float, float]]:
+        """
+        (x_min, x_max, y_min, y_max) of all points, None if there are none
+        """
+        if not self.buckets:
+            return None
+        return (self.buckets[0][0], self.buckets[-1][1],
+                min(b[2] for b in self.buckets),
+                max(b[3] for b in self.buckets))
+
+
+class PlotView(ttk.Frame):
+    """
+    Live line plot of several series on a Tk Canvas
+
+    The series are kept decimated (see DecimatedSeries), so a redraw costs
+    the same after a million points as after a thousand. Added points only
+    mark the plot as changed, it is redrawn at most once every
+    `frame_interval` ms.
+    """
+
+    colors = ("royalblue", "firebrick", "forestgreen", "darkorange",
+              "purple", "teal", "saddlebrown", "deeppink")
+    margin = 50
+
+    def __init__(self, parent, capacity: int = 1024,
+                 frame_interval: int = 100, *args, **kwargs):
+        super().__init__(parent, *args, **kwargs)
+        self.capacity = capacity
+        self.frame_interval = frame_interval
+        self.series: Dict[Hashable, DecimatedSeries] = {}
+        self.labels: Dict[Hashable, str] = {}
+        self.lines: Dict[Hashable, int] = {}
+        self.color_cycle = itertools.cycle(self.colors)
+        self.redraw_scheduled = False
+
+        self.canvas = tk.Canvas(self, height=200, background="white",
+                                highlightthickness=0)
+        self.canvas.pack(fill='both', expand=True)
+        self.canvas.bind('<Configure>', lambda e: self.schedule_redraw())
+
+    def add_point(self, key: Hashable, x: float, y: float,
+                  label: Optional[str] = None):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = DecimatedSeries(self.capacity)
+            self.labels[key] = label if label is not None else str(key)
+            self.lines[key] = self.canvas.create_line(
+                0, 0, 0, 0, fill=next(self.color_cycle), tags=("series",))
+        series.add(x, y)
+        self.schedule_redraw()
+
+    def remove_series(self, key: Hashable):
+        if key in self.series:
+            del self.series[key]
+            del self.labels[key]
+            self.canvas.delete(self.lines.pop(key))
+            self.schedule_redraw()
+
+    def clear(self):
+        for key in list(self.series):
+            self.remove_series(key)
+
+    def schedule_redraw(self):
+        if not self.redraw_scheduled:
+            self.redraw_scheduled = True
+            self.after(self.frame_interval, self.redraw)
+
+    def redraw(self):
+        """
+        Move the lines of the series to the current scale and redraw the
+        axes and the legend
+        """
+        self.redraw_scheduled = False
+        self.canvas.delete("axes")
+        bounds = [b for b in (s.bounds() for s in self.series.values())
+                  if b is not None]
+        if not bounds:
+            return
+        x_min = min(b[0] for b in bounds)
+        x_max = max(b[1] for b in bounds)
+        y_min = min(b[2] for b in bounds)
+        y_max = max(b[3] for b in bounds)
+        x_span = (x_max - x_min) or 1.0
+        y_span = (y_max - y_min) or 1.0
+        width = self.canvas.winfo_width()
+        height = self.canvas.winfo_height()
+        left, right = self.margin, max(self.margin + 1, width - 10)
+        top, bottom = 10, max(11, height - 20)
+
+        def to_x(x):
+            return left + (x - x_min) / x_span * (right - left)
+
+        def to_y(y):
+            return bottom - (y - y_min) / y_span * (bottom - top)
+
+        for key, series in self.series.items():
+            coords = []
+            # every bucket is drawn as a vertical stroke from its minimum
+            # to its maximum, joined to the next one
+            for x_first, x_last, low, high, _ in series.buckets:
+                coords.extend((to_x(x_first), to_y(low),
+                               to_x(x_last), to_y(high)))
+            if len(coords) == 2:
+                coords.extend(coords)
+            self.canvas.coords(self.lines[key], *coords)
+
+        self.canvas.create_rectangle(left, top, right, bottom, tags=("axes",))
+        for text, x, y, anchor in (
+                (f"{y_max:.4g}", left - 4, top, tk.E),
+                (f"{y_min:.4g}", left - 4, bottom, tk.E),
+                (f"{x_min:.4g}", left, bottom + 2, tk.NW),
+                (f"{x_max:.4g}", right, bottom + 2, tk.NE)):
+            self.canvas.create_text(x, y, text=text, anchor=anchor,
+                                    font=("TkDefaultFont", 8), tags=("axes",))
+        for i, (key, label) in enumerate(self.labels.items()):
+            self.canvas.create_text(
+                left + 6, top + 4 + 12 * i, text=label, anchor=tk.NW,
+                fill=self.canvas.itemcget(self.lines[key], "fill"),
+                font=("TkDefaultFont", 8), tags=("axes",))
@@ -0,0 +1,82 @@
+"""
+Body of the processes of the worker pool, see `workerpool.WorkerPool`
+
+The worker is started as a script with the marker token and the modules to
+import in advance as arguments. It reads one JSON request per line from
+stdin, runs the requested file as __main__ with the requested argv and
+writes the marker line `<token> END <exit code>` to stdout and stderr when
+the run is over. This file must not import anything from ntu_daq_gui, so
+that the procedures run in a clean interpreter.
+"""
+import importlib
+import json
+import os
+import runpy
+import sys
+import traceback
+
+
+def write_marker(fd, text):
+    os.write(fd, text.encode())
+
+
+def run(request):
+    """
+    Run the file like `python file argv...` would and return the exit code
+    """
+    path = request["file"]
+    sys.argv = list(request["argv"])
+    # a script finds the modules next to it, the worker's own directory
+    # must not be visible to it
+    sys.path[0] = os.path.dirname(os.path.abspath(path))
+    try:
+        runpy.run_path(path, run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # the frames of the worker and runpy are of no interest
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != path:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+        return 1
+
+
+def main():
+    token = sys.argv[1]
+    for module in sys.argv[2:]:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            print(f"Unable to import {module} in advance: {e}",
+                  file=sys.stderr)
+    # the requests arrive on stdin, the procedures get an empty stdin
+    control = os.fdopen(os.dup(0))
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.close(devnull)
+    sys.stdin = open(os.devnull)
+    cwd = os.getcwd()
+    write_marker(2, f"{token} READY\n")
+    write_marker(1, f"{token} READY\n")
+    for line in control:
+        exit_code = run(json.loads(line))
+        for stream in (sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__):
+            try:
+                stream.flush()
+            except (AttributeError, ValueError, OSError):
+                pass
+        os.chdir(cwd)
+        # the leading newline terminates a line the procedure left open
+        write_marker(2, f"\n{token} END {exit_code}\n")
+        write_marker(1, f"\n{token} END {exit_code}\n")
+
+
+if __name__ == "__main__":
+    main()
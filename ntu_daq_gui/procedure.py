@@ -4,20 +4,25 @@ from tkinter import filedialog
 from tkinter import simpledialog
 import json
 import os
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List, Optional
+
+from ntu_daq_gui import reconcile
 
 
 class Procedure:
     def __init__(self, name, executed_file,
                  options: Dict[str, Tuple[str, str]],
                  initial_dut_config,
-                 hostname_flag: str = "-i", port_flag: str = "-p"):
+                 hostname_flag: str = "-i", port_flag: str = "-p",
+                 extract: Optional[List[Dict]] = None):
         self.name = name
         self.executed_file = executed_file
         self.options = options
         self.initial_dut_config = initial_dut_config
         self.hostname_flag = hostname_flag
         self.port_flag = port_flag
+        # the rules that pick values out of the output, see extract.Extractor
+        self.extract = extract if extract is not None else []
         self.running = False
 
     def serialize(self):
@@ -25,7 +30,8 @@ class Procedure:
             'name': self.name,
             'executed_file': self.executed_file,
             'options': self.options,
-            'initial_dut_config': self.initial_dut_config
+            'initial_dut_config': self.initial_dut_config,
+            'extract': self.extract
         }
 
     @classmethod
@@ -34,7 +40,19 @@ class Procedure:
         return cls(data['name'],
                    data['executed_file'],
                    data['options'],
-                   data['initial_dut_config'])
+                   data['initial_dut_config'],
+                   extract=data.get('extract', []))
+
+    @classmethod
+    def load_from_config(cls, config: Dict):
+        """
+        given a config entry that matches the entry for a Procedure load it
+        """
+        return cls(config.get("name"),
+                   config.get("executed_file", ""),
+                   config.get("options", {}),
+                   config.get("initial_dut_config", ""),
+                   extract=config.get("extract", []))
 
     def add_option(self, name, flag, value):
         self.options[name] = (flag, value)
@@ -48,12 +66,13 @@ class Procedure:
         run_command_args.append(self.hostname_flag)
         run_command_args.append(hexctrl_hostname)
         run_command_args.append(self.port_flag)
-        run_command_args.append(hexctrl_port)
+        run_command_args.append(str(hexctrl_port))
         run_command_args.append("-f")
         run_command_args.append(self.initial_dut_config)
-        for option in self.options:
-            run_command_args.append(str(option[0]))
-            run_command_args.append(str(option[1]))
+        for flag, value in self.options.values():
+            run_command_args.append(str(flag))
+            run_command_args.append(str(value))
+        return run_command_args
 
 class OptionDialog(simpledialog.Dialog):
     def body(self, master):
@@ -190,40 +209,62 @@ class ProcedureConfigUI:
         self.options_frame.grid(columnspan=3)
         self.options_frame.grid_rowconfigure(0, weight=1)
         self.options_frame.grid_columnconfigure(0, weight=1)
+        self.option_headers = [
+            ttk.Label(self.options_frame, text="Description"),
+            ttk.Label(self.options_frame, text="Cmd Flag"),
+            ttk.Label(self.options_frame, text="Value"),
+        ]
+        # the rows of the options are keyed by the option name, the header
+        # takes up the first row
+        self.option_rows = reconcile.RowReconciler(
+            self.options_frame, self.create_option_entry,
+            self.update_option_entry, first_row=1)
         self.refresh_option_entries()
 
     def add_option(self):
         od = OptionDialog(self.parent)
         self.procedure.add_option(*od.result)
         self.refresh_option_entries()
+        self.notify_changed()
 
-    def create_option_entry(self, option_name, flag, value, idx):
-        option_label = ttk.Label(self.options_frame, text=f"{option_name}")
+    def create_option_entry(self, parent, option_name, flag_and_value, idx):
+        flag, value = flag_and_value
+        option_label = ttk.Label(parent, text=f"{option_name}")
         option_label.grid(row=idx, column=0)
-        flag_label = ttk.Label(self.options_frame, text=f"{flag}")
+        flag_label = ttk.Label(parent, text=f"{flag}")
         flag_label.grid(row=idx, column=1)
-        value_label = ttk.Label(self.options_frame, text=f"{value}")
+        value_label = ttk.Label(parent, text=f"{value}")
         value_label.grid(row=idx, column=2)
-        remove_button = ttk.Button(self.options_frame, text="Remove",
+        remove_button = ttk.Button(parent, text="Remove",
                                    command=lambda: self.remove_option(option_name))
         remove_button.grid(row=idx, column=3)
+        return [option_label, flag_label, value_label, remove_button]
+
+    @staticmethod
+    def update_option_entry(widgets, flag_and_value):
+        flag, value = flag_and_value
+        widgets[1].configure(text=f"{flag}")
+        widgets[2].configure(text=f"{value}")
 
     def remove_option(self, option_name):
         if option_name in self.procedure.options:
             del self.procedure.options[option_name]
             self.refresh_option_entries()
+            self.notify_changed()
 
     def refresh_option_entries(self):
-        for child in self.options_frame.winfo_children():
-            child.destroy()
-        if len(self.procedure.options) > 0:
-            ttk.Label(self.options_frame, text="Description").grid(
-                row=0, column=0)
-            ttk.Label(self.options_frame, text="Cmd Flag").grid(
-                row=0, column=1)
-            ttk.Label(self.options_frame, text="Value").grid(row=0, column=2)
-        for i, (option_name, (flag, value)) in enumerate(self.procedure.options.items()):
-            self.create_option_entry(option_name, flag, value, i+1)
+        for column, header in enumerate(self.option_headers):
+            if len(self.procedure.options) > 0:
+                header.grid(row=0, column=column)
+            else:
+                header.grid_remove()
+        self.option_rows.reconcile(
+            (option_name, tuple(flag_and_value)) for option_name,
+            flag_and_value in self.procedure.options.items())
+
+    def notify_changed(self):
+        # the window autosaves the configuration on this event
+        self.parent.event_generate("<<ConfigChanged>>")
 
     def check_file_exists(self, filepath):
         return os.path.isfile(filepath)
@@ -234,6 +275,7 @@ class ProcedureConfigUI:
             self.procedure.executed_file = file_path
             self.executed_file_entry.delete(0, tk.END)
             self.executed_file_entry.insert(tk.END, file_path)
+            self.notify_changed()
 
     def browse_initial_dut_config(self):
         file_path = filedialog.askopenfilename(
@@ -242,6 +284,7 @@ class ProcedureConfigUI:
             self.procedure.initial_dut_config = file_path
             self.init_config_entry.delete(0, tk.END)
             self.init_config_entry.insert(tk.END, file_path)
+            self.notify_changed()
 
 
 # Usage example:
@@ -0,0 +1,64 @@
+import tkinter as tk
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# create_row(parent, key, value, row) creates the widgets of a row, grids
+# them in the given row of the parent and returns them
+RowFactory = Callable[[tk.Widget, Hashable, Any, int], List[tk.Widget]]
+# update_row(widgets, value) updates the widgets of a row to a new value
+RowUpdater = Callable[[List[tk.Widget], Any], None]
+
+
+class RowReconciler:
+    """
+    Keeps the rows of widgets in a grid in sync with a list of keyed items
+
+    Instead of destroying and redrawing every row after each change, only
+    the rows of new keys are created, the rows of removed keys destroyed and
+    the rows whose position changed moved to their new grid row. Rows whose
+    value changed are handed to `update_row` if given, otherwise they are
+    recreated.
+    """
+
+    def __init__(self, parent: tk.Widget, create_row: RowFactory,
+                 update_row: Optional[RowUpdater] = None, first_row: int = 0):
+        self.parent = parent
+        self.create_row = create_row
+        self.update_row = update_row
+        self.first_row = first_row
+        self.rows: Dict[Hashable, List[tk.Widget]] = {}
+        self.values: Dict[Hashable, Any] = {}
+        self.positions: Dict[Hashable, int] = {}
+
+    def keys(self) -> List[Hashable]:
+        return sorted(self.positions, key=self.positions.get)
+
+    def reconcile(self, items: Iterable[Tuple[Hashable, Any]]):
+        items = list(items)
+        new_keys = {key for key, _ in items}
+        for key in [k for k in self.rows if k not in new_keys]:
+            self._destroy(key)
+        for position, (key, value) in enumerate(items):
+            row = self.first_row + position
+            if key in self.rows and self.values[key] != value:
+                if self.update_row is not None:
+                    self.update_row(self.rows[key], value)
+                    self.values[key] = value
+                else:
+                    self._destroy(key)
+            if key not in self.rows:
+                self.rows[key] = self.create_row(self.parent, key, value, row)
+                self.values[key] = value
+            elif self.positions[key] != row:
+                for widget in self.rows[key]:
+                    widget.grid_configure(row=row)
+            self.positions[key] = row
+
+    def _destroy(self, key: Hashable):
+        for widget in self.rows.pop(key):
+            widget.destroy()
+        del self.values[key]
+        del self.positions[key]
+
+    def clear(self):
+        for key in list(self.rows):
+            self._destroy(key)
@@ -1,11 +1,25 @@
+import os
+import queue
+import threading
+import time
 import tkinter as tk
-from typing import Tuple
+from typing import List, Tuple, TYPE_CHECKING
 from ntu_daq_gui import procedure as prc
 from ntu_daq_gui import hexacontroller as hx
-from ntu_daq_gui.gui import AppState
+from ntu_daq_gui import executor as ex
+from ntu_daq_gui import extract
+from ntu_daq_gui import scheduler as sched
+from ntu_daq_gui import logview
+from ntu_daq_gui import metrics
+from ntu_daq_gui import plot
+from ntu_daq_gui import servers
+from ntu_daq_gui import transfer
 from tkinter import ttk
 from copy import deepcopy
 
+if TYPE_CHECKING:
+    from ntu_daq_gui.gui import AppState
+
 
 class RunControlUI(ttk.Frame):
     """
@@ -14,12 +28,20 @@ class RunControlUI(ttk.Frame):
     is brought to completion
     """
 
-    def __init__(self, parent: ttk.Widget, state: AppState, *args, **kwargs):
+    # interval in ms in which the board health indicators are redrawn
+    health_interval = 1000
+    # interval in ms in which the progress of a data transfer is shown
+    transfer_interval = 500
+    health_colors = {None: "white", "down": "salmon",
+                     "servers down": "khaki", "up": "palegreen"}
+
+    def __init__(self, parent: ttk.Widget, state: "AppState", *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
         self.app_state = state
         self.procedure_var = tk.StringVar()
         self.hexa_var = tk.StringVar()
         self.create_widgets()
+        self.app_state.pump.subscribe(self.handle_events)
 
     def create_widgets(self):
         """
@@ -51,11 +73,13 @@ class RunControlUI(ttk.Frame):
 
 
         # Now we select the hexacontroller to run it on
+        # several hexacontrollers may be selected, the procedure is then run
+        # on all of them in parallel
         hexa_label = ttk.Label(left_frame, text="Selected Hexacontroller")
         hexa_label.grid(row=2, columnspan=1)
         self.hexa_selection = tk.Listbox(
             left_frame, height=5, listvariable=self.hexa_var,
-            selectbackground="lightblue",
+            selectbackground="lightblue", selectmode=tk.EXTENDED,
             exportselection=False)
         self.hexa_selection.grid(row=3, columnspan=1)
         self.hexa_selection.bind(
@@ -78,18 +102,93 @@ class RunControlUI(ttk.Frame):
         self.conn_indicator = tk.Label(
             self.conn_frame, width=5, height=1, bg="darkgray")
         self.conn_indicator.grid(row=0, column=2, padx=5, pady=5)
+        self.health_label = ttk.Label(self.conn_frame, text="")
+        self.health_label.grid(row=0, column=3, padx=5)
+        # the data of the selected board is copied in the background, so the
+        # next module can be set up meanwhile
+        self.fetch_button = ttk.Button(
+            self.conn_frame, text="Fetch Data", command=self.fetch_data)
+        self.fetch_button.grid(row=0, column=4, padx=5)
+        self.transfer_label = ttk.Label(self.conn_frame, text="")
+        self.transfer_label.grid(row=0, column=5, padx=5)
+        # the servers of the boards, started by hand instead of by a job
+        self.server_managers = {}
+        self.server_output = queue.Queue()
+        # the threads that run the shutdown commands of servers
+        self.server_stoppers: List[threading.Thread] = []
+        self.following_servers = False
+        ttk.Button(self.conn_frame, text="Start Servers",
+                   command=self.start_servers).grid(row=0, column=6, padx=5)
+        ttk.Button(self.conn_frame, text="Stop Servers",
+                   command=self.stop_servers).grid(row=0, column=7)
 
-        # Buttons to connect the hexacontroller and start running the procedure
-        run_button = ttk.Button(left_frame,
+        # Buttons to connect the hexacontroller and start running the procedure,
+        # the runs are recorded in the history with the module under test
+        run_frame = ttk.Frame(left_frame)
+        run_frame.grid(row=5, columnspan=1)
+        ttk.Label(run_frame, text="Module ID").grid(row=0, column=0)
+        self.module_var = tk.StringVar()
+        ttk.Entry(run_frame, textvariable=self.module_var, width=15).grid(
+            row=0, column=1, padx=5)
+        run_button = ttk.Button(run_frame,
                                 text="Run",
                                 command=self.run_procedure)
-        run_button.grid(row=5, columnspan=1)
+        run_button.grid(row=0, column=2)
+
+        # The jobs that have been submitted to the scheduler
+        job_columns = ("Procedure", "Hexacontroller", "State", "Progress")
+        self.job_tree = ttk.Treeview(
+            left_frame, columns=job_columns, show="headings", height=6)
+        for column in job_columns:
+            self.job_tree.heading(column, text=column)
+            self.job_tree.column(column, width=100)
+        self.job_tree.grid(row=6, columnspan=1, pady=5)
+        self.job_tree.bind("<<TreeviewSelect>>",
+                           lambda e: self.update_progress_bar())
+
+        # what the extraction rules of the procedures found in the output,
+        # the progress bar follows the selected job or the latest one that
+        # reported progress
+        self.progress_job = None
+        self.progress_bar = ttk.Progressbar(left_frame, maximum=100)
+        self.progress_bar.grid(row=7, columnspan=1, sticky='ew', pady=5)
+        self.extract_tree = ttk.Treeview(
+            left_frame, columns=("Value",), show="tree headings", height=6)
+        self.extract_tree.heading("#0", text="Job")
+        self.extract_tree.heading("Value", text="Value")
+        self.extract_tree.grid(row=8, columnspan=1, pady=5)
+
+        # where the time of the runs goes, aggregated over the finished jobs
+        timing_columns = ("Phase", "Runs", "p50", "p90", "p99", "Max")
+        self.timing_tree = ttk.Treeview(
+            left_frame, columns=timing_columns, show="headings",
+            height=len(metrics.PHASES))
+        for column in timing_columns:
+            self.timing_tree.heading(column, text=column)
+            self.timing_tree.column(column, width=60 if column != "Phase"
+                                    else 80, anchor=tk.E)
+        self.timing_tree.grid(row=9, columnspan=1, pady=5)
 
         # Create log text widget in the right frame
         log_label = ttk.Label(right_frame, text="Procedure Log")
         log_label.pack(fill='x')
-        self.log_text = tk.Text(right_frame)
-        self.log_text.pack(fill='both', expand=True)
+        self.log_view = logview.LogView(right_frame)
+        self.log_view.tag_configure(ex.STDERR, foreground="red")
+        self.log_filter = logview.LogFilterBar(right_frame, self.log_view)
+        self.log_filter.pack(fill='x')
+        self.log_view.pack(fill='both', expand=True)
+
+        # numeric values found by the extraction rules, plotted against
+        # their x group or the time since the start of the job
+        plot_label = ttk.Label(right_frame, text="Extracted Values")
+        plot_label.pack(fill='x')
+        self.plot_view = plot.PlotView(right_frame)
+        self.plot_view.pack(fill='both', expand=True)
+
+        # the health of the boards is probed in the background, the
+        # indicators only show the cached results
+        self.app_state.health.start(lambda: list(self.app_state.hexactrls))
+        self.after(self.health_interval, self.update_health_indication)
 
     def refresh_available_procs_and_hexacontrollers(self):
         self.procedure_var.set(
@@ -104,30 +203,160 @@ class RunControlUI(ttk.Frame):
 
     def update_hexacontroller_selection(self, hex_idx: Tuple[int]):
         print("updating hexacontroller selection")
-        self.app_state.running_hexactrl_config = deepcopy(
-                self.app_state.hexactrls[hex_idx[0]])
+        if len(hex_idx) == 0:
+            return
+        self.app_state.running_hexactrl_configs = [
+                deepcopy(self.app_state.hexactrls[i]) for i in hex_idx]
+        self.app_state.running_hexactrl_config = \
+            self.app_state.running_hexactrl_configs[0]
 
     def run_procedure(self):
+        """
+        Queue the selected procedure for every selected hexacontroller
+        """
         procedure = self.app_state.running_procedure_config
-        self.hexa_selection['state'] = tk.DISABLED
-        self.procedure_selection['state'] = tk.DISABLED
+        if procedure is None:
+            return
+        module_id = self.module_var.get().strip() or None
+        for hexactrl in self.app_state.running_hexactrl_configs:
+            job = self.app_state.scheduler.submit(procedure, hexactrl,
+                                                  module_id)
+            self.job_tree.insert(
+                "", "end", iid=str(job.job_id),
+                values=(job.procedure.name, job.hexactrl.name, job.state, ""))
+        self.app_state.pump.wake()
+
+    def handle_events(self, events: List[sched.JobEvent]):
+        """
+        Move the output that the scheduler has collected since the last
+        tick of the event pump into the log
+        """
+        # the log view batches the lines and redraws at a fixed rate, the
+        # extracted metrics are shown once per poll with their latest value
+        extracted = {}
+        for job, kind, data in events:
+            if kind == sched.METRIC:
+                extracted[job.job_id] = job
+                if data.kind == extract.PROGRESS:
+                    self.progress_job = job
+                elif data.kind == extract.VALUE:
+                    self.plot_value(job, data)
+            elif kind == sched.STATE:
+                if job.state == sched.Job.RUNNING:
+                    self.drop_old_series(job)
+                self.job_tree.set(str(job.job_id), "State", data)
+                self.log_view.append(self.describe_state_change(job))
+                if job.finished:
+                    self.update_phase_timing()
+            elif kind == sched.RESOURCES:
+                # shown on the dashboard
+                continue
+            else:
+                self.log_view.append(f"[{job.hexactrl.name}] {data}", kind)
 
-        self.log_text.insert('end', f"Running {procedure}...\n")
-        self.log_text.update_idletasks()
+        for job in extracted.values():
+            self.update_extracted(job)
+        if extracted:
+            self.update_progress_bar()
 
-        # Simulating a long-running procedure
-        for i in range(5):
-            self.log_text.insert('end', f"Step {i + 1}\n")
-            self.log_text.see('end')
-            self.log_text.update_idletasks()
-            self.after(1000)  # Delay of 1 second
+    def update_extracted(self, job: sched.Job):
+        """
+        Show the latest values and the warnings the rules found for the job
+        """
+        if job.progress is not None:
+            self.job_tree.set(str(job.job_id), "Progress",
+                              f"{100 * job.progress:.0f} %")
+        parent = f"job{job.job_id}"
+        if not self.extract_tree.exists(parent):
+            self.extract_tree.insert("", "end", iid=parent, text=job.name,
+                                     open=True)
+        rows = dict(job.values)
+        if job.warning_count:
+            rows["warnings"] = f"{job.warning_count}: {job.warnings[-1]}"
+        for name, value in rows.items():
+            iid = f"{parent}:{name}"
+            if self.extract_tree.exists(iid):
+                self.extract_tree.item(iid, values=(value,))
+            else:
+                self.extract_tree.insert(parent, "end", iid=iid, text=name,
+                                         values=(value,))
 
-        self.log_text.insert('end', f"{procedure} completed.\n")
-        self.hexa_selection['state'] = tk.NORMAL
-        self.procedure_selection['state'] = tk.NORMAL
+    def plot_value(self, job: sched.Job, event: extract.MetricEvent):
+        if isinstance(event.value, bool) or \
+                not isinstance(event.value, (int, float)):
+            return
+        x = event.x if event.x is not None else time.time() - job.start_time
+        self.plot_view.add_point((job.job_id, event.rule), x, event.value,
+                                 f"{job.name} {event.rule}")
+
+    def drop_old_series(self, job: sched.Job):
+        """
+        Replace the plots of the earlier jobs on the board by those of the
+        job that just started
+        """
+        jobs = self.app_state.scheduler.jobs
+        for job_id, rule in list(self.plot_view.series):
+            old = jobs[job_id]
+            if old.finished and old.board == job.board:
+                self.plot_view.remove_series((job_id, rule))
+
+    def update_progress_bar(self):
+        job = self.progress_job
+        selection = self.job_tree.selection()
+        if selection:
+            job = self.app_state.scheduler.jobs[int(selection[0])]
+        progress = job.progress if job is not None else None
+        self.progress_bar['value'] = 100 * (progress or 0)
+
+    def update_phase_timing(self):
+        """
+        Show the percentiles of the duration of every phase in seconds
+        """
+        summary = self.app_state.scheduler.metrics.summary()
+        self.timing_tree.delete(*self.timing_tree.get_children())
+        for phase in metrics.PHASES:
+            if phase not in summary:
+                continue
+            stats = summary[phase]
+            self.timing_tree.insert("", "end", values=(
+                phase, stats["count"],
+                *(f"{stats[key]:.2f}" for key in ("p50", "p90", "p99", "max"))))
+
+    @staticmethod
+    def describe_state_change(job: sched.Job) -> str:
+        if job.state == sched.Job.RUNNING:
+            return f"Running {job.name}...\n"
+        if job.error is not None:
+            return f"Unable to run {job.name}: {job.error}\n"
+        return f"{job.name} {job.state} with exit code {job.returncode}.\n"
 
     def connect(self):
-        self.app_state.running_hexactrl_config.connected = True
+        """
+        Connect to the selected hexacontroller in the background, the SSH
+        handshake may take a while
+        """
+        hexactrl = self.app_state.running_hexactrl_config
+        if hexactrl is None:
+            return
+        self.connect_button['state'] = tk.DISABLED
+        errors = []
+
+        def connect_worker():
+            try:
+                hexactrl.connect()
+            except hx.ConnectionError as e:
+                errors.append(e.__cause__ or e)
+
+        worker = threading.Thread(target=connect_worker, daemon=True)
+        worker.start()
+        self.after(100, self.await_connection, worker, errors)
+
+    def await_connection(self, worker: threading.Thread, errors: list):
+        if worker.is_alive():
+            self.after(100, self.await_connection, worker, errors)
+            return
+        for error in errors:
+            self.log_view.append(f"Unable to connect: {error}", ex.STDERR)
         self.update_connection_indication()
 
     def update_connection_indication(self):
@@ -136,6 +365,188 @@ class RunControlUI(ttk.Frame):
         self.conn_indicator.configure(
             bg="limegreen" if self.app_state.running_hexactrl_config.connected else "darkgray")
 
+    @staticmethod
+    def health_state(status) -> str:
+        if status is None:
+            return None
+        if not status.reachable:
+            return "down"
+        if not (status.daq_server and status.sc_server):
+            return "servers down"
+        return "up"
+
+    def update_health_indication(self):
+        """
+        Color the hexacontroller list according to the cached health of
+        the boards
+        """
+        health = self.app_state.health
+        hexactrls = {h.name: h for h in self.app_state.hexactrls}
+        # the rows are looked up by name, the list of the app state may
+        # have changed since the listbox was filled
+        for row, name in enumerate(self.hexa_selection.get(0, 'end')):
+            hexactrl = hexactrls.get(name)
+            state = None if hexactrl is None else self.health_state(
+                health.status(hexactrl.hostname, allow_stale=True))
+            self.hexa_selection.itemconfigure(
+                row, background=self.health_colors[state])
+        selected = self.app_state.running_hexactrl_config
+        if selected is not None:
+            state = self.health_state(
+                health.status(selected.hostname, allow_stale=True))
+            self.health_label.configure(
+                text=f"{selected.name}: {state or 'unknown'}")
+        self.after(self.health_interval, self.update_health_indication)
+
+    def fetch_data(self):
+        """
+        Copy the output directory of the selected hexacontroller to the
+        data directory in the background
+        """
+        hexactrl = self.app_state.running_hexactrl_config
+        config = self.app_state.config_params.get("transfer", {})
+        if hexactrl is None:
+            return
+        if not config.get("remote_directory"):
+            self.log_view.append("Unable to fetch the data: the transfer "
+                                 "section of the configuration has no "
+                                 "remote_directory\n", ex.STDERR)
+            return
+        local_directory = config.get("local_directory") or os.path.join(
+            self.app_state.scheduler.run_directory, "data")
+        local_directory = os.path.join(
+            os.path.expanduser(local_directory), hexactrl.name)
+        data_transfer = transfer.Transfer.load_from_config(
+            config, hexactrl, local_directory)
+        self.fetch_button['state'] = tk.DISABLED
+        self.log_view.append(f"Fetching {data_transfer.remote_directory} "
+                             f"from {hexactrl.name} to "
+                             f"{local_directory}...\n")
+        data_transfer.start()
+        self.after(self.transfer_interval, self.await_transfer, data_transfer)
+
+    def await_transfer(self, data_transfer: transfer.Transfer):
+        done, total, files_done, files_total = data_transfer.progress()
+        self.transfer_label.configure(
+            text=f"{files_done}/{files_total} files, "
+                 f"{done / 1e6:.1f}/{total / 1e6:.1f} MB")
+        if not data_transfer.done.is_set():
+            self.after(self.transfer_interval, self.await_transfer,
+                       data_transfer)
+            return
+        self.fetch_button['state'] = tk.NORMAL
+        summary = data_transfer.summary()
+        if summary["error"] is not None:
+            self.log_view.append(f"Unable to fetch the data: "
+                                 f"{summary['error']}\n", ex.STDERR)
+            return
+        for failed in summary["failed"]:
+            self.log_view.append(f"Unable to fetch {failed['remote']}: "
+                                 f"{failed['error']}\n", ex.STDERR)
+        self.log_view.append(
+            f"Fetched {summary['files'] - len(summary['failed'])} of "
+            f"{summary['files']} files from {summary['hexacontroller']} "
+            f"({summary['transferred'] / 1e6:.1f} MB transferred in "
+            f"{summary['duration']:.1f} s)\n")
+
+    def start_servers(self):
+        """
+        Start the servers of the selected hexacontroller in the background
+        and keep them running until they are stopped
+        """
+        hexactrl = self.app_state.running_hexactrl_config
+        if hexactrl is None or hexactrl.hostname in self.server_managers:
+            return
+        config = self.app_state.config_params.get("scheduler", {})
+        manager = servers.ServerManager(
+            hexactrl, config.get("server_timeout", 30.0),
+            config.get("server_restarts", 3),
+            on_output=lambda stream, line: self.server_output.put(
+                (stream, f"[{hexactrl.name}] {line}")))
+        self.server_managers[hexactrl.hostname] = manager
+        errors = []
+
+        def start_worker():
+            try:
+                hexactrl.connect()
+                manager.start(manager.stopping)
+            except (hx.ConnectionError, servers.ServerError) as e:
+                errors.append(e.__cause__ or e)
+
+        worker = threading.Thread(target=start_worker, daemon=True)
+        worker.start()
+        self.log_view.append(f"Starting the servers of {hexactrl.name}...\n")
+        self.after(100, self.await_servers, hexactrl, worker, errors)
+
+    def await_servers(self, hexactrl: hx.Hexacontroller,
+                      worker: threading.Thread, errors: list):
+        self.show_server_output()
+        if worker.is_alive():
+            self.after(100, self.await_servers, hexactrl, worker, errors)
+            return
+        for error in errors:
+            self.log_view.append(f"Unable to start the servers: {error}\n",
+                                 ex.STDERR)
+        if errors:
+            self.stop_servers(hexactrl)
+            return
+        self.log_view.append(f"The servers of {hexactrl.name} are ready\n")
+        self.start_following_servers()
+
+    def show_server_output(self):
+        while True:
+            try:
+                stream, line = self.server_output.get_nowait()
+            except queue.Empty:
+                break
+            self.log_view.append(line, stream)
+
+    def start_following_servers(self):
+        if not self.following_servers:
+            self.following_servers = True
+            self.after(self.health_interval, self.follow_servers)
+
+    def follow_servers(self):
+        """
+        Show the output of the servers as long as any of them runs or is
+        being stopped
+        """
+        self.show_server_output()
+        self.server_stoppers = [t for t in self.server_stoppers
+                                if t.is_alive()]
+        if self.server_managers or self.server_stoppers:
+            self.after(self.health_interval, self.follow_servers)
+            return
+        # whatever the last stop reported before its thread ended
+        self.show_server_output()
+        self.following_servers = False
+
+    def stop_servers(self, hexactrl: hx.Hexacontroller = None):
+        """
+        Tear the servers of the hexacontroller down with its shutdown
+        commands in the background
+        """
+        if hexactrl is None:
+            hexactrl = self.app_state.running_hexactrl_config
+        if hexactrl is None:
+            return
+        manager = self.server_managers.pop(hexactrl.hostname, None)
+        if manager is None:
+            return
+
+        def stop_worker():
+            try:
+                manager.stop()
+            except hx.ConnectionError as e:
+                self.server_output.put((ex.STDERR, f"Unable to stop the "
+                                        f"servers: {e.__cause__ or e}\n"))
+
+        stopper = threading.Thread(target=stop_worker, daemon=True)
+        stopper.start()
+        self.server_stoppers.append(stopper)
+        self.log_view.append(f"Stopping the servers of {hexactrl.name}\n")
+        self.start_following_servers()
+
     def disconnect(self):
-        self.app_state.running_hexactrl_config.connected = False
+        self.app_state.running_hexactrl_config.disconnect()
         self.update_connection_indication()
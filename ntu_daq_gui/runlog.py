@@ -0,0 +1,223 @@
+import os
+import queue
+import re
+import struct
+import threading
+import time
+import zlib
+from bisect import bisect_right
+from typing import List, NamedTuple, Optional
+
+# every block of the log is a complete gzip member, so the log can still be
+# read with zcat, and a record in the index points to each of them
+INDEX_RECORD = struct.Struct('<QQd')
+
+
+class LogLine(NamedTuple):
+    timestamp: float
+    stream: str
+    text: str
+
+
+class IndexEntry(NamedTuple):
+    offset: int
+    first_line: int
+    first_timestamp: float
+
+
+def format_line(timestamp: float, stream: str, text: str) -> bytes:
+    return f"{timestamp:.6f} {stream} {text}\n".encode('utf-8', 'replace')
+
+
+def parse_line(raw: str) -> LogLine:
+    timestamp, stream, text = raw.split(' ', 2)
+    return LogLine(float(timestamp), stream, text)
+
+
+def create_run_directory(base: str, *name_parts: str) -> str:
+    """
+    Create a new directory for the files of a run below `base`
+    """
+    parts = [time.strftime('%Y%m%d-%H%M%S')]
+    parts.extend(name_parts)
+    name = "_".join(re.sub(r'[^A-Za-z0-9.-]+', '-', part) for part in parts)
+    path = os.path.join(base, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class RunLogWriter:
+    """
+    Writes the output of a run to a block compressed log with a line index
+
+    The lines are handed to a background thread, which collects them into
+    blocks of about `block_size` bytes, a block is written out at the latest
+    `flush_interval` seconds after its first line arrived. Every block is
+    compressed into its own gzip member and an index entry with the offset,
+    the number of the first line and its timestamp is appended to the index
+    file. If the log can not be written, the lines are dropped and counted
+    in `dropped_lines`.
+    """
+
+    def __init__(self, path: str, block_size: int = 256 * 1024,
+                 flush_interval: float = 2.0, compression_level: int = 6,
+                 max_queued_lines: int = 100000):
+        self.path = path
+        self.index_path = path + '.idx'
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self.compression_level = compression_level
+        self.queue = queue.Queue(maxsize=max_queued_lines)
+        self.line_count = 0
+        self.dropped_lines = 0
+        self.error: Optional[str] = None
+        self.closed = False
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def write(self, stream: str, text: str, timestamp: Optional[float] = None):
+        """
+        Queue a line of output for writing, may be called from any thread
+        """
+        if self.error is not None:
+            self.dropped_lines += 1
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        self.queue.put((timestamp, stream, text.rstrip('\n')))
+
+    def close(self):
+        """
+        Write out all queued lines and close the files
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.writer.join()
+
+    def _write_loop(self):
+        try:
+            with open(self.path, 'wb') as log, \
+                    open(self.index_path, 'wb') as index:
+                self._write_blocks(log, index)
+        except OSError as e:
+            self.error = str(e)
+            print(f"Unable to write the run log {self.path}: {e}")
+            # keep taking what is queued, so the readers of the output do
+            # not block on a full queue
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                self.dropped_lines += 1
+
+    def _write_blocks(self, log, index):
+        block: List[bytes] = []
+        block_bytes = 0
+        block_first_line = 0
+        block_first_timestamp = 0.0
+        block_deadline = 0.0
+        while True:
+            timeout = None
+            if block:
+                timeout = max(0.0, block_deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if item:
+                timestamp, stream, text = item
+                if not block:
+                    block_first_line = self.line_count
+                    block_first_timestamp = timestamp
+                    block_deadline = time.monotonic() + self.flush_interval
+                line = format_line(timestamp, stream, text)
+                block.append(line)
+                block_bytes += len(line)
+                self.line_count += 1
+            if block and (not item or block_bytes >= self.block_size or
+                          time.monotonic() >= block_deadline):
+                compressor = zlib.compressobj(self.compression_level,
+                                              zlib.DEFLATED, 31)
+                offset = log.tell()
+                log.write(compressor.compress(b"".join(block)))
+                log.write(compressor.flush())
+                log.flush()
+                # the index entry is only written once the block is
+                # complete, so readers never see a partial block
+                index.write(INDEX_RECORD.pack(
+                    offset, block_first_line, block_first_timestamp))
+                index.flush()
+                block = []
+                block_bytes = 0
+            if item is None:
+                break
+
+
+class RunLogReader:
+    """
+    Random access to a log written by the RunLogWriter
+
+    Reading a line at a given position or time only decompresses the one
+    block that contains it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index: List[IndexEntry] = []
+        with open(path + '.idx', 'rb') as index:
+            data = index.read()
+        usable = len(data) - len(data) % INDEX_RECORD.size
+        for record in INDEX_RECORD.iter_unpack(data[:usable]):
+            self.index.append(IndexEntry(*record))
+        self._cached_block = (-1, [])
+
+    def _block(self, block_idx: int) -> List[str]:
+        if self._cached_block[0] == block_idx:
+            return self._cached_block[1]
+        start = self.index[block_idx].offset
+        if block_idx + 1 < len(self.index):
+            stop = self.index[block_idx + 1].offset
+        else:
+            stop = os.path.getsize(self.path)
+        with open(self.path, 'rb') as log:
+            log.seek(start)
+            data = zlib.decompress(log.read(stop - start), 31)
+        lines = data.decode('utf-8').split('\n')[:-1]
+        self._cached_block = (block_idx, lines)
+        return lines
+
+    def line_count(self) -> int:
+        if not self.index:
+            return 0
+        return self.index[-1].first_line + len(self._block(len(self.index) - 1))
+
+    def read_lines(self, start: int, count: int) -> List[LogLine]:
+        """
+        Read `count` lines starting with line number `start`
+        """
+        lines: List[LogLine] = []
+        first_lines = [entry.first_line for entry in self.index]
+        block_idx = bisect_right(first_lines, start) - 1
+        while block_idx < len(self.index) and len(lines) < count:
+            block = self._block(block_idx)
+            skip = max(0, start - self.index[block_idx].first_line)
+            for raw in block[skip:skip + count - len(lines)]:
+                lines.append(parse_line(raw))
+            block_idx += 1
+        return lines
+
+    def find_time(self, timestamp: float) -> int:
+        """
+        Return the number of the first line written at or after `timestamp`
+        """
+        first_timestamps = [entry.first_timestamp for entry in self.index]
+        block_idx = max(0, bisect_right(first_timestamps, timestamp) - 1)
+        while block_idx < len(self.index):
+            block = self._block(block_idx)
+            for i, raw in enumerate(block):
+                if parse_line(raw).timestamp >= timestamp:
+                    return self.index[block_idx].first_line + i
+            block_idx += 1
+        return self.line_count()
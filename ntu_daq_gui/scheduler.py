@@ -0,0 +1,507 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from copy import deepcopy
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from ntu_daq_gui import executor as ex
+from ntu_daq_gui import extract
+from ntu_daq_gui import hexacontroller as hx
+from ntu_daq_gui import history as hist
+from ntu_daq_gui import metrics
+from ntu_daq_gui import procedure as prc
+from ntu_daq_gui import runlog
+from ntu_daq_gui import servers as srv
+from ntu_daq_gui import supervisor as sv
+from ntu_daq_gui import workerpool
+
+# kind of the events that only signal a change of the state of a job
+STATE = "state"
+# kind of the events that carry an extract.MetricEvent
+METRIC = "metric"
+# kind of the events that carry a supervisor.ResourceSample
+RESOURCES = "resources"
+# number of warnings that are kept per job
+MAX_WARNINGS = 100
+
+
+class Job:
+    """
+    A procedure that is run against a single Hexacontroller
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, job_id: int, procedure: prc.Procedure,
+                 hexactrl: hx.Hexacontroller,
+                 module_id: Optional[str] = None):
+        self.job_id = job_id
+        self.procedure = procedure
+        self.hexactrl = hexactrl
+        self.module_id = module_id
+        # identifies the run in the history, the job ids start over with
+        # every scheduler
+        self.run_key = uuid.uuid4().hex
+        self.state = Job.QUEUED
+        self.executor: Optional[ex.Executor] = None
+        self.run_dir: Optional[str] = None
+        self.log_writer: Optional[runlog.RunLogWriter] = None
+        self.returncode: Optional[int] = None
+        self.error: Optional[str] = None
+        self.submit_time = time.time()
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self.metrics = metrics.RunMetrics(
+            {"procedure": procedure.name, "hexacontroller": hexactrl.name})
+        # the phases run in a thread of their own, what they report besides
+        # the output of the procedure is passed on through this queue
+        self.worker: Optional[threading.Thread] = None
+        self.messages: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self.cancelled = threading.Event()
+        # what the extraction rules of the procedure found in the output
+        self.extractor: Optional[extract.Extractor] = None
+        self.progress: Optional[float] = None
+        self.values: Dict[str, Any] = {}
+        self.warning_count = 0
+        self.warnings: Deque[str] = deque(maxlen=MAX_WARNINGS)
+        # the resources the procedure used, sampled by the supervisor
+        self.samples: "queue.Queue[sv.ResourceSample]" = queue.Queue()
+        self.last_sample: Optional[sv.ResourceSample] = None
+        self.peak_rss = 0
+
+    @property
+    def name(self) -> str:
+        return f"{self.procedure.name}@{self.hexactrl.name}"
+
+    @property
+    def board(self) -> str:
+        return self.hexactrl.hostname
+
+    @property
+    def log_path(self) -> Optional[str]:
+        if self.run_dir is None:
+            return None
+        return os.path.join(self.run_dir, "output.log.gz")
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (Job.SUCCEEDED, Job.FAILED, Job.CANCELLED)
+
+    def report(self, stream: str, text: str):
+        for line in text.splitlines(keepends=True):
+            self.messages.put((stream, line))
+
+    def record(self, event: extract.MetricEvent):
+        if event.kind == extract.PROGRESS:
+            self.progress = event.value
+        elif event.kind == extract.VALUE:
+            self.values[event.rule] = event.value
+        else:
+            self.warning_count += 1
+            self.warnings.append(event.value)
+
+    def add_sample(self, sample: sv.ResourceSample):
+        self.last_sample = sample
+        self.peak_rss = max(self.peak_rss, sample.rss)
+        self.samples.put(sample)
+
+    def get_output(self, max_lines: int) -> List[Tuple[str, str]]:
+        """
+        Return the messages of the phases and the output of the procedure
+        that arrived since the last call
+        """
+        output = []
+        while len(output) < max_lines:
+            try:
+                output.append(self.messages.get_nowait())
+            except queue.Empty:
+                break
+        if self.executor is not None and len(output) < max_lines:
+            output.extend(self.executor.get_output(max_lines - len(output)))
+        return output
+
+    def is_done(self) -> bool:
+        return (self.worker is not None and not self.worker.is_alive()
+                and self.messages.empty()
+                and (self.executor is None or self.executor.is_done()))
+
+    def summary(self) -> Dict:
+        """
+        machine readable description of the job and its outcome
+        """
+        duration = None
+        if self.start_time is not None and self.end_time is not None:
+            duration = self.end_time - self.start_time
+        return {
+            "id": self.job_id,
+            "procedure": self.procedure.name,
+            "hexacontroller": self.hexactrl.name,
+            "module_id": self.module_id,
+            "state": self.state,
+            "returncode": self.returncode,
+            "error": self.error,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "duration": duration,
+            "run_dir": self.run_dir,
+            "log_path": self.log_path,
+            "metrics": self.metrics.to_dict(),
+            "progress": self.progress,
+            "values": self.values,
+            "warning_count": self.warning_count,
+            "warnings": list(self.warnings),
+            "resources": {
+                "peak_rss": self.peak_rss,
+                "read_bytes": self.last_sample.read_bytes
+                if self.last_sample is not None else None,
+                "write_bytes": self.last_sample.write_bytes
+                if self.last_sample is not None else None,
+            },
+        }
+
+    def __repr__(self):
+        return f"<Job {self.job_id} {self.name} {self.state}>"
+
+
+class JobEvent(NamedTuple):
+    job: Job
+    kind: str  # one of ex.STDOUT, ex.STDERR, STATE, METRIC or RESOURCES
+    # the line, the new state, the extract.MetricEvent or the
+    # supervisor.ResourceSample
+    data: Any
+
+
+class RunScheduler:
+    """
+    Runs a queue of (procedure, Hexacontroller) jobs in parallel
+
+    At most `max_parallel_jobs` jobs run at the same time and at most
+    `max_jobs_per_board` of them on the same Hexacontroller. The scheduler
+    does not own a thread, it is driven by calling `poll` regularly from a
+    single event loop (the Tk mainloop or the loop of the headless mode).
+    If a run directory is given, the output of every job is stored in a
+    directory of its own below it.
+
+    Every job runs through the phases connect, startup, servers, procedure
+    and shutdown in a worker thread, the phases before and after the
+    procedure only if `board_setup` is set. As the servers of a board can
+    only run once, `board_setup` allows a single job per board whatever
+    `max_jobs_per_board` says. The time spent in every phase
+    is written to the metrics.json of the job and aggregated over the jobs
+    in `metrics`, which is exported to `metrics_file` in the Prometheus
+    text format.
+
+    With a worker pool the procedures run in warm Python processes
+    instead of a new interpreter each. The supervisor enforces the timeouts
+    of the procedures and samples the resources they use.
+    """
+
+    def __init__(self, max_parallel_jobs: int = 4,
+                 max_jobs_per_board: int = 1,
+                 run_directory: Optional[str] = None,
+                 board_setup: bool = False,
+                 server_timeout: float = 30.0,
+                 server_restarts: int = 3,
+                 metrics_file: Optional[str] = None,
+                 worker_pool: Optional[workerpool.WorkerPool] = None,
+                 supervisor: Optional[sv.Supervisor] = None,
+                 history: Optional[hist.HistoryWriter] = None):
+        self.max_parallel_jobs = max_parallel_jobs
+        self.max_jobs_per_board = max_jobs_per_board
+        self.run_directory = run_directory
+        self.board_setup = board_setup
+        self.server_timeout = server_timeout
+        self.server_restarts = server_restarts
+        if metrics_file is None and run_directory is not None:
+            metrics_file = os.path.join(run_directory, "metrics.prom")
+        self.metrics_file = metrics_file
+        self.metrics = metrics.MetricsRegistry()
+        self.supervisor = supervisor if supervisor is not None \
+            else sv.Supervisor()
+        self.worker_pool = worker_pool
+        if worker_pool is not None:
+            # the workers run the procedures, so they get their limits
+            worker_pool.launcher = self.supervisor.launcher
+            worker_pool.start()
+        self.history = history
+        self.jobs: List[Job] = []
+        self.queued: Deque[Job] = deque()
+        self.running: List[Job] = []
+        self._next_job_id = 0
+
+    @classmethod
+    def load_from_config(cls, config: Dict,
+                         run_directory: Optional[str] = None):
+        """
+        given the 'scheduler' entry of the configuration create a scheduler
+        """
+        return cls(
+            max_parallel_jobs=config.get('max_parallel_jobs', 4),
+            max_jobs_per_board=config.get('max_jobs_per_board', 1),
+            run_directory=run_directory,
+            board_setup=config.get('board_setup', False),
+            server_timeout=config.get('server_timeout', 30.0),
+            server_restarts=config.get('server_restarts', 3),
+            metrics_file=config.get('metrics_file'),
+            worker_pool=workerpool.WorkerPool.load_from_config(
+                config['worker_pool']) if 'worker_pool' in config else None,
+            supervisor=sv.Supervisor.load_from_config(
+                config.get('supervision', {})),
+            history=hist.HistoryWriter.load_from_config(
+                config.get('history', True), run_directory),
+        )
+
+    def submit(self, procedure: prc.Procedure, hexactrl: hx.Hexacontroller,
+               module_id: Optional[str] = None) -> Job:
+        """
+        Queue the procedure for execution on the Hexacontroller, optionally
+        for the module that is tested. The configurations are copied so
+        that later edits do not affect the job
+        """
+        job = Job(self._next_job_id, deepcopy(procedure), deepcopy(hexactrl),
+                  module_id)
+        self._next_job_id += 1
+        self.jobs.append(job)
+        self.queued.append(job)
+        return job
+
+    def cancel(self, job: Job) -> bool:
+        """
+        Remove a job from the queue, jobs that are already running are not
+        affected
+        """
+        if job.state != Job.QUEUED:
+            return False
+        self.queued.remove(job)
+        job.state = Job.CANCELLED
+        job.end_time = time.time()
+        return True
+
+    def cancel_all(self):
+        """
+        Cancel the queued jobs and terminate the running ones
+        """
+        for job in list(self.queued):
+            self.cancel(job)
+        for job in self.running:
+            job.cancelled.set()
+            if job.executor is not None:
+                job.executor.terminate()
+
+    def close(self):
+        """
+        Stop the workers of the pool and write what is left of the history,
+        running jobs are not affected
+        """
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+        if self.history is not None:
+            self.history.close()
+
+    def idle(self) -> bool:
+        return len(self.queued) == 0 and len(self.running) == 0
+
+    def jobs_on_board(self, board: str) -> int:
+        return sum(1 for job in self.running if job.board == board)
+
+    def poll(self, max_lines: int = 2000) -> List[JobEvent]:
+        """
+        Start queued jobs for which there is capacity, collect the output
+        of the running jobs and retire the jobs that are done.
+
+        The line budget is shared between the running jobs so that a single
+        chatty procedure can not starve the output of the others.
+        """
+        events: List[JobEvent] = []
+        self._start_jobs(events)
+        if self.running:
+            budget = max(1, max_lines // len(self.running))
+            for job in list(self.running):
+                output = job.get_output(budget)
+                if output and self.history is not None:
+                    self.history.add_lines(job.run_key, output)
+                for stream, line in output:
+                    job.metrics.count(stream, line)
+                    events.append(JobEvent(job, stream, line))
+                    metric = job.extractor.feed(line)
+                    if metric is not None:
+                        job.record(metric)
+                        events.append(JobEvent(job, METRIC, metric))
+                while not job.samples.empty():
+                    events.append(JobEvent(job, RESOURCES,
+                                           job.samples.get_nowait()))
+                if job.is_done():
+                    self._finish_job(job, events)
+            # finished jobs free up capacity for the jobs in the queue
+            self._start_jobs(events)
+        return events
+
+    def _start_jobs(self, events: List[JobEvent]):
+        if len(self.running) >= self.max_parallel_jobs:
+            return
+        jobs_per_board = 1 if self.board_setup else self.max_jobs_per_board
+        for job in list(self.queued):
+            if len(self.running) >= self.max_parallel_jobs:
+                break
+            if self.jobs_on_board(job.board) >= jobs_per_board:
+                continue
+            self.queued.remove(job)
+            self._start_job(job, events)
+
+    def _start_job(self, job: Job, events: List[JobEvent]):
+        job.start_time = time.time()
+        try:
+            job.extractor = extract.Extractor.load_from_config(
+                job.procedure.extract)
+            if self.run_directory is not None:
+                job.run_dir = runlog.create_run_directory(
+                    self.run_directory, str(job.job_id),
+                    job.procedure.name, job.hexactrl.name)
+                job.log_writer = runlog.RunLogWriter(job.log_path)
+        except (OSError, extract.RuleError) as e:
+            self._close_log(job)
+            job.error = str(e)
+            job.state = Job.FAILED
+            job.end_time = time.time()
+            if self.history is not None:
+                self.history.run_started(job.run_key, hist.run_row(job))
+                self.history.run_finished(job.run_key, hist.run_row(job))
+            events.append(JobEvent(job, STATE, job.state))
+            return
+        job.worker = threading.Thread(target=self._run_job, args=(job,),
+                                      daemon=True)
+        job.worker.start()
+        job.state = Job.RUNNING
+        if self.history is not None:
+            self.history.run_started(job.run_key, hist.run_row(job))
+        self.running.append(job)
+        events.append(JobEvent(job, STATE, job.state))
+
+    def _run_job(self, job: Job):
+        """
+        Run the phases of the job, this is the body of the worker thread
+        """
+        try:
+            if not self.board_setup:
+                self._run_procedure(job)
+                return
+            with job.metrics.phase("connect"):
+                job.hexactrl.connect()
+            servers = srv.ServerManager(
+                job.hexactrl, self.server_timeout, self.server_restarts,
+                on_output=lambda stream, line: job.messages.put(
+                    (stream, line)),
+                log_writer=job.log_writer)
+            try:
+                with job.metrics.phase("startup"):
+                    self._run_commands(
+                        job, job.hexactrl.run_startup_commands(
+                            log_writer=job.log_writer), check=True)
+                if not job.cancelled.is_set():
+                    with job.metrics.phase("servers"):
+                        servers.start(job.cancelled)
+                self._run_procedure(job)
+            finally:
+                # the shutdown commands tear the servers down
+                with job.metrics.phase("shutdown"):
+                    self._clean_up(job, "stop the servers",
+                                   lambda: self._run_commands(
+                                       job, servers.stop(), check=False))
+                self._clean_up(job, "disconnect",
+                               job.hexactrl.disconnect)
+        except Exception as e:
+            # the job fails with the error instead of the thread dying
+            job.error = str(e.__cause__ or e) or type(e).__name__
+
+    @staticmethod
+    def _clean_up(job: Job, what: str, step):
+        """
+        Run a step of the clean up of a job, a failure is reported but does
+        not hide the error of the job or skip the next steps
+        """
+        try:
+            step()
+        except Exception as e:
+            error = f"Unable to {what}: {e.__cause__ or e}"
+            job.report(ex.STDERR, error + "\n")
+            if job.error is None:
+                job.error = error
+
+    def _run_procedure(self, job: Job):
+        if job.cancelled.is_set():
+            return
+        with job.metrics.phase("procedure"):
+            arguments = job.procedure.gen_run_command(
+                job.hexactrl.hostname, job.hexactrl.port)
+            if self.worker_pool is not None:
+                job.executor = self.worker_pool.run(
+                    arguments, log_writer=job.log_writer)
+            else:
+                job.executor = ex.Executor(
+                    arguments, log_writer=job.log_writer,
+                    launcher=self.supervisor.launcher)
+            sample_path = None
+            if job.run_dir is not None:
+                sample_path = os.path.join(job.run_dir, "resources.jsonl")
+            reason = self.supervisor.supervise(job.executor, job.add_sample,
+                                               sample_path)
+            if reason is not None:
+                job.error = f"{job.procedure.name} {reason} and was stopped"
+                job.report(ex.STDERR, job.error + "\n")
+
+    @staticmethod
+    def _run_commands(job: Job, results, check: bool):
+        """
+        Report the output of the commands of a batch and raise on the first
+        failed one if `check` is set
+        """
+        for result in results:
+            if result.exit_status is None:
+                continue
+            job.report(ex.STDOUT, f"$ {result.command}\n")
+            job.report(ex.STDOUT, result.stdout)
+            job.report(ex.STDERR, result.stderr)
+            if check and result.exit_status != 0:
+                raise hx.TransmissionError(
+                    f"'{result.command}' failed with exit status "
+                    f"{result.exit_status}")
+
+    @staticmethod
+    def _close_log(job: Job):
+        if job.log_writer is not None:
+            job.log_writer.close()
+            job.log_writer = None
+
+    def _finish_job(self, job: Job, events: List[JobEvent]):
+        self.running.remove(job)
+        self._close_log(job)
+        if job.executor is not None:
+            job.returncode = job.executor.returncode
+        job.end_time = time.time()
+        if job.executor is None and job.cancelled.is_set():
+            job.state = Job.CANCELLED
+        elif job.error is None and job.returncode == 0:
+            job.state = Job.SUCCEEDED
+        else:
+            job.state = Job.FAILED
+        self._store_metrics(job)
+        if self.history is not None:
+            self.history.run_finished(job.run_key, hist.run_row(job))
+        events.append(JobEvent(job, STATE, job.state))
+
+    def _store_metrics(self, job: Job):
+        self.metrics.add(job.metrics, job.state)
+        try:
+            if job.run_dir is not None:
+                job.metrics.write_json(
+                    os.path.join(job.run_dir, "metrics.json"))
+            if self.metrics_file is not None:
+                self.metrics.write_prometheus(self.metrics_file)
+        except OSError as e:
+            print(f"Unable to write the metrics of {job.name}: {e}")
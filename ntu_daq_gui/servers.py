@@ -0,0 +1,183 @@
+import threading
+import time
+from typing import Callable, List, Optional, TYPE_CHECKING
+
+from ntu_daq_gui import health
+from ntu_daq_gui import hexacontroller as hx
+from ntu_daq_gui import runlog
+from ntu_daq_gui.executor import STDERR
+
+if TYPE_CHECKING:
+    from ntu_daq_gui.channelreader import ChannelReader
+
+
+class ServerError(Exception):
+    def __init__(self, message="A server of the Hexacontroller could not be started"):
+        super().__init__(message)
+
+
+class ManagedServer:
+    """
+    A server that runs in the foreground of an SSH channel of its own
+    """
+    STARTING = "starting"
+    READY = "ready"
+    STOPPED = "stopped"
+    FAILED = "failed"
+
+    def __init__(self, name: str, command: str, port: int):
+        self.name = name
+        self.command = command
+        self.port = port
+        self.reader: Optional["ChannelReader"] = None
+        self.state = ManagedServer.STOPPED
+        self.restarts = 0
+        # the last lines of output, shown if the server does not come up
+        self.tail: List[str] = []
+
+
+class ServerManager:
+    """
+    Starts the daq and sc servers of a Hexacontroller and keeps them running
+
+    Both servers are started at the same time, each in the foreground of a
+    long-lived SSH channel with a pseudo terminal, so their output can be
+    streamed and closing the channel hangs them up. A server is only
+    started if nothing listens on its port yet and is ready as soon as its
+    TCP port accepts connections, which is probed every
+    `probe_interval` seconds, so bringing up a board takes as long as the
+    servers need and not a fixed worst case. Until `stop` is called, a
+    monitor thread passes the output on to `on_output` and restarts a server
+    that exited, at most `max_restarts` times. `stop` runs the shutdown
+    commands of the Hexacontroller and closes the channels.
+    """
+
+    def __init__(self, hexactrl: hx.Hexacontroller,
+                 ready_timeout: float = 30.0, max_restarts: int = 3, probe_interval: float = 0.1,
+                 on_output: Optional[Callable[[str, str], None]] = None,
+                 log_writer: Optional[runlog.RunLogWriter] = None):
+        self.hexactrl = hexactrl
+        self.ready_timeout = ready_timeout
+        self.max_restarts = max_restarts
+        self.probe_interval = probe_interval
+        self.on_output = on_output
+        self.log_writer = log_writer
+        self.servers = [ManagedServer(name, command, port)
+                        for name, command, port in (
+                            ("daq_server", hexactrl.daq_server_start_cmd,
+                             hexactrl.daq_server_port),
+                            ("sc_server", hexactrl.sc_server_start_cmd,
+                             hexactrl.sc_server_port))
+                        if command]
+        self.stopping = threading.Event()
+        self.monitor: Optional[threading.Thread] = None
+
+    def start(self, cancelled: Optional[threading.Event] = None):
+        """
+        Start the servers and wait until all of them accept connections,
+        raises a ServerError if one of them does not come up in time
+        """
+        for server in self.servers:
+            self._launch(server)
+        self.wait_ready(self.servers, cancelled)
+        self.monitor = threading.Thread(target=self._monitor, daemon=True)
+        self.monitor.start()
+
+    def _launch(self, server: ManagedServer):
+        # the port is how the server is known to be ready, if something
+        # listens on it already, the new server would seem ready at once
+        if health.port_open(self.hexactrl.hostname, server.port,
+                            self.probe_interval * 10):
+            server.state = ManagedServer.FAILED
+            raise ServerError(
+                f"Port {server.port} of {self.hexactrl.name} is in use, "
+                f"an earlier {server.name} may still be running")
+        server.state = ManagedServer.STARTING
+        server.tail = []
+        server.reader = self.hexactrl.ssh_execute_command(
+            server.command, log_writer=self.log_writer, get_pty=True)
+
+    def _forward(self, server: ManagedServer):
+        for stream, line in server.reader.get_output():
+            server.tail = (server.tail + [line])[-10:]
+            if self.on_output is not None:
+                self.on_output(stream, f"{server.name}: {line}")
+
+    def wait_ready(self, servers: List[ManagedServer],
+                   cancelled: Optional[threading.Event] = None):
+        deadline = time.monotonic() + self.ready_timeout
+        waiting = list(servers)
+        while waiting:
+            for server in list(waiting):
+                self._forward(server)
+                if server.reader.is_done():
+                    server.state = ManagedServer.FAILED
+                    raise ServerError(
+                        f"{server.name} on {self.hexactrl.name} exited with "
+                        f"status {server.reader.returncode} before it was "
+                        f"ready: {''.join(server.tail).strip()}")
+                if health.port_open(self.hexactrl.hostname, server.port,
+                                    self.probe_interval):
+                    server.state = ManagedServer.READY
+                    waiting.remove(server)
+            if not waiting:
+                break
+            if cancelled is not None and cancelled.is_set():
+                raise ServerError("Cancelled while the servers were starting")
+            if time.monotonic() > deadline:
+                raise ServerError(
+                    f"{', '.join(s.name for s in waiting)} on "
+                    f"{self.hexactrl.name} not listening after "
+                    f"{self.ready_timeout} s")
+            time.sleep(self.probe_interval)
+
+    def _monitor(self):
+        while not self.stopping.wait(0.2):
+            for server in self.servers:
+                if server.state == ManagedServer.FAILED:
+                    # given up on
+                    continue
+                self._forward(server)
+                if not server.reader.is_done() or self.stopping.is_set():
+                    continue
+                message = (f"{server.name} exited with status "
+                           f"{server.reader.returncode}")
+                if server.restarts >= self.max_restarts:
+                    server.state = ManagedServer.FAILED
+                    if self.on_output is not None:
+                        self.on_output(STDERR, f"{message}, giving up after "
+                                       f"{server.restarts} restarts\n")
+                    continue
+                server.restarts += 1
+                if self.on_output is not None:
+                    self.on_output(STDERR, f"{message}, restarting "
+                                   f"({server.restarts}/"
+                                   f"{self.max_restarts})\n")
+                try:
+                    self._launch(server)
+                    self.wait_ready([server], self.stopping)
+                except (ServerError, hx.ConnectionError) as e:
+                    server.state = ManagedServer.FAILED
+                    if self.on_output is not None:
+                        self.on_output(STDERR, f"{e}\n")
+
+    def ready(self) -> bool:
+        return all(s.state == ManagedServer.READY for s in self.servers)
+
+    def stop(self, timeout: float = 60.0):
+        """
+        Run the shutdown commands of the Hexacontroller, for at most
+        `timeout` seconds, and close the channels of the servers, returns
+        the results of the commands
+        """
+        self.stopping.set()
+        if self.monitor is not None:
+            self.monitor.join()
+        results = self.hexactrl.run_shutdown_commands(
+            timeout=timeout, log_writer=self.log_writer)
+        for server in self.servers:
+            if server.reader is not None:
+                self._forward(server)
+                server.reader.close()
+            server.state = ManagedServer.STOPPED
+        return results
@@ -0,0 +1,116 @@
+import threading
+import time
+from typing import Dict, Tuple, TYPE_CHECKING
+
+# paramiko takes a while to import, so it is only imported on first use
+if TYPE_CHECKING:
+    import paramiko
+
+PoolKey = Tuple[str, int, str]
+
+
+class SSHConnectionPool:
+    """
+    Pool of persistent SSH transports keyed by (hostname, port, username)
+
+    The transports are kept open between runs and reconnects of the GUI so
+    that the SSH handshake and key exchange are only paid once per board.
+    Keepalive packets are sent on every transport, so that a dead link is
+    noticed and the transport is transparently re-established (with an
+    exponential backoff) the next time it is used. Any number of channels
+    may be opened concurrently on a transport.
+    """
+
+    def __init__(self, keepalive_interval: int = 15, max_retries: int = 4,
+                 backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 connect_timeout: float = 10.0):
+        self.keepalive_interval = keepalive_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.connect_timeout = connect_timeout
+        self.clients: Dict[PoolKey, "paramiko.SSHClient"] = {}
+        self.lock = threading.Lock()
+        # one lock per key, so that connecting to one board does not
+        # block the access to the transports of the other boards
+        self.key_locks: Dict[PoolKey, threading.Lock] = {}
+
+    def _key_lock(self, key: PoolKey) -> threading.Lock:
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _alive(client: "paramiko.SSHClient") -> bool:
+        transport = client.get_transport()
+        return transport is not None and transport.is_active() \
+            and transport.is_authenticated()
+
+    def _connect(self, key: PoolKey, password: str) -> "paramiko.SSHClient":
+        import paramiko
+        hostname, port, username = key
+        attempt = 0
+        while True:
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                client.connect(hostname, port, username, password,
+                               timeout=self.connect_timeout)
+                client.get_transport().set_keepalive(self.keepalive_interval)
+                return client
+            except (paramiko.SSHException, OSError) as e:
+                client.close()
+                attempt += 1
+                # authentication errors will not go away by retrying
+                if attempt > self.max_retries or \
+                        isinstance(e, paramiko.AuthenticationException):
+                    raise
+                time.sleep(min(self.backoff_max,
+                               self.backoff_base * 2 ** (attempt - 1)))
+
+    def get_transport(self, hostname: str, port: int, username: str,
+                      password: str) -> "paramiko.Transport":
+        """
+        Return an active transport to the host, reusing the pooled one if
+        it is still alive
+        """
+        key = (hostname, int(port), username)
+        with self._key_lock(key):
+            client = self.clients.get(key)
+            if client is not None and not self._alive(client):
+                client.close()
+                client = None
+            if client is None:
+                client = self._connect(key, password)
+                self.clients[key] = client
+            return client.get_transport()
+
+    def open_session(self, hostname: str, port: int, username: str,
+                     password: str) -> "paramiko.Channel":
+        """
+        Open a new channel on the pooled transport. If the transport turns
+        out to be dead it is reconnected once before giving up
+        """
+        import paramiko
+        transport = self.get_transport(hostname, port, username, password)
+        try:
+            return transport.open_session()
+        except (paramiko.SSHException, EOFError, OSError):
+            self.close(hostname, port, username)
+            transport = self.get_transport(hostname, port, username, password)
+            return transport.open_session()
+
+    def close(self, hostname: str, port: int, username: str):
+        key = (hostname, int(port), username)
+        with self._key_lock(key):
+            client = self.clients.pop(key, None)
+            if client is not None:
+                client.close()
+
+    def close_all(self):
+        with self.lock:
+            keys = list(self.clients)
+        for key in keys:
+            self.close(*key)
+
+
+default_pool = SSHConnectionPool()
@@ -0,0 +1,210 @@
+import json
+import os
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+LIMIT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "limitexec.py")
+
+
+class ResourceSample(NamedTuple):
+    time: float
+    # CPU time used per second of wall time since the last sample, 1.0 is
+    # one fully used core
+    cpu: float
+    rss: int
+    read_bytes: int
+    write_bytes: int
+    processes: int
+
+
+def read_process_table() -> Dict[int, Tuple[int, float, int]]:
+    """
+    The parent, the CPU time in seconds and the resident memory in bytes of
+    every process, read from /proc
+    """
+    table = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            # the process exited in the meantime
+            continue
+        # the name may contain spaces and parentheses, the fields start
+        # after the last parenthesis
+        fields = stat[stat.rfind(b')') + 2:].split()
+        table[int(entry)] = (
+            int(fields[1]),
+            (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+            int(fields[21]) * PAGE_SIZE)
+    return table
+
+
+def process_tree(root: int, table: Dict[int, Tuple[int, float, int]]) \
+        -> List[int]:
+    children: Dict[int, List[int]] = {}
+    for pid, (ppid, _, _) in table.items():
+        children.setdefault(ppid, []).append(pid)
+    tree = []
+    pending = [root] if root in table else []
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending.extend(children.get(pid, []))
+    return tree
+
+
+def read_io(pid: int) -> Tuple[int, int]:
+    """
+    Bytes the process read from and wrote to the storage, 0 if unknown
+    """
+    read_bytes = write_bytes = 0
+    try:
+        with open(f'/proc/{pid}/io') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'read_bytes':
+                    read_bytes = int(value)
+                elif key == 'write_bytes':
+                    write_bytes = int(value)
+    except OSError:
+        pass
+    return read_bytes, write_bytes
+
+
+class ResourceSampler:
+    """
+    Samples the resources used by a process and all of its descendants
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        # the CPU time of processes that exited is not in the table anymore,
+        # so it is accumulated per process
+        self.cpu_times: Dict[int, float] = {}
+        self.last_time: Optional[float] = None
+        self.last_cpu = 0.0
+
+    def sample(self) -> Optional[ResourceSample]:
+        table = read_process_table()
+        tree = process_tree(self.pid, table)
+        if not tree:
+            return None
+        rss = read_bytes = write_bytes = 0
+        for pid in tree:
+            self.cpu_times[pid] = table[pid][1]
+            rss += table[pid][2]
+            io = read_io(pid)
+            read_bytes += io[0]
+            write_bytes += io[1]
+        now = time.monotonic()
+        cpu_total = sum(self.cpu_times.values())
+        cpu = 0.0
+        if self.last_time is not None and now > self.last_time:
+            cpu = max(0.0, cpu_total - self.last_cpu) / (now - self.last_time)
+        self.last_time = now
+        self.last_cpu = cpu_total
+        return ResourceSample(time.time(), cpu, rss, read_bytes, write_bytes,
+                              len(tree))
+
+
+class Supervisor:
+    """
+    Watches over the procedures while they run
+
+    A procedure that runs longer than `wall_timeout` seconds or makes no
+    output for `idle_timeout` seconds is stopped: its process group gets a
+    SIGTERM and, if it is still there after `grace_period` seconds, a
+    SIGKILL. Every `sample_interval` seconds the CPU, memory and storage
+    IO of the procedure and its child processes are read from /proc. A
+    procedure can be started with a lower priority (`nice`) and a limit
+    on its address space (`memory_limit` in bytes), so a runaway procedure
+    does not starve the others running on the same host. The limits are
+    applied by a small wrapper that then executes the procedure, see
+    `launcher`.
+    """
+
+    def __init__(self, wall_timeout: Optional[float] = None,
+                 idle_timeout: Optional[float] = None,
+                 grace_period: float = 5.0, sample_interval: float = 1.0,
+                 nice: Optional[int] = None,
+                 memory_limit: Optional[int] = None):
+        self.wall_timeout = wall_timeout
+        self.idle_timeout = idle_timeout
+        self.grace_period = grace_period
+        self.sample_interval = sample_interval
+        self.nice = nice
+        self.memory_limit = memory_limit
+
+    @classmethod
+    def load_from_config(cls, config: Dict):
+        """
+        given the 'supervision' entry of the scheduler configuration create
+        a supervisor
+        """
+        return cls(wall_timeout=config.get('wall_timeout'),
+                   idle_timeout=config.get('idle_timeout'),
+                   grace_period=config.get('grace_period', 5.0),
+                   sample_interval=config.get('sample_interval', 1.0),
+                   nice=config.get('nice'),
+                   memory_limit=config.get('memory_limit'))
+
+    @property
+    def launcher(self) -> Optional[List[str]]:
+        """
+        The command to put in front of the command of a procedure, so that
+        it runs with the limits, None if there are none. The wrapper
+        replaces itself with the procedure, which keeps its pid.
+        """
+        if self.nice is None and self.memory_limit is None:
+            return None
+        return [sys.executable, "-S", LIMIT_SCRIPT,
+                "-" if self.nice is None else str(self.nice),
+                "-" if self.memory_limit is None else str(self.memory_limit)]
+
+    def stop(self, run):
+        run.terminate()
+        if run.wait(self.grace_period) is None:
+            run.kill()
+            run.wait()
+
+    def supervise(self, run, on_sample=None,
+                  sample_path: Optional[str] = None) -> Optional[str]:
+        """
+        Wait until the run is over, returns why it was stopped or None if
+        it ended by itself. Every resource sample is handed to `on_sample`
+        and appended to the JSON lines file `sample_path`.
+        """
+        sampler = ResourceSampler(run.pid)
+        start = time.monotonic()
+        sample_file = open(sample_path, 'a') if sample_path else None
+        try:
+            while run.wait(self.sample_interval) is None:
+                sample = sampler.sample()
+                if sample is not None:
+                    if on_sample is not None:
+                        on_sample(sample)
+                    if sample_file is not None:
+                        sample_file.write(json.dumps(sample._asdict()) + "\n")
+                        sample_file.flush()
+                now = time.monotonic()
+                reason = None
+                if self.wall_timeout is not None and \
+                        now - start > self.wall_timeout:
+                    reason = f"ran longer than {self.wall_timeout} s"
+                elif self.idle_timeout is not None and \
+                        now - run.last_output > self.idle_timeout:
+                    reason = f"made no output for {self.idle_timeout} s"
+                if reason is not None:
+                    self.stop(run)
+                    return reason
+            return None
+        finally:
+            if sample_file is not None:
+                sample_file.close()
@@ -0,0 +1,317 @@
+import hashlib
+import os
+import posixpath
+import shlex
+import stat
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+from ntu_daq_gui.executor import STDOUT
+
+if TYPE_CHECKING:
+    from ntu_daq_gui.hexacontroller import Hexacontroller
+
+
+class TransferCancelled(Exception):
+    def __init__(self, message="The transfer was cancelled"):
+        super().__init__(message)
+
+
+class RemoteFile(NamedTuple):
+    path: str
+    # the path below the remote directory, the local copy has the same one
+    relative: str
+    size: int
+
+
+class FileResult(NamedTuple):
+    remote: str
+    local: str
+    size: int
+    # bytes that were actually transferred over the link, compressed if the
+    # transfer is, 0 if the file was already there
+    transferred: int
+    sha256: Optional[str]
+    error: Optional[str]
+
+
+def local_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remote_checksum(hexactrl: "Hexacontroller", path: str,
+                    timeout: Optional[float] = None) -> Optional[str]:
+    """
+    sha256 of the file computed on the Hexacontroller, None if that failed
+    """
+    reader = hexactrl.ssh_execute_command(f"sha256sum {shlex.quote(path)}")
+    output = reader.wait(timeout)
+    if not reader.is_done():
+        reader.close()
+        return None
+    text = "".join(line for stream, line in output if stream == STDOUT)
+    if reader.returncode != 0 or not text.strip():
+        return None
+    return text.split()[0]
+
+
+class Transfer:
+    """
+    Copies the files of a directory of the Hexacontroller to a local
+    directory in the background
+
+    The remote directory is listed once and the files are fetched, largest
+    first, over `parallel` SFTP channels of the pooled SSH transport with
+    pipelined reads. A file is first written to `<name>.part`; an
+    interrupted transfer continues where the part file ends. Once complete,
+    the file is compared with the sha256 computed on the Hexacontroller and
+    only then renamed, a mismatch restarts the file from the beginning. If
+    the Hexacontroller can not compute the checksum, the file is kept
+    unverified.
+    Files that are already present with the right size are skipped.
+
+    With `compress` the files are streamed through `gzip -1` on the
+    Hexacontroller instead of SFTP, which pays off for raw data on a slow
+    link if the Hexacontroller CPU keeps up.
+    """
+
+    def __init__(self, hexactrl: "Hexacontroller", remote_directory: str,
+                 local_directory: str, parallel: int = 4,
+                 compress: bool = False, verify: bool = True,
+                 block_size: int = 1 << 20, checksum_timeout: float = 600):
+        self.hexactrl = hexactrl
+        self.remote_directory = remote_directory
+        self.local_directory = local_directory
+        self.parallel = parallel
+        self.compress = compress
+        self.verify = verify
+        self.block_size = block_size
+        self.checksum_timeout = checksum_timeout
+        self.files: List[RemoteFile] = []
+        self.results: List[FileResult] = []
+        self.error: Optional[str] = None
+        self.bytes_done = 0
+        self.bytes_total = 0
+        self.start_time: Optional[float] = None
+        self.end_time: Optional[float] = None
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.local = threading.local()
+        self.sftp_clients = []
+
+    @classmethod
+    def load_from_config(cls, config: Dict, hexactrl: "Hexacontroller",
+                         local_directory: str):
+        """
+        given the 'transfer' entry of the configuration create the transfer
+        of the data of the Hexacontroller
+        """
+        return cls(hexactrl, config['remote_directory'], local_directory,
+                   parallel=config.get('parallel', 4),
+                   compress=config.get('compress', False),
+                   verify=config.get('verify', True))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def progress(self) -> Tuple[int, int, int, int]:
+        """
+        bytes done, bytes in total, files done and files in total
+        """
+        with self.lock:
+            return (self.bytes_done, self.bytes_total, len(self.results),
+                    len(self.files))
+
+    def run(self):
+        self.start_time = time.time()
+        try:
+            self.files = self.list_remote()
+            self.bytes_total = sum(f.size for f in self.files)
+            with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+                for result in pool.map(self.fetch, self.files):
+                    with self.lock:
+                        self.results.append(result)
+        except Exception as e:
+            # whatever goes wrong has to end up in the summary, nobody
+            # watches the thread
+            self.error = str(e) or type(e).__name__
+        finally:
+            for sftp in self.sftp_clients:
+                sftp.close()
+            self.end_time = time.time()
+            self.done.set()
+
+    def sftp(self):
+        """
+        The SFTP client of the calling thread, every client has a channel
+        of its own
+        """
+        sftp = getattr(self.local, 'sftp', None)
+        if sftp is None:
+            import paramiko
+            hexactrl = self.hexactrl
+            transport = hexactrl.pool.get_transport(
+                hexactrl.hostname, hexactrl.port, hexactrl.username,
+                hexactrl.password)
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            self.local.sftp = sftp
+            with self.lock:
+                self.sftp_clients.append(sftp)
+        return sftp
+
+    def list_remote(self) -> List[RemoteFile]:
+        files = []
+        directories = [""]
+        while directories:
+            relative_dir = directories.pop()
+            directory = posixpath.join(self.remote_directory, relative_dir)
+            for entry in self.sftp().listdir_attr(directory):
+                relative = posixpath.join(relative_dir, entry.filename)
+                if stat.S_ISDIR(entry.st_mode):
+                    directories.append(relative)
+                elif stat.S_ISREG(entry.st_mode):
+                    files.append(RemoteFile(
+                        posixpath.join(self.remote_directory, relative),
+                        relative, entry.st_size))
+        # the large files first, so that no channel is left with one at the end
+        files.sort(key=lambda f: f.size, reverse=True)
+        return files
+
+    def add_progress(self, size: int):
+        with self.lock:
+            self.bytes_done += size
+        if self.cancelled.is_set():
+            raise TransferCancelled()
+
+    def fetch(self, remote: RemoteFile) -> FileResult:
+        import paramiko
+        local = os.path.join(self.local_directory,
+                             *remote.relative.split(posixpath.sep))
+        part = local + ".part"
+        if os.path.exists(local) and os.path.getsize(local) == remote.size:
+            self.add_progress(remote.size)
+            return FileResult(remote.path, local, remote.size, 0, None, None)
+        transferred = 0
+        try:
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            if offset > remote.size:
+                offset = 0
+            self.add_progress(offset)
+            # a second attempt from scratch if the checksums do not match
+            for attempt in range(2):
+                if self.compress:
+                    transferred += self.download_compressed(remote, part,
+                                                            offset)
+                else:
+                    transferred += self.download(remote, part, offset)
+                checksum = None
+                if self.verify:
+                    checksum = local_checksum(part)
+                    expected = remote_checksum(self.hexactrl, remote.path,
+                                               self.checksum_timeout)
+                    if expected is None:
+                        print(f"Unable to compute the checksum of "
+                              f"{remote.path} on {self.hexactrl.name}, "
+                              f"it is kept unverified")
+                    elif checksum != expected:
+                        self.add_progress(-os.path.getsize(part))
+                        os.unlink(part)
+                        offset = 0
+                        continue
+                os.replace(part, local)
+                return FileResult(remote.path, local, remote.size,
+                                  transferred, checksum, None)
+            error = "the checksum does not match the one of the remote file"
+        except (paramiko.SSHException, OSError, EOFError,
+                TransferCancelled) as e:
+            error = str(e)
+        return FileResult(remote.path, local, remote.size, transferred, None,
+                          error)
+
+    def download(self, remote: RemoteFile, part: str, offset: int) -> int:
+        """
+        Append the remote file from `offset` on to the part file over SFTP
+        """
+        transferred = 0
+        with self.sftp().open(remote.path, 'rb') as remote_file, \
+                open(part, 'ab' if offset else 'wb') as local_file:
+            remote_file.seek(offset)
+            # request all blocks up front instead of one after the other
+            remote_file.prefetch(remote.size)
+            while True:
+                data = remote_file.read(self.block_size)
+                if not data:
+                    break
+                local_file.write(data)
+                transferred += len(data)
+                self.add_progress(len(data))
+        return transferred
+
+    def download_compressed(self, remote: RemoteFile, part: str,
+                            offset: int) -> int:
+        """
+        Append the remote file from `offset` on to the part file, compressed
+        with gzip on the Hexacontroller, returns the compressed bytes that
+        were received
+        """
+        hexactrl = self.hexactrl
+        channel = hexactrl.pool.open_session(
+            hexactrl.hostname, hexactrl.port, hexactrl.username,
+            hexactrl.password)
+        transferred = 0
+        try:
+            channel.exec_command(f"tail -c +{offset + 1} "
+                                 f"{shlex.quote(remote.path)} | gzip -1 -c")
+            decompressor = zlib.decompressobj(wbits=31)
+            with open(part, 'ab' if offset else 'wb') as local_file:
+                while True:
+                    chunk = channel.recv(self.block_size)
+                    if not chunk:
+                        break
+                    transferred += len(chunk)
+                    data = decompressor.decompress(chunk)
+                    local_file.write(data)
+                    # the progress is measured against the size of the files
+                    self.add_progress(len(data))
+                data = decompressor.flush()
+                local_file.write(data)
+                self.add_progress(len(data))
+            status = channel.recv_exit_status()
+            if status != 0 or not decompressor.eof:
+                raise OSError(f"Compressing {remote.path} on "
+                              f"{hexactrl.name} failed with exit status "
+                              f"{status}")
+        finally:
+            channel.close()
+        return transferred
+
+    def summary(self) -> Dict:
+        failed = [r for r in self.results if r.error is not None]
+        duration = None
+        if self.start_time is not None and self.end_time is not None:
+            duration = self.end_time - self.start_time
+        return {
+            "hexacontroller": self.hexactrl.name,
+            "remote_directory": self.remote_directory,
+            "local_directory": self.local_directory,
+            "files": len(self.files),
+            "failed": [r._asdict() for r in failed],
+            "bytes": self.bytes_total,
+            "transferred": sum(r.transferred for r in self.results),
+            "duration": duration,
+            "error": self.error,
+        }
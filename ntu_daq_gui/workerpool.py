@@ -0,0 +1,305 @@
+import json
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, IO, List, Optional, Tuple
+
+from ntu_daq_gui import runlog
+from ntu_daq_gui.executor import STDOUT, STDERR
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "poolworker.py")
+
+
+class PooledRun:
+    """
+    A procedure that runs in a worker of the pool
+
+    Offers the same interface as the Executor, so the scheduler does not
+    need to know where the procedure runs.
+    """
+
+    def __init__(self, worker: "PoolWorker", arguments: List[str],
+                 max_queued_lines: int = 10000,
+                 log_writer: Optional[runlog.RunLogWriter] = None):
+        self.worker = worker
+        self.run_command = arguments
+        self.log_writer = log_writer
+        self.output_queue = queue.Queue(maxsize=max_queued_lines)
+        self.open_streams = 2
+        self.exit_code: Optional[int] = None
+        self.done = threading.Event()
+        self.ended_streams = 0
+        self.last_output = time.monotonic()
+
+    @property
+    def pid(self) -> int:
+        return self.worker.process.pid
+
+    def put(self, stream: str, line: str):
+        self.last_output = time.monotonic()
+        if self.log_writer is not None:
+            self.log_writer.write(stream, line)
+        self.output_queue.put((stream, line))
+
+    def end_stream(self, stream: str, exit_code: int) -> bool:
+        """
+        Called by the readers of the worker once the run is over on a
+        stream, returns True once it is over on both
+        """
+        self.output_queue.put((stream, None))
+        if stream == STDOUT or self.exit_code is None:
+            self.exit_code = exit_code
+        self.ended_streams += 1
+        return self.ended_streams == 2
+
+    def send_signal(self, sig: int):
+        # the state of the interpreter is unknown after that, so the worker
+        # is replaced even if the procedure handles the signal and exits
+        self.worker.retired = True
+        try:
+            os.killpg(self.worker.process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        self.done.wait(timeout)
+        return self.returncode
+
+    @property
+    def returncode(self):
+        return self.exit_code if self.done.is_set() else None
+
+    def is_done(self) -> bool:
+        return self.done.is_set() and self.open_streams == 0
+
+    def get_output(self, max_lines: int = 1000) -> List[Tuple[str, str]]:
+        """
+        Return up to `max_lines` (stream, line) tuples without blocking
+        """
+        lines = []
+        while len(lines) < max_lines:
+            try:
+                stream, line = self.output_queue.get_nowait()
+            except queue.Empty:
+                break
+            if line is None:
+                self.open_streams -= 1
+            else:
+                lines.append((stream, line))
+        return lines
+
+
+class PoolWorker:
+    """
+    A Python process that has imported the modules of the pool in advance
+    and runs one procedure after the other
+    """
+
+    def __init__(self, pool: "WorkerPool"):
+        self.pool = pool
+        self.token = f"__pool_worker_{uuid.uuid4().hex}__"
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        self.process = subprocess.Popen(
+            [*(pool.launcher or []), pool.python, WORKER_SCRIPT, self.token,
+             *pool.preload],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, text=True, errors="replace", env=env,
+            start_new_session=True)
+        self.runs = 0
+        self.retired = False
+        self.run: Optional[PooledRun] = None
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.readers = [
+            threading.Thread(target=self._read_stream,
+                             args=(self.process.stdout, STDOUT), daemon=True),
+            threading.Thread(target=self._read_stream,
+                             args=(self.process.stderr, STDERR), daemon=True),
+        ]
+        for reader in self.readers:
+            reader.start()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def start_run(self, arguments: List[str], max_queued_lines: int,
+                  log_writer: Optional[runlog.RunLogWriter]) -> PooledRun:
+        run = PooledRun(self, arguments, max_queued_lines, log_writer)
+        self.run = run
+        self.runs += 1
+        request = {"file": arguments[0], "argv": arguments}
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+        except OSError:
+            # the worker died, the readers end the run with its exit code
+            self.process.kill()
+        return run
+
+    def _read_stream(self, stream: IO[str], name: str):
+        """
+        Pass the lines of the current run on and end it at the marker line.
+        The marker starts with a newline, so a blank line right before it
+        belongs to the marker and is only passed on once the next line
+        shows that it does not. What the worker writes before it is ready
+        does not belong to any run.
+        """
+        blank = False
+        ready = False
+        try:
+            for line in iter(stream.readline, ""):
+                if line.startswith(self.token):
+                    kind, *args = line.split()[1:]
+                    if kind == "READY":
+                        ready = True
+                        if name == STDOUT:
+                            self.ready.set()
+                    elif kind == "END":
+                        blank = False
+                        self._end_run(name, int(args[0]))
+                    continue
+                if blank:
+                    self._forward(name, "\n", ready)
+                blank = line == "\n"
+                if not blank:
+                    self._forward(name, line, ready)
+        finally:
+            if blank:
+                self._forward(name, "\n", ready)
+            stream.close()
+            self.ready.set()
+            self._end_run(name, self.process.wait())
+
+    def _forward(self, name: str, line: str, ready: bool):
+        if ready and self.run is not None:
+            self.run.put(name, line)
+        else:
+            # e.g. the warnings about modules that could not be imported
+            print(f"pool worker {self.process.pid}: {line}", end="")
+
+    def _end_run(self, name: str, exit_code: int):
+        with self.lock:
+            run = self.run
+            if run is None or not run.end_stream(name, exit_code):
+                return
+            self.run = None
+        # the worker is back in the pool before anybody learns that the run
+        # is done and starts the next one
+        self.pool.release(self, run.exit_code)
+        run.done.set()
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        if self.alive:
+            self.process.kill()
+
+
+class WorkerPool:
+    """
+    Pool of warm Python processes that run the procedure scripts
+
+    Starting a new interpreter and importing the DAQ stack for every
+    procedure can take longer than a short calibration step itself. The
+    workers import the `preload` modules once and then run the scripts
+    with runpy, just like `python script args...` would. As a script may
+    leave state behind in the interpreter, a worker is replaced after
+    `max_runs` runs and after every failed run. Every worker is started
+    through `launcher`, e.g. the wrapper that limits its resources, so the
+    limits apply to every procedure the worker runs.
+    """
+
+    def __init__(self, size: int = 2, preload: Optional[List[str]] = None,
+                 max_runs: int = 20, python: Optional[str] = None,
+                 launcher: Optional[List[str]] = None):
+        self.size = size
+        self.launcher = launcher
+        self.preload = preload if preload is not None else []
+        self.max_runs = max_runs
+        self.python = python if python is not None else sys.executable
+        self.idle: Deque[PoolWorker] = deque()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    @classmethod
+    def load_from_config(cls, config: Dict):
+        """
+        given the 'worker_pool' entry of the configuration create a pool
+        """
+        return cls(
+            size=config.get('size', 2),
+            preload=config.get('preload', []),
+            max_runs=config.get('max_runs', 20),
+        )
+
+    def start(self):
+        """
+        Start the workers in the background, they are ready after they have
+        imported the preload modules
+        """
+        with self.lock:
+            while len(self.idle) < self.size:
+                self.idle.append(PoolWorker(self))
+
+    def run(self, arguments: List[str], max_queued_lines: int = 10000,
+            log_writer: Optional[runlog.RunLogWriter] = None) -> PooledRun:
+        """
+        Run the script (the first of the arguments) in an idle worker, or
+        in a new one if all are busy
+        """
+        worker = None
+        with self.lock:
+            while self.idle:
+                candidate = self.idle.popleft()
+                if candidate.alive:
+                    worker = candidate
+                    break
+                candidate.close()
+        if worker is None:
+            # all workers are busy, this one is retired after the run
+            worker = PoolWorker(self)
+        worker.ready.wait()
+        if not worker.alive:
+            raise OSError(f"The pool worker exited with "
+                          f"{worker.process.returncode} before it was ready")
+        return worker.start_run(arguments, max_queued_lines, log_writer)
+
+    def release(self, worker: PoolWorker, exit_code: int):
+        """
+        Put the worker back into the pool after a successful run, otherwise
+        replace it
+        """
+        with self.lock:
+            keep = (not self.closed and exit_code == 0 and worker.alive
+                    and not worker.retired and worker.runs < self.max_runs
+                    and len(self.idle) < self.size)
+            if keep:
+                self.idle.append(worker)
+        if not keep:
+            worker.close()
+            if not self.closed:
+                self.start()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            workers = list(self.idle)
+            self.idle.clear()
+        for worker in workers:
+            worker.close()
@@ -0,0 +1,353 @@
+import collections
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+class ServerError(Exception):
+    def __init__(self, message="The zmq server of the Hexacontroller did not answer as expected"):
+        super().__init__(message)
+
+
+def merge(base: Dict, update: Dict) -> Dict:
+    """
+    Return a copy of `base` with the nested entries of `update` merged in
+    """
+    merged = dict(base)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def select(values: Any, request: Any) -> Any:
+    """
+    The part of `values` that has the keys of the nested `request`
+    """
+    if not isinstance(request, dict) or not isinstance(values, dict):
+        return values
+    return {key: select(values[key], sub_request)
+            for key, sub_request in request.items() if key in values}
+
+
+def encode(payload: Any) -> bytes:
+    import yaml
+    return yaml.safe_dump(payload).encode()
+
+
+def decode(reply: bytes) -> Any:
+    import yaml
+    return yaml.safe_load(reply)
+
+
+class Request:
+    """
+    A request that was sent to the server and the future for its result
+
+    A request with a payload takes two messages, the command, which the
+    server answers with "ready", and the payload as a YAML document, which
+    it answers with the result.
+    """
+
+    def __init__(self, command: str, payload: Any = None,
+                 parse: bool = False):
+        self.command = command
+        self.payload = payload
+        self.parse = parse
+        self.future: Future = Future()
+        self.replies: List[bytes] = []
+        self.expected = 2 if payload is not None else 1
+        self.sent = 0.0
+
+    def frames(self) -> List[List[bytes]]:
+        # the empty frame is the envelope a REP socket expects from a DEALER
+        frames = [[b"", self.command.encode()]]
+        if self.payload is not None:
+            frames.append([b"", encode(self.payload)])
+        return frames
+
+    def fail(self, error: Exception):
+        # the caller may have cancelled the future in the meantime
+        if not self.future.done():
+            self.future.set_exception(error)
+
+    def complete(self):
+        if self.future.done():
+            return
+        first = self.replies[0].decode(errors='replace')
+        if self.payload is not None and "ready" not in first.lower():
+            self.future.set_exception(ServerError(
+                f"The server refused {self.command}: {first}"))
+        elif self.parse:
+            try:
+                self.future.set_result(decode(self.replies[-1]))
+            except Exception as e:
+                self.future.set_exception(ServerError(
+                    f"Unable to decode the reply to {self.command}: {e}"))
+        else:
+            self.future.set_result(self.replies[-1].decode(errors='replace'))
+
+
+class Batch:
+    """
+    Collects register writes and reads and sends them as one configure and
+    one read request when it is submitted or its `with` block ends
+    """
+
+    def __init__(self, client: "BoardClient"):
+        self.client = client
+        self.writes: Dict = {}
+        self.reads: List[Tuple[Dict, Future]] = []
+
+    def write(self, registers: Dict):
+        self.writes = merge(self.writes, registers)
+
+    def read(self, registers: Dict) -> Future:
+        """
+        The future gets the values of the requested registers once the
+        batch was read
+        """
+        future: Future = Future()
+        self.reads.append((registers, future))
+        return future
+
+    def submit(self) -> Optional[Future]:
+        """
+        Send the batch, returns the future of the write or None if there
+        was nothing to write
+        """
+        written = None
+        writes, self.writes = self.writes, {}
+        reads, self.reads = self.reads, []
+        if writes:
+            written = self.client.configure(writes)
+        if reads:
+            request: Dict = {}
+            for registers, _ in reads:
+                request = merge(request, registers)
+            values = self.client.read(request)
+            # reads added after this submit go with the next one
+            values.add_done_callback(
+                lambda values: self.distribute(values, reads))
+        return written
+
+    @staticmethod
+    def distribute(values: Future, reads: List[Tuple[Dict, Future]]):
+        error = values.exception()
+        for registers, future in reads:
+            # the caller may have cancelled the read in the meantime
+            if not future.set_running_or_notify_cancel():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(select(values.result(), registers))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.submit()
+
+
+class BoardClient:
+    """
+    Client of the slow control or DAQ server of one Hexacontroller
+
+    The servers are zmq REP sockets that answer one request after the
+    other. The client keeps a single DEALER socket to the server, owned by
+    an I/O thread, and sends every request as soon as it is submitted
+    instead of waiting for the reply to the previous one, so the round
+    trips of consecutive requests overlap. The replies come back in order
+    and resolve the futures the requests returned. If a reply takes longer
+    than `timeout`, all outstanding requests fail and the next request
+    connects anew, as the server is in an unknown state.
+    """
+
+    def __init__(self, hostname: str, port: int, timeout: float = 10.0):
+        self.hostname = hostname
+        self.port = port
+        self.timeout = timeout
+        self.outgoing: Deque[Request] = collections.deque()
+        self.pending: Deque[Request] = collections.deque()
+        self.lock = threading.Lock()
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        self.closed = False
+        self.thread: Optional[threading.Thread] = None
+
+    def submit(self, command: str, payload: Any = None,
+               parse: bool = False) -> Future:
+        """
+        Queue a request for the server and return the future of its reply,
+        the decoded YAML reply if `parse` is set
+        """
+        request = Request(command, payload, parse)
+        with self.lock:
+            if self.closed:
+                raise ServerError(f"The client of {self.hostname}:{self.port} "
+                                  "is closed")
+            if self.thread is None:
+                # zmq is only imported when a board is actually talked to
+                import zmq  # noqa: F401
+                self.thread = threading.Thread(target=self._io_loop,
+                                               daemon=True)
+                self.thread.start()
+            self.outgoing.append(request)
+        os.write(self.wakeup_write, b"x")
+        return request.future
+
+    def call(self, command: str, payload: Any = None, parse: bool = False):
+        """
+        Send a request and wait for its reply
+        """
+        return self.submit(command, payload, parse).result(self.timeout * 2)
+
+    def configure(self, registers: Dict) -> Future:
+        return self.submit("configure", registers)
+
+    def initialize(self, config: Dict) -> Future:
+        return self.submit("initialize", config)
+
+    def read(self, registers: Dict) -> Future:
+        return self.submit("read", registers, parse=True)
+
+    def batch(self) -> Batch:
+        return Batch(self)
+
+    def _connect(self, context):
+        import zmq
+        socket = context.socket(zmq.DEALER)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(f"tcp://{self.hostname}:{self.port}")
+        return socket
+
+    @staticmethod
+    def _disconnect(poller, socket):
+        if socket is not None:
+            try:
+                poller.unregister(socket)
+            except KeyError:
+                pass
+            socket.close()
+        return None
+
+    def _fail_pending(self, error: ServerError):
+        for request in self.pending:
+            request.fail(error)
+        self.pending.clear()
+
+    def _io_loop(self):
+        import zmq
+        context = zmq.Context.instance()
+        socket = None
+        poller = zmq.Poller()
+        poller.register(self.wakeup_read, zmq.POLLIN)
+        while not self.closed:
+            try:
+                if socket is None and self.outgoing:
+                    socket = self._connect(context)
+                    poller.register(socket, zmq.POLLIN)
+                while socket is not None and self.outgoing:
+                    with self.lock:
+                        request = self.outgoing.popleft()
+                    try:
+                        messages = request.frames()
+                    except Exception as e:
+                        request.fail(ServerError(
+                            f"Unable to encode {request.command}: {e}"))
+                        continue
+                    request.sent = time.monotonic()
+                    # pending first, so that a failed send fails it as well
+                    self.pending.append(request)
+                    for frames in messages:
+                        socket.send_multipart(frames)
+                timeout = None
+                if self.pending:
+                    timeout = max(0, (self.pending[0].sent + self.timeout -
+                                      time.monotonic()) * 1000)
+                events = dict(poller.poll(timeout))
+                if self.wakeup_read in events:
+                    os.read(self.wakeup_read, 4096)
+                while socket is not None and self.pending:
+                    try:
+                        frames = socket.recv_multipart(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    request = self.pending[0]
+                    request.replies.append(frames[-1])
+                    if len(request.replies) == request.expected:
+                        self.pending.popleft()
+                        request.complete()
+                        if self.pending:
+                            # the next reply is due a timeout after this one
+                            self.pending[0].sent = time.monotonic()
+                if self.pending and time.monotonic() > \
+                        self.pending[0].sent + self.timeout:
+                    self._fail_pending(ServerError(
+                        f"{self.hostname}:{self.port} did not answer "
+                        f"{self.pending[0].command} within {self.timeout} s"))
+                    socket = self._disconnect(poller, socket)
+            except Exception as e:
+                # the thread must not die with futures left unresolved, the
+                # socket is in an unknown state and the next request
+                # connects anew
+                error = ServerError(f"The connection to {self.hostname}:"
+                                    f"{self.port} failed: {e}")
+                with self.lock:
+                    self.pending.extend(self.outgoing)
+                    self.outgoing.clear()
+                self._fail_pending(error)
+                socket = self._disconnect(poller, socket)
+        self._fail_pending(ServerError(f"The client of {self.hostname}:"
+                                       f"{self.port} was closed"))
+        if socket is not None:
+            socket.close()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            thread = self.thread
+            for request in self.outgoing:
+                request.fail(ServerError(
+                    f"The client of {self.hostname}:{self.port} was closed"))
+            self.outgoing.clear()
+        os.write(self.wakeup_write, b"x")
+        if thread is not None:
+            thread.join()
+        os.close(self.wakeup_read)
+        os.close(self.wakeup_write)
+
+
+class ClientPool:
+    """
+    One client per server that is shared by everything that talks to it
+    """
+
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+        self.clients: Dict[Tuple[str, int], BoardClient] = {}
+        self.lock = threading.Lock()
+
+    def get(self, hostname: str, port: int) -> BoardClient:
+        key = (hostname, int(port))
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = self.clients[key] = BoardClient(hostname, int(port),
+                                                         self.timeout)
+            return client
+
+    def close(self):
+        with self.lock:
+            clients = list(self.clients.values())
+            self.clients.clear()
+        for client in clients:
+            client.close()
+
+
+default_pool = ClientPool()
@@ -0,0 +1,64 @@
+import subprocess
+
+from ntu_daq_gui import batch
+from ntu_daq_gui.executor import STDOUT, STDERR
+
+TOKEN = "__hexactrl_batch_test__"
+
+
+def run_script(commands, stop_on_failure=False):
+    """
+    Run the batch script with the local shell, the output of the streams
+    is returned one after the other, which is all parse_output relies on
+    """
+    script = batch.build_script(commands, TOKEN, stop_on_failure)
+    process = subprocess.run(["sh", "-c", script], capture_output=True,
+                             text=True)
+    return ([(STDOUT, line) for line in
+             process.stdout.splitlines(keepends=True)] +
+            [(STDERR, line) for line in
+             process.stderr.splitlines(keepends=True)])
+
+
+class LogWriter:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, stream, text, timestamp=None):
+        self.lines.append((stream, text))
+
+
+def test_parse_output():
+    commands = ["echo one; echo two", "echo oops >&2; exit 3",
+                "printf 'no newline'", "true"]
+    results = batch.parse_output(commands, TOKEN, run_script(commands))
+    assert [r.command for r in results] == commands
+    assert [r.exit_status for r in results] == [0, 3, 0, 0]
+    assert results[0].stdout == "one\ntwo\n"
+    assert results[1].stderr == "oops\n"
+    assert results[2].stdout == "no newline"
+    assert results[3].stdout == "" and results[3].stderr == ""
+    assert all(r.duration is not None and r.duration >= 0 for r in results)
+
+
+def test_parse_output_stop_on_failure():
+    commands = ["echo first", "false", "echo never"]
+    results = batch.parse_output(commands, TOKEN,
+                                 run_script(commands, stop_on_failure=True))
+    assert [r.exit_status for r in results] == [0, 1, None]
+    assert results[2].stdout == ""
+
+
+def test_marker_filter_keeps_only_the_output():
+    commands = ["echo one", "echo", "printf 'open'", "echo err >&2",
+                "printf 'err open' >&2"]
+    writer = LogWriter()
+    marker_filter = batch.MarkerFilter(writer, TOKEN)
+    for stream, line in run_script(commands):
+        marker_filter.write(stream, line)
+    marker_filter.flush()
+    assert all(TOKEN not in line for _, line in writer.lines)
+    assert [line for stream, line in writer.lines if stream == STDOUT] == \
+        ["one\n", "\n", "open\n"]
+    assert [line for stream, line in writer.lines if stream == STDERR] == \
+        ["err\n", "err open"]
@@ -0,0 +1,86 @@
+import pytest
+
+from ntu_daq_gui import campaign as cmp
+from ntu_daq_gui import hexacontroller as hx
+from ntu_daq_gui import procedure as prc
+from ntu_daq_gui import scheduler as sched
+
+
+class Crash(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, state):
+        self.state = state
+        self.returncode = 0 if state == sched.Job.SUCCEEDED else 1
+        self.error = None
+        self.run_dir = self.log_path = None
+
+
+class Scheduler:
+    """
+    Runs every submitted step at once, `crash_at` names the procedure the
+    process dies in
+    """
+
+    def __init__(self, crash_at=None):
+        self.crash_at = crash_at
+        self.ran = []
+
+    def submit(self, procedure, hexactrl, module_id):
+        if procedure.name == self.crash_at:
+            raise Crash()
+        self.ran.append(procedure.name)
+        return Job(sched.Job.SUCCEEDED)
+
+    def idle(self):
+        return True
+
+
+def make_campaign(tmp_path, procedures, scheduler):
+    hexactrl = hx.Hexacontroller("root", "", "hexa1")
+    journal = cmp.Journal(str(tmp_path / "M1.jsonl"))
+    return cmp.Campaign("M1", procedures, hexactrl, scheduler, journal)
+
+
+def test_resume_after_crash(tmp_path):
+    procedures = [prc.Procedure(name, str(tmp_path / f"{name}.py"), {}, "")
+                  for name in ("init", "pedestal", "trim")]
+    scheduler = Scheduler()
+    make_campaign(tmp_path, procedures, scheduler).run(echo=False)
+    assert scheduler.ran == ["init", "pedestal", "trim"]
+
+    # nothing changed, nothing runs again
+    scheduler = Scheduler()
+    steps = make_campaign(tmp_path, procedures, scheduler).run(
+        resume=True, echo=False)
+    assert scheduler.ran == []
+    assert [s["state"] for s in steps] == [cmp.SKIPPED] * 3
+
+    # the first step changed and runs again, the process dies in the second
+    procedures[0].add_option("gain", "-g", "2")
+    scheduler = Scheduler(crash_at="pedestal")
+    with pytest.raises(Crash):
+        make_campaign(tmp_path, procedures, scheduler).run(
+            resume=True, echo=False)
+    assert scheduler.ran == ["init"]
+
+    # the earlier records of the later steps predate the new first step
+    scheduler = Scheduler()
+    steps = make_campaign(tmp_path, procedures, scheduler).run(
+        resume=True, echo=False)
+    assert scheduler.ran == ["pedestal", "trim"]
+    assert [s["state"] for s in steps] == [
+        cmp.SKIPPED, sched.Job.SUCCEEDED, sched.Job.SUCCEEDED]
+
+
+def test_changed_step_runs_the_later_ones_again(tmp_path):
+    procedures = [prc.Procedure(name, str(tmp_path / f"{name}.py"), {}, "")
+                  for name in ("init", "pedestal", "trim")]
+    make_campaign(tmp_path, procedures, Scheduler()).run(echo=False)
+    procedures[1].add_option("gain", "-g", "2")
+    scheduler = Scheduler()
+    make_campaign(tmp_path, procedures, scheduler).run(resume=True,
+                                                        echo=False)
+    assert scheduler.ran == ["pedestal", "trim"]
@@ -0,0 +1,107 @@
+import pytest
+
+from ntu_daq_gui import extract
+
+
+@pytest.mark.parametrize("pattern, literal", [
+    (r"link (\d+) lost", "link "),
+    (r"progress: (?P<current>\d+)/(?P<total>\d+)", "progress: "),
+    (r"temp\s*=\s*(?P<value>[\d.]+)", "temp"),
+    (r"foo\.bar", "foo.bar"),
+    (r"ab+c", "ab"),
+    (r"x|y", ""),
+    # the numbers of quantifiers are not text
+    (r"ch\d{10,100}", "ch"),
+    (r"a{3}b", "b"),
+    (r"abc{2,}de", "ab"),
+    # a { that is not a quantifier is matched literally
+    (r"a{b", "a{b"),
+])
+def test_required_literal(pattern, literal):
+    assert extract.required_literal(pattern) == literal
+
+
+@pytest.mark.parametrize("pattern", [
+    r"\x41BC", r"\N{EM DASH}abc", r"\101BC", r"(a)bc\1",
+    r"(?i)abc",
+])
+def test_required_literal_unknown(pattern):
+    assert extract.required_literal(pattern) is None
+
+
+@pytest.mark.parametrize("pattern, line", [
+    (r"ch\d{10,100}", "ch12345678901"),
+    (r"a{3}b", "aaab"),
+    (r"\x41BC", "ABC"),
+    (r"(?i)link lost", "LINK LOST"),
+])
+def test_prefilter_keeps_matches(pattern, line):
+    extractor = extract.Extractor([extract.Rule("rule", extract.VALUE,
+                                                pattern)])
+    event = extractor.feed(line)
+    assert event is not None and event.rule == "rule"
+
+
+def test_extractor_kinds():
+    extractor = extract.Extractor.load_from_config([
+        {"name": "steps", "kind": "progress",
+         "pattern": r"step (?P<current>\d+)/(?P<total>\d+)"},
+        {"name": "temp", "kind": "value", "type": "float",
+         "pattern": r"T\[(?P<x>\d+)\] = (?P<value>[\d.]+)"},
+        {"name": "lost", "kind": "warning",
+         "pattern": r"WARN (?P<message>.*)"},
+    ])
+    assert extractor.literals
+    assert extractor.feed("nothing to see\n") is None
+    progress = extractor.feed("step 3/4\n")
+    assert (progress.rule, progress.value) == ("steps", 0.75)
+    value = extractor.feed("T[2] = 25.5\n")
+    assert (value.rule, value.value, value.x) == ("temp", 25.5, 2.0)
+    warning = extractor.feed("WARN link 3 lost\n")
+    assert (warning.kind, warning.value) == (extract.WARNING, "link 3 lost")
+
+
+def test_extractor_without_literal_scans_every_line():
+    extractor = extract.Extractor([
+        extract.Rule("a", extract.VALUE, r"(?P<value>\d+) ok"),
+        extract.Rule("b", extract.VALUE, r"\d+|x"),
+    ])
+    assert extractor.literals == []
+    assert extractor.feed("12").value == "12"
+
+
+def test_first_rule_wins():
+    extractor = extract.Extractor([
+        extract.Rule("late", extract.VALUE, r"late=(?P<value>\d+)"),
+        extract.Rule("early", extract.VALUE, r"early=(?P<value>\d+)"),
+        extract.Rule("later", extract.VALUE, r"late=\d+ (?P<value>\w+)"),
+    ])
+    event = extractor.feed("early=1 late=2 ok\n")
+    assert (event.rule, event.value) == ("late", "2")
+    event = extractor.feed("early=1\n")
+    assert (event.rule, event.value) == ("early", "1")
+
+
+def test_named_back_reference():
+    extractor = extract.Extractor([
+        extract.Rule("a", extract.VALUE, r"x(?P<c>\d)"),
+        extract.Rule("pair", extract.VALUE, r"(?P<c>\w)(?P=c)"),
+    ])
+    assert extractor.feed("aa").rule == "pair"
+    assert extractor.feed("ab") is None
+
+
+def test_invalid_rules():
+    with pytest.raises(extract.RuleError):
+        extract.Extractor([extract.Rule("a", extract.VALUE, "x"),
+                           extract.Rule("pair", extract.VALUE, r"(\w)\1")])
+    with pytest.raises(extract.RuleError):
+        extract.Extractor([extract.Rule("c", extract.VALUE,
+                                        r"(a)?(?(1)b|c)")])
+    with pytest.raises(extract.RuleError):
+        extract.Extractor([extract.Rule("bad", extract.VALUE, "(")])
+    with pytest.raises(extract.RuleError):
+        extract.Rule.load_from_config({"name": "x", "kind": "nope",
+                                       "pattern": "x"})
+    with pytest.raises(extract.RuleError):
+        extract.Rule.load_from_config({"name": "x"})
@@ -0,0 +1,119 @@
+import sqlite3
+import time
+
+from ntu_daq_gui import history as hist
+
+
+def record_run(writer, key, lines, **row):
+    row = dict({"procedure": "pedestal_run", "hexacontroller": "hexa1",
+                "state": "running", "start_time": time.time()}, **row)
+    writer.run_started(key, row)
+    writer.add_lines(key, lines)
+    writer.run_finished(key, {"state": "succeeded", "returncode": 0})
+
+
+def test_search_and_lines(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    writer = hist.HistoryWriter(path)
+    record_run(writer, "a", [("stdout", "configuring\n"),
+                             ("stderr", "ERROR link lost on elink 3\n"),
+                             ("stdout", "done\n")],
+               module_id="M1", start_time=100.0)
+    record_run(writer, "b", [("stdout", "all links up\n")] * 3,
+               hexacontroller="hexa2", start_time=200.0)
+    writer.close()
+
+    store = hist.HistoryStore(path)
+    try:
+        runs = store.search()
+        assert [run["hexacontroller"] for run in runs] == ["hexa2", "hexa1"]
+        assert runs[1]["lines"] == 3
+        assert runs[1]["state"] == "succeeded"
+
+        assert [run["module_id"] for run in store.search(module_id="M1")] \
+            == ["M1"]
+        assert store.search(hexacontroller="hexa3") == []
+        assert [run["start_time"] for run in store.search(since=150)] \
+            == [200.0]
+
+        found = store.search(text="link lost")
+        assert len(found) == 1 and found[0]["matches"] == 1
+        # the text is a phrase, the query syntax of FTS5 does not apply
+        assert store.search(text='lost" OR "up') == []
+
+        run_id = found[0]["id"]
+        assert store.lines(run_id) == [
+            (0, "stdout", "configuring"),
+            (1, "stderr", "ERROR link lost on elink 3"),
+            (2, "stdout", "done")]
+        assert store.lines(run_id, "LINK LOST") == [
+            (1, "stderr", "ERROR link lost on elink 3")]
+        assert store.lines(run_id, limit=1) == [(0, "stdout", "configuring")]
+        assert store.distinct("hexacontroller") == ["hexa1", "hexa2"]
+    finally:
+        store.close()
+
+
+def test_rolled_back_run_gets_no_lines(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    writer = hist.HistoryWriter(path, flush_interval=0.3)
+    row = {"procedure": "p", "hexacontroller": "h", "state": "running"}
+    writer.run_started("a", row)
+    time.sleep(0.6)
+    # the duplicate run key rolls back the whole transaction, the start of
+    # run b included
+    writer.run_started("b", row)
+    writer.run_started("a", row)
+    time.sleep(0.6)
+    writer.run_started("c", row)
+    writer.add_lines("b", [("stdout", "line of b\n")])
+    writer.add_lines("c", [("stdout", "line of c\n")])
+    writer.close()
+    assert writer.error is not None
+
+    store = hist.HistoryStore(path)
+    try:
+        lines = [line for run in store.search()
+                 for line in store.lines(run["id"])]
+        assert lines == [(0, "stdout", "line of c")]
+    finally:
+        store.close()
+
+
+def test_calls_do_not_block_on_a_busy_database(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    hist.connect(path).close()
+    blocker = sqlite3.connect(path)
+    blocker.execute("BEGIN IMMEDIATE")
+    writer = hist.HistoryWriter.load_from_config(
+        {"path": path, "flush_interval": 0.01, "max_queued": 3}, None)
+    assert writer.max_queued == 3
+    row = {"procedure": "p", "hexacontroller": "h", "state": "running"}
+    start = time.monotonic()
+    for i in range(10):
+        writer.run_started(f"run{i}", row)
+        writer.add_lines(f"run{i}", [("stdout", "line\n")])
+        writer.run_finished(f"run{i}", {"state": "succeeded"})
+    assert time.monotonic() - start < 1
+    assert writer.dropped_lines > 0
+    blocker.rollback()
+    blocker.close()
+    writer.close()
+
+    store = hist.HistoryStore(path)
+    try:
+        runs = store.search()
+        assert len(runs) == 10
+        assert {run["state"] for run in runs} == {"succeeded"}
+        assert sum(run["lines"] for run in runs) == \
+            10 - writer.dropped_lines
+    finally:
+        store.close()
+
+
+def test_disabled_history(tmp_path):
+    assert hist.HistoryWriter.load_from_config(False, str(tmp_path)) is None
+    assert hist.HistoryWriter.load_from_config(True, None) is None
+    writer = hist.HistoryWriter.load_from_config(True, str(tmp_path))
+    writer.close()
+    assert writer.path == str(tmp_path / "history.sqlite3")
@@ -0,0 +1,136 @@
+import re
+
+import pytest
+
+from ntu_daq_gui import logview
+from ntu_daq_gui.executor import STDOUT, STDERR
+from ntu_daq_gui.logview import LineFilter, LineSpill, LogSearch
+
+LINES = [
+    ("configuring board 1", STDOUT),
+    ("WARNING: pedestal drift on ch12", STDOUT),
+    ("Traceback (most recent call last):", STDERR),
+    ("ValueError: bad value on ch7", STDERR),
+    ("writing run 42 to disk", STDOUT),
+    ("fit failed for ch130", STDOUT),
+    ("Ünïcode line with tab\tinside", None),
+    ("done", STDOUT),
+]
+
+
+def make_spill(lines, stride=3):
+    spill = LineSpill(stride=stride)
+    for text, tag in lines:
+        spill.append(text, tag, logview.line_info(text, tag))
+    return spill
+
+
+def search(line_filter, lines=LINES, block_size=64):
+    spill = make_spill(lines)
+    log_search = LogSearch(line_filter, spill, len(lines), block_size)
+    log_search.scan_done.wait(5)
+    found = log_search.take(len(lines) + 1)
+    log_search.cancel()
+    spill.close()
+    assert log_search.error is None
+    return [line_no for line_no, _, _ in found]
+
+
+def test_spill_read():
+    spill = make_spill(LINES)
+    assert spill.read(0, len(LINES)) == LINES
+    assert spill.read(4, 6) == LINES[4:6]
+    assert spill.read(7, 100) == LINES[7:]
+    assert spill.read(5, 5) == []
+    spill.clear()
+    assert spill.read(0, 10) == []
+    spill.close()
+
+
+def test_line_info():
+    assert logview.line_info("all fine", STDOUT) == logview.INFO << 1
+    assert logview.line_info("Warning: x", STDOUT) == logview.WARNING << 1
+    assert logview.line_info("FATAL", STDERR) == logview.ERROR << 1 | 1
+
+
+@pytest.mark.parametrize("line_filter, expected", [
+    (LineFilter("ch1"), [1, 5]),
+    (LineFilter("VALUE"), [3]),
+    (LineFilter("ünï"), [6]),
+    (LineFilter("\t"), [6]),
+    (LineFilter("nothing like it"), []),
+    (LineFilter(), list(range(len(LINES)))),
+])
+def test_plain_text(line_filter, expected):
+    assert search(line_filter) == expected
+
+
+@pytest.mark.parametrize("pattern, expected", [
+    (r"ch\d{2,}", [1, 5]),
+    (r"^(done|configuring)", [0, 7]),
+    (r"run \d+", [4]),
+])
+def test_regex(pattern, expected):
+    assert search(LineFilter(pattern, regex=True)) == expected
+
+
+def test_invalid_regex():
+    with pytest.raises(re.error):
+        LineFilter("ch(", regex=True)
+
+
+def test_stream_and_severity():
+    assert search(LineFilter(stream=STDERR)) == [2, 3]
+    assert search(LineFilter(stream=STDOUT)) == [0, 1, 4, 5, 6, 7]
+    assert search(LineFilter(severity=logview.WARNING)) == [1, 2, 3, 5]
+    assert search(LineFilter(severity=logview.ERROR)) == [2, 3, 5]
+    assert search(LineFilter("ch", stream=STDOUT,
+                             severity=logview.ERROR)) == [5]
+    assert search(LineFilter(r"ch\d", regex=True, stream=STDERR)) == [3]
+
+
+def test_many_blocks():
+    lines = [(f"line {i} {'error' if i % 7 == 0 else 'ok'}",
+              STDERR if i % 2 else STDOUT) for i in range(2000)]
+    expected = [i for i in range(2000) if i % 7 == 0]
+    assert search(LineFilter("error"), lines, block_size=512) == expected
+    assert search(LineFilter(r"error$", regex=True), lines,
+                  block_size=512) == expected
+    assert search(LineFilter("error", stream=STDERR), lines,
+                  block_size=512) == [i for i in expected if i % 2]
+
+
+def test_live_lines_after_scan():
+    spill = make_spill(LINES)
+    log_search = LogSearch(LineFilter("ch"), spill, len(LINES))
+    for line_no, text in enumerate(["ch99 live", "nothing"], len(LINES)):
+        log_search.check(line_no, text, STDOUT,
+                         logview.line_info(text, STDOUT))
+    log_search.scan_done.wait(5)
+    found = log_search.take()
+    log_search.cancel()
+    spill.close()
+    assert [line_no for line_no, _, _ in found] == [1, 3, 5, len(LINES)]
+    assert found[-1] == (len(LINES), "ch99 live", STDOUT)
+    assert log_search.match_count == 4
+    assert log_search.progress == 1.0
+
+
+def test_pending_matches_are_bounded():
+    lines = [(f"line {i}", STDOUT) for i in range(3000)]
+    spill = make_spill(lines)
+    log_search = LogSearch(LineFilter("line"), spill, len(lines),
+                           block_size=256, max_pending=100)
+    taken = []
+    while not log_search.scan_done.is_set() or log_search.found:
+        # the scan waits for the matches to be taken
+        assert len(log_search.found) < 200
+        taken.extend(log_search.take(50))
+    for line_no in range(len(lines), len(lines) + 150):
+        log_search.check(line_no, "line", STDOUT, 0)
+    taken.extend(log_search.take(1000))
+    log_search.cancel()
+    spill.close()
+    assert [line_no for line_no, _, _ in taken] == list(range(3100))
+    assert log_search.dropped == 50
+    assert log_search.match_count == 3150
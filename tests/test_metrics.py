@@ -0,0 +1,28 @@
+import os
+import stat
+
+import pytest
+
+from ntu_daq_gui import metrics
+
+
+def test_write_prometheus(tmp_path):
+    path = str(tmp_path / "textfile" / "hexactrl.prom")
+    registry = metrics.MetricsRegistry()
+    registry.write_prometheus(path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    with open(path) as f:
+        assert f.read() == registry.to_prometheus()
+    assert os.listdir(os.path.dirname(path)) == ["hexactrl.prom"]
+
+
+def test_failed_write_leaves_nothing_behind(tmp_path, monkeypatch):
+    registry = metrics.MetricsRegistry()
+
+    def fail():
+        raise OSError("disk full")
+
+    monkeypatch.setattr(registry, "to_prometheus", fail)
+    with pytest.raises(OSError):
+        registry.write_prometheus(str(tmp_path / "hexactrl.prom"))
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,68 @@
+import gzip
+import os
+import time
+
+from ntu_daq_gui import runlog
+
+
+def write_log(path, count, block_size=1024):
+    writer = runlog.RunLogWriter(path, block_size=block_size)
+    for i in range(count):
+        writer.write("stderr" if i % 10 == 0 else "stdout",
+                     f"line {i} with some text\n", timestamp=1000.0 + i)
+    writer.close()
+    return writer
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "run.log")
+    writer = write_log(path, 5000)
+    assert writer.line_count == 5000
+    reader = runlog.RunLogReader(path)
+    assert len(reader.index) > 1
+    assert reader.line_count() == 5000
+    lines = reader.read_lines(1234, 3)
+    assert lines == [runlog.LogLine(1000.0 + i,
+                                    "stderr" if i % 10 == 0 else "stdout",
+                                    f"line {i} with some text")
+                     for i in range(1234, 1237)]
+    # reading past the end returns what is there
+    assert len(reader.read_lines(4998, 10)) == 2
+    # every block is a gzip member, so the whole log reads with zcat
+    with gzip.open(path, 'rt') as f:
+        assert sum(1 for _ in f) == 5000
+
+
+def test_find_time(tmp_path):
+    path = str(tmp_path / "run.log")
+    write_log(path, 5000)
+    reader = runlog.RunLogReader(path)
+    assert reader.find_time(0) == 0
+    assert reader.find_time(1000.0 + 2500) == 2500
+    assert reader.find_time(1000.0 + 2500.5) == 2501
+    assert reader.find_time(1e10) == 5000
+
+
+def test_slow_output_is_flushed(tmp_path):
+    path = str(tmp_path / "run.log")
+    writer = runlog.RunLogWriter(path, flush_interval=0.2)
+    try:
+        # a line more often than the flush interval, for longer than it
+        deadline = time.monotonic() + 1.0
+        while time.monotonic() < deadline:
+            writer.write("stdout", "slow")
+            time.sleep(0.05)
+        assert os.path.getsize(path + ".idx") > 0
+        assert runlog.RunLogReader(path).line_count() > 0
+    finally:
+        writer.close()
+
+
+def test_unwritable_log_drops_lines(tmp_path):
+    path = str(tmp_path / "missing" / "run.log")
+    writer = runlog.RunLogWriter(path, max_queued_lines=10)
+    for _ in range(100):
+        writer.write("stdout", "line")
+    writer.close()
+    assert writer.error is not None
+    assert writer.dropped_lines == 100
@@ -0,0 +1,86 @@
+import os
+import resource
+import time
+
+from ntu_daq_gui import executor as ex
+from ntu_daq_gui import supervisor as sv
+from ntu_daq_gui.workerpool import WorkerPool
+
+MEMORY_LIMIT = 3 << 30
+REPORT_LIMITS = (
+    "import os, resource\n"
+    "print(os.getpid(), os.getpriority(os.PRIO_PROCESS, 0),\n"
+    "      resource.getrlimit(resource.RLIMIT_AS)[0])\n")
+SLEEP_UNTIL_TERMINATED = (
+    "import signal, sys, time\n"
+    "signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))\n"
+    "print('ready', flush=True)\n"
+    "time.sleep(30)\n")
+
+
+def collect(run):
+    assert run.wait(10) is not None
+    lines = []
+    while not run.is_done():
+        lines.extend(line for _, line in run.get_output())
+    return lines
+
+
+def expected_nice():
+    # without privileges the priority can only be lowered
+    return max(os.getpriority(os.PRIO_PROCESS, 0), 7)
+
+
+def test_launcher_without_limits():
+    assert sv.Supervisor().launcher is None
+
+
+def test_limits_of_a_procedure(tmp_path):
+    supervisor = sv.Supervisor(nice=7, memory_limit=MEMORY_LIMIT)
+    script = tmp_path / "procedure.py"
+    script.write_text(REPORT_LIMITS)
+    run = ex.Executor([str(script)], launcher=supervisor.launcher)
+    pid, nice, limit = collect(run)[0].split()
+    # the wrapper replaced itself with the procedure
+    assert int(pid) == run.pid
+    assert int(nice) == expected_nice()
+    assert int(limit) == MEMORY_LIMIT
+    assert resource.getrlimit(resource.RLIMIT_AS)[0] != MEMORY_LIMIT
+
+
+def test_limits_of_a_pooled_procedure(tmp_path):
+    supervisor = sv.Supervisor(nice=7, memory_limit=MEMORY_LIMIT)
+    pool = WorkerPool(size=1, launcher=supervisor.launcher)
+    pool.start()
+    try:
+        script = tmp_path / "procedure.py"
+        script.write_text(REPORT_LIMITS)
+        run = pool.run([str(script)])
+        pid, nice, limit = collect(run)[0].split()
+        assert int(pid) == run.pid
+        assert int(nice) == expected_nice()
+        assert int(limit) == MEMORY_LIMIT
+    finally:
+        pool.close()
+
+
+def test_pooled_procedure_is_terminated_gracefully(tmp_path):
+    pool = WorkerPool(size=1)
+    pool.start()
+    try:
+        script = tmp_path / "procedure.py"
+        script.write_text(SLEEP_UNTIL_TERMINATED)
+        run = pool.run([str(script)])
+        while not run.get_output():
+            time.sleep(0.01)
+        pid = run.pid
+        sv.Supervisor(grace_period=10).stop(run)
+        # the procedure handled the SIGTERM and exited by itself
+        assert run.returncode == 0
+        # its worker is replaced all the same
+        second = pool.run([str(script)])
+        assert second.pid != pid
+        second.kill()
+        assert second.wait(10) is not None
+    finally:
+        pool.close()
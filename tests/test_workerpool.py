@@ -0,0 +1,90 @@
+import pytest
+
+from ntu_daq_gui.executor import STDOUT, STDERR
+from ntu_daq_gui.workerpool import WorkerPool
+
+
+class LogWriter:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, stream, text, timestamp=None):
+        self.lines.append((stream, text))
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(size=1)
+    pool.start()
+    yield pool
+    pool.close()
+
+
+def run_script(pool, tmp_path, body, *args, log_writer=None):
+    script = tmp_path / "procedure.py"
+    script.write_text(body)
+    run = pool.run([str(script), *args], log_writer=log_writer)
+    assert run.wait(10) is not None
+    output = []
+    while not run.is_done():
+        output.extend(run.get_output())
+    return run, output
+
+
+def test_output_and_exit_code(pool, tmp_path):
+    log_writer = LogWriter()
+    run, output = run_script(
+        pool, tmp_path,
+        "import sys\n"
+        "print('args', *sys.argv[1:])\n"
+        "print('to stderr', file=sys.stderr)\n"
+        "print()\n"
+        "print('after a blank line')\n"
+        "print()\n",
+        "--board", "1", log_writer=log_writer)
+    assert run.returncode == 0
+    stdout = [line for stream, line in output if stream == STDOUT]
+    stderr = [line for stream, line in output if stream == STDERR]
+    assert stdout == ["args --board 1\n", "\n", "after a blank line\n",
+                      "\n"]
+    assert stderr == ["to stderr\n"]
+    assert sorted(log_writer.lines) == sorted(output)
+
+
+def test_line_left_open(pool, tmp_path):
+    run, output = run_script(pool, tmp_path,
+                             "print('no newline', end='')\n")
+    assert run.returncode == 0
+    assert output == [(STDOUT, "no newline\n")]
+
+
+def test_exit_codes(pool, tmp_path):
+    run, _ = run_script(pool, tmp_path, "import sys\nsys.exit(3)\n")
+    assert run.returncode == 3
+    run, output = run_script(pool, tmp_path, "sys.exit('message')\n")
+    assert run.returncode == 1
+    assert any("NameError" in line for _, line in output)
+    run, output = run_script(pool, tmp_path,
+                             "import sys\nsys.exit('message')\n")
+    assert run.returncode == 1
+    assert output == [(STDERR, "message\n")]
+
+
+def test_empty_stdin(pool, tmp_path):
+    run, output = run_script(pool, tmp_path,
+                             "import sys\nprint(repr(sys.stdin.read()))\n")
+    assert run.returncode == 0
+    assert output == [(STDOUT, "''\n")]
+
+
+def test_worker_reuse(pool, tmp_path):
+    body = "import os\nprint(os.getpid())\n"
+    _, output = run_script(pool, tmp_path, body)
+    pid = int(output[0][1])
+    _, output = run_script(pool, tmp_path, body)
+    # a successful run leaves the worker in the pool
+    assert int(output[0][1]) == pid
+    run_script(pool, tmp_path, "raise SystemExit(2)\n")
+    _, output = run_script(pool, tmp_path, body)
+    # a failed run retires it
+    assert int(output[0][1]) != pid
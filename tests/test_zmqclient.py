@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("zmq")
+pytest.importorskip("yaml")
+
+from ntu_daq_gui import zmqclient  # noqa: E402
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "tools"))
+from zmq_standin import StandInServer  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    server = StandInServer(delay=0.05)
+    server.start()
+    client = zmqclient.BoardClient("127.0.0.1", server.port, timeout=2)
+    yield client
+    client.close()
+    server.stop()
+
+
+def test_batch(client):
+    with client.batch() as batch:
+        batch.write({"roc0": {"ch0": 1, "ch1": 2}})
+        batch.write({"roc0": {"ch1": 3}})
+        ch0 = batch.read({"roc0": {"ch0": None}})
+        both = batch.read({"roc0": {"ch0": None, "ch1": None}})
+    assert ch0.result(5) == {"roc0": {"ch0": 1}}
+    assert both.result(5) == {"roc0": {"ch0": 1, "ch1": 3}}
+
+
+def test_reads_after_submit_go_with_the_next_batch(client):
+    client.configure({"a": 1, "b": 2}).result(5)
+    batch = client.batch()
+    first = batch.read({"a": None})
+    batch.submit()
+    # added while the reply to the first read is still outstanding
+    second = batch.read({"b": None})
+    assert first.result(5) == {"a": 1}
+    assert not second.done()
+    batch.submit()
+    assert second.result(5) == {"b": 2}
+
+
+def test_unencodable_payload_fails_only_its_request(client):
+    with pytest.raises(zmqclient.ServerError):
+        client.configure({"a": object()}).result(5)
+    assert client.read({}).result(5) == {}
+    assert client.thread.is_alive()
+
+
+def test_cancelled_read_does_not_block_the_batch(client):
+    client.configure({"a": 1, "b": 2}).result(5)
+    batch = client.batch()
+    first = batch.read({"a": None})
+    second = batch.read({"b": None})
+    third = batch.read({"a": None, "b": None})
+    assert second.cancel()
+    batch.submit()
+    assert first.result(5) == {"a": 1}
+    assert third.result(5) == {"a": 1, "b": 2}
+    assert second.cancelled()
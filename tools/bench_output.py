@@ -0,0 +1,248 @@
+"""
+Throughput and latency benchmark of the procedure output path
+
+Runs synthetic procedures (tools/synthetic_procedure.py) through the
+scheduler and the Executor and measures, per scenario, the end-to-end
+lines/s, the latency from emitting a line to handing it to the log, the
+peak RSS and the worst stall of the event loop.
+
+With `--sink tk` the lines go into a real RunControlUI, which needs a
+display (use Xvfb on a headless box). With the default `--sink null` the
+same pump as in the RunControlUI drives the scheduler, but the lines are
+only counted.
+
+    python tools/bench_output.py --output new.json
+    python tools/bench_output.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from ntu_daq_gui import scheduler as sched  # noqa: E402
+
+SYNTHETIC_PROCEDURE = os.path.join(REPO_DIR, "tools",
+                                   "synthetic_procedure.py")
+
+SCENARIOS = {
+    "steady": {"lines": 20000, "rate": 2000, "line_size": 80,
+               "stderr_fraction": 0.0},
+    "flood": {"lines": 200000, "rate": 0, "line_size": 100,
+              "stderr_fraction": 0.0},
+    "stderr-mix": {"lines": 50000, "rate": 10000, "line_size": 80,
+                   "stderr_fraction": 0.3},
+    "long-lines": {"lines": 5000, "rate": 1000, "line_size": 4096,
+                   "stderr_fraction": 0.0},
+}
+
+# how the metrics of two results are compared: +1 if larger is better
+METRICS = {
+    "lines_per_s": +1,
+    "latency_p95_ms": -1,
+    "worst_stall_ms": -1,
+    "peak_rss_kb": -1,
+}
+
+
+def make_config(scenario, boards, run_dir):
+    options = {
+        "lines": ["--lines", scenario["lines"]],
+        "rate": ["--rate", scenario["rate"]],
+        "line_size": ["--line-size", scenario["line_size"]],
+        "stderr_fraction": ["--stderr-fraction",
+                            scenario["stderr_fraction"]],
+    }
+    return {
+        "procedures": [{"name": "synthetic",
+                        "executed_file": SYNTHETIC_PROCEDURE,
+                        "initial_dut_config": "none",
+                        "options": options}],
+        "hexacontrollers": [{"hostname": f"bench-{i}"}
+                            for i in range(boards)],
+        "scheduler": {"max_parallel_jobs": boards},
+        "run_directory": run_dir,
+    }
+
+
+class Recorder:
+    """
+    Collects the latency of every line and the gaps between event loop ticks
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.latencies = []
+        self.worst_stall = 0.0
+
+    def line(self, text):
+        self.lines += 1
+        try:
+            emitted = float(text.split(" ", 1)[0])
+        except ValueError:
+            return
+        self.latencies.append(time.time() - emitted)
+
+    def tick(self, expected_interval, gap):
+        self.worst_stall = max(self.worst_stall, gap - expected_interval)
+
+
+def run_null_sink(app_state, recorder):
+    from ntu_daq_gui.runcontrol import RunControlUI
+    interval = RunControlUI.poll_interval / 1000
+    scheduler = app_state.scheduler
+    scheduler.submit(app_state.procedures[0], app_state.hexactrls[0])
+    for hexactrl in app_state.hexactrls[1:]:
+        scheduler.submit(app_state.procedures[0], hexactrl)
+    last_tick = time.perf_counter()
+    while not scheduler.idle():
+        for job, kind, data in scheduler.poll(RunControlUI.max_lines_per_poll):
+            if kind not in (sched.STATE, sched.METRIC, sched.RESOURCES):
+                recorder.line(data)
+        now = time.perf_counter()
+        recorder.tick(interval, now - last_tick)
+        time.sleep(max(0.0, interval - (time.perf_counter() - now)))
+        last_tick = now
+
+
+def run_tk_sink(app_state, recorder, heartbeat_ms=10):
+    import tkinter as tk
+    from ntu_daq_gui.runcontrol import RunControlUI
+    root = tk.Tk()
+    run_tab = RunControlUI(root, app_state)
+    run_tab.grid()
+    append = run_tab.log_view.append
+
+    def recording_append(text, tag=None):
+        # the lines of the jobs are prefixed with the name of the board
+        recorder.line(text.split("] ", 1)[-1])
+        append(text, tag)
+
+    run_tab.log_view.append = recording_append
+    run_tab.hexa_selection.selection_set(0, tk.END)
+    run_tab.update_hexacontroller_selection(
+        run_tab.hexa_selection.curselection())
+    last_tick = [time.perf_counter()]
+
+    def heartbeat():
+        now = time.perf_counter()
+        recorder.tick(heartbeat_ms / 1000, now - last_tick[0])
+        last_tick[0] = now
+        if app_state.scheduler.idle() and not run_tab.pumping:
+            root.quit()
+        else:
+            root.after(heartbeat_ms, heartbeat)
+
+    run_tab.run_procedure()
+    root.after(heartbeat_ms, heartbeat)
+    root.mainloop()
+    app_state.health.stop()
+    root.destroy()
+
+
+def run_scenario(name, scenario, sink, boards):
+    from ntu_daq_gui.gui import AppState
+    with tempfile.TemporaryDirectory() as run_dir:
+        app_state = AppState(make_config(scenario, boards, run_dir), None)
+        recorder = Recorder()
+        start = time.perf_counter()
+        if sink == "tk":
+            run_tk_sink(app_state, recorder)
+        else:
+            run_null_sink(app_state, recorder)
+        duration = time.perf_counter() - start
+    latencies = sorted(recorder.latencies) or [0.0]
+
+    def percentile(p):
+        return 1000 * latencies[min(len(latencies) - 1,
+                                    int(p / 100 * len(latencies)))]
+
+    return {
+        "name": name,
+        "sink": sink,
+        "boards": boards,
+        **scenario,
+        "received_lines": recorder.lines,
+        "duration_s": duration,
+        "lines_per_s": recorder.lines / duration,
+        "latency_p50_ms": percentile(50),
+        "latency_p95_ms": percentile(95),
+        "latency_max_ms": 1000 * latencies[-1],
+        "latency_mean_ms": 1000 * statistics.mean(latencies),
+        "worst_stall_ms": 1000 * recorder.worst_stall,
+        # ru_maxrss is the peak over the whole process, so the scenarios
+        # are best compared when run one at a time
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def compare(old_path, new_path, tolerance):
+    """
+    Print the change of every metric and return the number of regressions
+    """
+    with open(old_path) as f:
+        old = {r["name"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {r["name"]: r for r in json.load(f)["results"]}
+    regressions = 0
+    for name in sorted(set(old) & set(new)):
+        for metric, direction in METRICS.items():
+            before, after = old[name][metric], new[name][metric]
+            change = (after - before) / before if before else 0.0
+            regressed = direction * change < -tolerance
+            regressions += regressed
+            print(f"{name:12} {metric:16} {before:12.2f} -> {after:12.2f} "
+                  f"({change:+.1%}){'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[2:]))
+    parser.add_argument("--scenario", action="append",
+                        choices=sorted(SCENARIOS),
+                        help="scenario to run, may be given several times "
+                        "(default: all)")
+    parser.add_argument("--sink", choices=("null", "tk"), default="null")
+    parser.add_argument("--boards", type=int, default=1,
+                        help="number of procedures running in parallel")
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files instead of running")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative change that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.tolerance) else 0)
+    if args.sink == "tk" and not os.environ.get("DISPLAY"):
+        parser.error("the tk sink needs a display, e.g. run it under "
+                     "xvfb-run")
+
+    results = []
+    for name in args.scenario or sorted(SCENARIOS):
+        result = run_scenario(name, SCENARIOS[name], args.sink, args.boards)
+        print(f"{name:12} {result['lines_per_s']:10.0f} lines/s  "
+              f"p95 latency {result['latency_p95_ms']:8.1f} ms  "
+              f"worst stall {result['worst_stall_ms']:8.1f} ms",
+              file=sys.stderr)
+        results.append(result)
+    report = {"python": sys.version.split()[0], "time": time.time(),
+              "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
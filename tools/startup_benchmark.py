@@ -0,0 +1,115 @@
+"""
+Measure the startup time of the hgcal-mac-module-qa GUI
+
+Two numbers are measured in fresh interpreters, so that nothing is cached:
+the time it takes to import the GUI modules and the time from starting the
+interpreter until the first frame of the main window has been drawn. The
+latter needs a display (a virtual one such as Xvfb is fine), without one it
+is skipped. The results are printed as JSON so they can be tracked.
+
+    python tools/startup_benchmark.py --repeat 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import ntu_daq_gui.main
+print(time.perf_counter() - start)
+print(",".join(m for m in ("paramiko", "ping3") if m in sys.modules))
+"""
+
+FIRST_FRAME_SNIPPET = """
+import sys
+from ntu_daq_gui import config, gui
+app_configuration = config.load_config(sys.argv[1])
+ui = gui.GUI(app_configuration, sys.argv[1])
+ui.update()
+print("first frame", flush=True)
+ui.close_window()
+"""
+
+
+def run_snippet(snippet, *args, env=None):
+    return subprocess.run([sys.executable, "-c", snippet, *args],
+                          cwd=REPO_DIR, env=env, check=True,
+                          stdout=subprocess.PIPE, text=True).stdout
+
+
+def measure_import(repeat):
+    durations = []
+    heavy_modules = ""
+    for _ in range(repeat):
+        duration, heavy_modules = run_snippet(IMPORT_SNIPPET).splitlines()
+        durations.append(float(duration))
+    return durations, [m for m in heavy_modules.split(",") if m]
+
+
+def measure_first_frame(repeat, env):
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, "config.json")
+        shutil.copy(os.path.join(REPO_DIR, "ntu_daq_gui",
+                                 "config_template.json"), config_path)
+        env = dict(env, XDG_DATA_HOME=tmp)
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                [sys.executable, "-c", FIRST_FRAME_SNIPPET, config_path],
+                cwd=REPO_DIR, env=env, stdout=subprocess.PIPE, text=True)
+            for line in process.stdout:
+                if line.startswith("first frame"):
+                    durations.append(time.perf_counter() - start)
+            process.wait()
+    return durations
+
+
+def summarize(durations):
+    if not durations:
+        return None
+    return {"min": min(durations),
+            "median": statistics.median(durations),
+            "max": max(durations),
+            "samples": len(durations)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results to this file")
+    args = parser.parse_args()
+
+    import_durations, heavy_modules = measure_import(args.repeat)
+    results = {
+        "python": sys.version.split()[0],
+        "import": summarize(import_durations),
+        # modules that should only be imported when they are first used
+        "eagerly_imported": heavy_modules,
+        "first_frame": None,
+    }
+    if os.environ.get("DISPLAY"):
+        results["first_frame"] = summarize(
+            measure_first_frame(args.repeat, dict(os.environ)))
+    else:
+        print("No display available, skipping the time to first frame",
+              file=sys.stderr)
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Synthetic procedure script for the output benchmarks
+
+Accepts the arguments every procedure gets (-i, -p, -f) and emits lines at
+a configurable rate. Every line starts with the time it was emitted and a
+sequence number, so the receiving end can compute the latency.
+"""
+import argparse
+import random
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-i", dest="hostname")
+    parser.add_argument("-p", dest="port")
+    parser.add_argument("-f", dest="dut_config")
+    parser.add_argument("--lines", type=int, default=10000,
+                        help="number of lines to emit")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="lines per second, 0 for as fast as possible")
+    parser.add_argument("--line-size", type=int, default=80,
+                        help="length of a line in bytes")
+    parser.add_argument("--stderr-fraction", type=float, default=0.0,
+                        help="fraction of the lines written to stderr")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = time.time()
+    for seq in range(args.lines):
+        if args.rate > 0:
+            delay = start + seq / args.rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        prefix = f"{time.time():.6f} {seq} "
+        line = prefix + "x" * max(0, args.line_size - len(prefix))
+        stream = sys.stderr if rng.random() < args.stderr_fraction \
+            else sys.stdout
+        stream.write(line + "\n")
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Stand-in for the slow control and DAQ servers of a Hexacontroller
+
+Answers the requests of ntu_daq_gui.zmqclient the way the zmq servers on
+the boards do, with a plain dictionary as the registers. Every request can
+be delayed to mimic the time the board takes, which makes the effect of
+batching and pipelining visible without a board.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import yaml
+import zmq
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from ntu_daq_gui.zmqclient import merge, select  # noqa: E402
+
+
+class StandInServer:
+    def __init__(self, port: int = 0, delay: float = 0.0):
+        self.delay = delay
+        self.registers = {}
+        self.requests = 0
+        self.context = zmq.Context.instance()
+        self.socket = self.context.socket(zmq.REP)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        if port:
+            self.socket.bind(f"tcp://127.0.0.1:{port}")
+            self.port = port
+        else:
+            self.port = self.socket.bind_to_random_port("tcp://127.0.0.1")
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def handle(self, command: str) -> str:
+        if command in ("initialize", "configure", "read"):
+            self.socket.send_string("ready")
+            payload = yaml.safe_load(self.socket.recv()) or {}
+            if command == "initialize":
+                self.registers = payload
+                return "ROC initialized"
+            if command == "configure":
+                self.registers = merge(self.registers, payload)
+                return "ROC configured"
+            return yaml.safe_dump(select(self.registers, payload))
+        if command == "reset":
+            self.registers = {}
+            return "reset done"
+        if command in ("start", "stop"):
+            return f"{command} done"
+        return f"unknown command {command}"
+
+    def serve(self):
+        while not self.stopped.is_set():
+            if not self.socket.poll(100):
+                continue
+            command = self.socket.recv_string()
+            self.requests += 1
+            if self.delay:
+                time.sleep(self.delay)
+            self.socket.send_string(self.handle(command))
+        self.socket.close()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="seconds every request takes")
+    args = parser.parse_args()
+    server = StandInServer(args.port, args.delay)
+    print(f"Serving on port {server.port}")
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()